@@ -0,0 +1,188 @@
+"""Local stand-ins for the Zoho (OAuth, Leads, COQL) and AiSensy endpoints.
+
+One threaded HTTP server answers every path, with configurable latency and
+error rate per service, and counts the requests it sees per endpoint.
+"""
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ZOHO_MAX_PAGE_RECORDS = 2000  # Past this, Zoho only pages by page_token
+
+
+class FakeState:
+    """Records served by the fake Zoho API and the knobs for both services."""
+
+    def __init__(self, leads=None, zoho_latency=0.0, zoho_error_rate=0.0,
+                 aisensy_latency=0.0, aisensy_error_rate=0.0, aisensy_error_status=500, seed=0):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.zoho_latency = zoho_latency
+        self.zoho_error_rate = zoho_error_rate
+        self.aisensy_latency = aisensy_latency
+        self.aisensy_error_rate = aisensy_error_rate
+        self.aisensy_error_status = aisensy_error_status  # 429 failures carry Retry-After: 1
+        self.set_leads(leads or [])
+        self.counts = {}
+
+    def set_leads(self, leads):
+        self.leads = sorted(leads, key=lambda lead: lead['Modified_Time'])
+        self.leads_by_id = {lead['id']: lead for lead in self.leads}
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts = {}
+
+    def should_fail(self, error_rate):
+        if not error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < error_rate
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    state = None
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real services
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def zoho_delay_or_fail(self):
+        if self.state.zoho_latency:
+            time.sleep(self.state.zoho_latency)
+        if self.state.should_fail(self.state.zoho_error_rate):
+            self.send_json(500, {'code': 'INTERNAL_ERROR'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path != '/crm/v8/Leads':
+            return self.send_json(404, {})
+
+        self.state.count('zoho_leads')
+        if self.zoho_delay_or_fail():
+            return
+
+        if 'ids' in query:
+            leads = [self.state.leads_by_id[i] for i in query['ids'].split(',') if i in self.state.leads_by_id]
+            return self.send_json(200, {'data': leads}) if leads else self.send_json(204)
+
+        leads = self.state.leads
+        modified_since = self.headers.get('If-Modified-Since')
+        if modified_since:
+            since = datetime.fromisoformat(modified_since)
+            leads = [lead for lead in leads if datetime.fromisoformat(lead['Modified_Time']) > since]
+            if not leads:
+                return self.send_json(304)
+
+        per_page = int(query.get('per_page', 200))
+        if 'page_token' in query:
+            offset = int(query['page_token'])
+        else:
+            offset = (int(query.get('page', 1)) - 1) * per_page
+            if offset >= ZOHO_MAX_PAGE_RECORDS:
+                return self.send_json(400, {'code': 'LIMIT_REACHED'})
+        chunk = leads[offset:offset + per_page]
+        more = offset + per_page < len(leads)
+        info = {'per_page': per_page, 'count': len(chunk), 'more_records': more}
+        if more and offset + per_page >= ZOHO_MAX_PAGE_RECORDS:
+            info['next_page_token'] = str(offset + per_page)
+        self.send_json(200, {'data': chunk, 'info': info})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        raw = self.read_body()
+
+        if url.path == '/oauth/v2/token':
+            self.state.count('zoho_oauth')
+            host = self.headers.get('Host')
+            return self.send_json(200, {
+                'access_token': f"fake-{time.time():.0f}",
+                'expires_in': 3600,
+                'api_domain': f"http://{host}",
+                'token_type': 'Bearer',
+            })
+
+        if url.path == '/crm/v8/coql':
+            self.state.count('zoho_coql')
+            if self.zoho_delay_or_fail():
+                return
+            return self.coql(json.loads(raw or b'{}').get('select_query', ''))
+
+        if url.path == '/campaign/t1/api/v2':
+            self.state.count('aisensy')
+            if self.state.aisensy_latency:
+                time.sleep(self.state.aisensy_latency)
+            if self.state.should_fail(self.state.aisensy_error_rate):
+                status = self.state.aisensy_error_status
+                return self.send_json(status, {'status': 'error'}, {'Retry-After': '1'} if status == 429 else None)
+            return self.send_json(200, {'success': 'true'})
+
+        self.send_json(404, {})
+
+    def coql(self, query):
+        """Answers the subset of COQL used for lead fetches (source, Modified_Time, limit/offset)."""
+        leads = self.state.leads
+        sources = re.search(r"Lead_Source\s+in\s*\(([^)]*)\)", query, re.I)
+        source = re.search(r"Lead_Source\s*=\s*'([^']*)'", query)
+        if sources:
+            allowed = {value.strip().strip("'") for value in sources.group(1).split(',')}
+            leads = [lead for lead in leads if lead.get('Lead_Source') in allowed]
+        elif source:
+            leads = [lead for lead in leads if lead.get('Lead_Source') == source.group(1)]
+
+        modified = re.search(r"Modified_Time\s*(>=|>)\s*'([^']*)'", query)
+        if modified:
+            since = datetime.fromisoformat(modified.group(2))
+            inclusive = modified.group(1) == '>='
+            leads = [
+                lead for lead in leads
+                if (datetime.fromisoformat(lead['Modified_Time']) >= since if inclusive
+                    else datetime.fromisoformat(lead['Modified_Time']) > since)
+            ]
+
+        limit = re.search(r"limit\s+(\d+)(?:\s*,\s*(\d+)|\s+offset\s+(\d+))?", query, re.I)
+        if limit and limit.group(2):
+            offset, count = int(limit.group(1)), int(limit.group(2))
+        elif limit:
+            offset, count = int(limit.group(3) or 0), int(limit.group(1))
+        else:
+            offset, count = 0, 200
+
+        chunk = leads[offset:offset + count]
+        if not chunk:
+            return self.send_json(204)
+        self.send_json(200, {'data': chunk, 'info': {'count': len(chunk), 'more_records': offset + count < len(leads)}})
+
+
+def start_fake_server(state, host='127.0.0.1', port=0):
+    """Starts the fake services on a daemon thread. Returns (server, base_url)."""
+    handler = type('BoundFakeHandler', (FakeHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-services', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,207 @@
+"""End-to-end benchmark of LeadAutomation.run_automation against local fake services.
+
+For each size it writes a synthetic leads CSV, drip JSON and last_run.json
+into a temp directory and starts the fake Zoho/AiSensy server in this process.
+It then runs one automation cycle plus a message-status update in a fresh
+child process pointed at that server. It reports wall time, peak RSS and
+per-stage timings and request rates.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,100000
+    python benchmarks/run_benchmarks.py --sizes 1000000 --backend sqlite --output bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+from fake_servers import FakeState, start_fake_server  # noqa: E402
+
+RESULT_FILE = "benchmark_result.json"
+CHILD_LOG_FILE = "benchmark_child.log"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_child(status_updates):
+    """Runs inside the state directory: one automation cycle, then status updates."""
+    sys.path.insert(0, REPO_DIR)
+    result = {'stages': {}}
+
+    start = time.perf_counter()
+    import lead_automation
+    automation = lead_automation.LeadAutomation()
+    result['stages']['startup'] = {'seconds': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    automation.run_automation()
+    result['run_automation_seconds'] = time.perf_counter() - start
+
+    with open(lead_automation.RUN_REPORT_FILE, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    for name, stage in report['stages'].items():
+        result['stages'][name] = {'seconds': stage['seconds']}
+    result['counters'] = report['counters']
+
+    leads = [{'id': synthetic.lead_id(i), 'message_sent': 'Yes'} for i in range(status_updates)]
+    start = time.perf_counter()
+    automation.update_message_status_in_csv(leads)
+    result['stages']['update_message_status_in_csv'] = {'seconds': time.perf_counter() - start}
+
+    if not automation.store:
+        start = time.perf_counter()
+        automation.compact_message_status()
+        result['stages']['compact_message_status'] = {'seconds': time.perf_counter() - start}
+
+    automation.close()
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(RESULT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+
+def attach_request_rates(result, counts):
+    """Adds request counts and req/s to the stages that make HTTP calls."""
+    counters = result.get('counters', {})
+    stage_requests = {
+        'token': counts.get('zoho_oauth', 0),
+        'fetch_zoho_leads': counts.get('zoho_leads', 0) + counts.get('zoho_coql', 0),
+        'send_welcome_messages': counters.get('template1_sent', 0) + counters.get('template1_failed', 0),
+        'process_drip_queue': counters.get('drip_sent', 0) + counters.get('drip_failed', 0),
+    }
+    for name, requests_made in stage_requests.items():
+        stage = result['stages'].get(name)
+        if stage is None:
+            continue
+        stage['requests'] = requests_made
+        stage['requests_per_second'] = round(requests_made / stage['seconds'], 1) if stage['seconds'] else None
+
+
+def run_size(size, args):
+    """Benchmarks one dataset size. Returns its result dict."""
+    state_dir = tempfile.mkdtemp(prefix=f"lead-bench-{size}-")
+    try:
+        drip_entries = int(size * args.drip_ratio)
+        start = time.perf_counter()
+        synthetic.write_state(state_dir, size, drip_entries, min(args.due_drip, drip_entries))
+        setup_seconds = time.perf_counter() - start
+
+        state = FakeState(
+            synthetic.zoho_records(size, args.new_leads, args.modified_leads),
+            zoho_latency=args.zoho_latency, zoho_error_rate=args.zoho_error_rate,
+            aisensy_latency=args.aisensy_latency, aisensy_error_rate=args.aisensy_error_rate,
+            aisensy_error_status=args.aisensy_error_status,
+        )
+        server, base_url = start_fake_server(state)
+
+        env = dict(os.environ)
+        env.update({
+            'ZOHO_CLIENT_ID': 'bench-client',
+            'ZOHO_CLIENT_SECRET': 'bench-secret',
+            'ZOHO_REFRESH_TOKEN': 'bench-refresh',
+            'ZOHO_API_DOMAIN': base_url,
+            'ZOHO_ACCOUNTS_URL': base_url,
+            'AISENSY_API_KEY': 'bench-key',
+            'AISENSY_API_URL': f"{base_url}/campaign/t1/api/v2",
+            'AISENSY_RATE_PER_SECOND': str(args.send_rate),
+            'AISENSY_BURST': str(args.send_rate),
+            'STATE_BACKEND': args.backend,
+            # Compaction is timed as its own stage
+            'MESSAGE_STATUS_COMPACT_THRESHOLD': str(10 ** 9),
+            'PYTHONPATH': REPO_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+        })
+
+        start = time.perf_counter()
+        with open(os.path.join(state_dir, CHILD_LOG_FILE), 'w', encoding='utf-8') as log:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', '--status-updates',
+                 str(min(args.status_updates, size))],
+                cwd=state_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+        wall_seconds = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+
+        if completed.returncode != 0:
+            raise RuntimeError(f"benchmark child failed for size {size}, see {state_dir}/{CHILD_LOG_FILE}")
+
+        with open(os.path.join(state_dir, RESULT_FILE), 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        result.update({
+            'size': size,
+            'backend': args.backend,
+            'setup_seconds': round(setup_seconds, 3),
+            'wall_seconds': round(wall_seconds, 3),
+            'server_requests': dict(state.counts),
+        })
+        attach_request_rates(result, state.counts)
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def print_result(result):
+    print(f"\n📊 {result['size']:,} leads ({result['backend']}): wall {result['wall_seconds']:.2f}s, "
+          f"peak RSS {result['peak_rss_mb']} MB, setup {result['setup_seconds']:.2f}s")
+    print(f"   {'stage':<32}{'seconds':>10}{'requests':>10}{'req/s':>10}")
+    for name, stage in result['stages'].items():
+        requests_made = stage.get('requests', '')
+        rate = stage.get('requests_per_second')
+        print(f"   {name:<32}{stage['seconds']:>10.3f}{requests_made:>10}{'' if rate is None else rate:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_automation against fake Zoho/AiSensy services")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--sizes', default='1000,100000', help="comma-separated existing lead counts (e.g. 1000,100000,1000000)")
+    parser.add_argument('--backend', choices=['files', 'sqlite'], default='files')
+    parser.add_argument('--new-leads', type=int, default=200, help="new leads Zoho returns per run")
+    parser.add_argument('--modified-leads', type=int, default=200, help="already-known leads Zoho returns as modified")
+    parser.add_argument('--drip-ratio', type=float, default=0.2, help="drip entries as a fraction of the lead count")
+    parser.add_argument('--due-drip', type=int, default=200, help="drip entries due this run")
+    parser.add_argument('--status-updates', type=int, default=1000, help="message status updates after the run")
+    parser.add_argument('--zoho-latency', type=float, default=0.02, help="seconds per Zoho API call")
+    parser.add_argument('--zoho-error-rate', type=float, default=0.0)
+    parser.add_argument('--aisensy-latency', type=float, default=0.05, help="seconds per AiSensy call")
+    parser.add_argument('--aisensy-error-rate', type=float, default=0.01)
+    parser.add_argument('--aisensy-error-status', type=int, default=500, help="HTTP status of failed sends (e.g. 429, 503)")
+    parser.add_argument('--send-rate', type=float, default=1000, help="AISENSY_RATE_PER_SECOND for the run")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="keep the temp state directories")
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.status_updates)
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        print(f"⏱️ Benchmarking {size:,} leads...")
+        result = run_size(size, args)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
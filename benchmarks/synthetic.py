@@ -0,0 +1,101 @@
+"""Synthetic lead state: the leads CSV, drip JSON, last_run.json and Zoho records."""
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+LEAD_SOURCES = ["Google Ads 2025", "Form Submission", "Whatsapp Marketing", "Youtube Ads", "Other"]
+CSV_HEADERS = [
+    'id', 'first_name', 'last_name', 'email', 'phone',
+    'lead_source', 'referral_code', 'referral_status', 'record_status',
+    'created_time', 'modified_time', 'fetched_at', 'message_sent'
+]
+# Existing leads were modified before this; new Zoho records after it
+WATERMARK = datetime(2026, 1, 1, tzinfo=IST)
+
+
+def lead_id(i):
+    return str(5_000_000_000_000_000 + i)
+
+
+def phone(i):
+    return f"91{9_000_000_000 + i}"
+
+
+def zoho_lead(i, modified_time):
+    """A Zoho Leads record as returned by /crm/v8/Leads."""
+    return {
+        'id': lead_id(i),
+        'First_Name': f"First{i}",
+        'Last_Name': f"Last{i}",
+        'Email': f"lead{i}@example.com",
+        'Phone': None,
+        'Mobile': str(9_000_000_000 + i),
+        'Lead_Source': LEAD_SOURCES[i % len(LEAD_SOURCES)],
+        'Referral_Code': None,
+        'Referral_Status': None,
+        'Record_Status__s': 'Available',
+        'Created_Time': modified_time.isoformat(),
+        'Modified_Time': modified_time.isoformat(),
+    }
+
+
+def write_leads_csv(path, count):
+    """Writes ``count`` already-processed leads, all modified before WATERMARK."""
+    start = WATERMARK - timedelta(minutes=count + 1)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(CSV_HEADERS)
+        for i in range(count):
+            created = (start + timedelta(minutes=i)).isoformat()
+            writer.writerow([
+                lead_id(i), f"First{i}", f"Last{i}", f"lead{i}@example.com", phone(i),
+                LEAD_SOURCES[i % len(LEAD_SOURCES)], '', '', 'Available',
+                created, created, created, 'Yes',
+            ])
+
+
+def write_drip_json(path, count, due, now=None):
+    """Writes ``count`` drip entries for the first leads; ``due`` of them are due now."""
+    now = now or datetime.now()
+    entries = []
+    for i in range(count):
+        t1_sent_at = now - timedelta(days=2 if i < due else 0, minutes=1)
+        next_send_at = now - timedelta(minutes=1) if i < due else now + timedelta(days=1)
+        entries.append({
+            'phone': phone(i),
+            'lead_id': lead_id(i),
+            'first_name': f"First{i}",
+            'last_name': f"Last{i}",
+            'drip_campaign': 'Erickson_WhatsApp_Drip',
+            't1_sent_at': t1_sent_at.isoformat(),
+            'last_step_sent': 1,
+            'next_step': 2,
+            'next_send_at': next_send_at.isoformat(),
+            'next_campaign': 'Template_2',
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+
+
+def write_last_run(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'last_run': datetime.now().isoformat(), 'zoho_modified_since': WATERMARK.isoformat()}, f)
+
+
+def zoho_records(existing, new, modified_existing):
+    """Zoho records modified after WATERMARK: ``new`` unseen leads plus
+    ``modified_existing`` leads that are already in the CSV."""
+    records = []
+    for n, i in enumerate(range(existing, existing + new)):
+        records.append(zoho_lead(i, WATERMARK + timedelta(seconds=n + 1)))
+    for n in range(min(modified_existing, existing)):
+        records.append(zoho_lead(n, WATERMARK + timedelta(seconds=new + n + 1)))
+    return records
+
+
+def write_state(directory, leads, drip_entries, due_drip):
+    """Writes the CSV, drip JSON and last_run.json into ``directory``."""
+    write_leads_csv(f"{directory}/erickson_leads.csv", leads)
+    write_drip_json(f"{directory}/whatsapp_drip.json", drip_entries, due_drip)
+    write_last_run(f"{directory}/last_run.json")
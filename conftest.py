@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+# Tests never pick up a developer's .env (real credentials and templates)
+os.environ['LOAD_DOTENV'] = 'false'
+
+import lead_automation  # noqa: E402
+
+
+@pytest.fixture
+def make_automation(tmp_path, monkeypatch):
+    """Builds LeadAutomation instances whose state files live in a temporary directory.
+
+    Keyword arguments override lead_automation module settings for the test.
+    """
+    monkeypatch.chdir(tmp_path)
+    created = []
+
+    def make(**settings):
+        for name, value in settings.items():
+            monkeypatch.setattr(lead_automation, name, value)
+        automation = lead_automation.LeadAutomation()
+        created.append(automation)
+        return automation
+
+    yield make
+    for automation in created:
+        automation.close()
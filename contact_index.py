@@ -0,0 +1,93 @@
+import re
+from difflib import SequenceMatcher
+
+NON_DIGITS = re.compile(r'\D')
+PHONE_BLOCK_DIGITS = 10  # A phone without its country prefix
+NEAR_DUPLICATE_NAME_RATIO = 0.85  # Name similarity for two leads in the same phone block to be one contact
+
+
+def phone_key(phone):
+    """Exact phone key: the digits of an already normalized phone."""
+    phone = str(phone or '')
+    digits = phone[1:] if phone.startswith('+') else phone
+    if not digits.isdigit():  # Fast path above covers normalized phones
+        digits = NON_DIGITS.sub('', phone)
+    return digits or None
+
+
+def phone_block_key(phone):
+    """Blocking key for near-duplicates: the phone without its country prefix."""
+    digits = phone_key(phone)
+    return digits[-PHONE_BLOCK_DIGITS:] if digits and len(digits) >= PHONE_BLOCK_DIGITS else None
+
+
+def email_key(email):
+    """Case-insensitive email key."""
+    email = str(email or '').strip().lower()
+    return email if '@' in email else None
+
+
+def name_key(name):
+    """Name with case, spaces and punctuation dropped."""
+    name = ''.join(ch for ch in str(name or '').casefold() if ch.isalnum())
+    return name or None
+
+
+class ContactIndex:
+    """Maps Zoho lead IDs, phones and emails to a canonical contact.
+
+    The canonical contact ID is the lead ID of the first lead seen for that
+    person. Lookups are dictionary hits on each key. With ``near_duplicates``,
+    leads whose phones agree once the country prefix is dropped are also one
+    contact if their first names are similar. Only the few leads sharing that
+    phone block are compared, never the whole index.
+    """
+
+    def __init__(self, near_duplicates=False):
+        self.near_duplicates = near_duplicates
+        self.by_id = {}
+        self.by_phone = {}
+        self.by_email = {}
+        self.blocks = {}  # phone block -> [(name key, contact ID)]
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def match(self, lead_id=None, phone=None, email=None, name=None):
+        """Returns (contact ID, matched key) for a known contact, or None.
+
+        The matched key is 'id', 'phone', 'email' or 'near_phone'.
+        """
+        return self._match(None if lead_id is None else str(lead_id), phone_key(phone), email_key(email), phone, name)
+
+    def _match(self, lead_id, phone_digits, email, phone, name):
+        if lead_id in self.by_id:
+            return self.by_id[lead_id], 'id'
+        if phone_digits in self.by_phone:
+            return self.by_phone[phone_digits], 'phone'
+        if email in self.by_email:
+            return self.by_email[email], 'email'
+        if self.near_duplicates:
+            block, name = phone_block_key(phone_digits), name_key(name)
+            if block and name:
+                for other_name, contact_id in self.blocks.get(block, ()):
+                    if other_name == name or \
+                            SequenceMatcher(None, other_name, name).ratio() >= NEAR_DUPLICATE_NAME_RATIO:
+                        return contact_id, 'near_phone'
+        return None
+
+    def add(self, lead_id, phone=None, email=None, name=None):
+        """Indexes a lead and returns its contact ID (an existing one if any key matches)."""
+        lead_id, phone_digits, email = str(lead_id), phone_key(phone), email_key(email)
+        match = self._match(lead_id, phone_digits, email, phone, name)
+        contact_id = match[0] if match else lead_id
+        self.by_id.setdefault(lead_id, contact_id)
+        if phone_digits:
+            self.by_phone.setdefault(phone_digits, contact_id)
+        if email:
+            self.by_email.setdefault(email, contact_id)
+        if self.near_duplicates:
+            block, name = phone_block_key(phone_digits), name_key(name)
+            if block and name and not (match and match[1] == 'near_phone'):
+                self.blocks.setdefault(block, []).append((name, contact_id))
+        return contact_id
@@ -0,0 +1,272 @@
+import json
+import os
+from datetime import datetime, timedelta
+from urllib.parse import unquote, urlparse
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9: quiet hours use the machine's local time
+    ZoneInfo = None
+
+OFFSET_UNITS = {'days': 86400, 'hours': 3600, 'minutes': 60, 'seconds': 1}
+DAY_MINUTES = 24 * 60
+
+
+def media_filename(media_url):
+    """The file name AiSensy shows for a media URL."""
+    return unquote(os.path.basename(urlparse(media_url).path)) if media_url else ""
+
+
+def parse_offset(offset, time_scale=1.0):
+    """Seconds in an offset such as ``{"days": 1, "hours": 2}`` or a plain number of days."""
+    if isinstance(offset, (int, float)):
+        offset = {'days': offset}
+    unknown = set(offset) - set(OFFSET_UNITS)
+    if unknown:
+        raise ValueError(f"Unknown offset unit(s): {', '.join(sorted(unknown))}")
+    return sum(float(value) * OFFSET_UNITS[unit] for unit, value in offset.items()) * time_scale
+
+
+def parse_clock(value):
+    """Minute of the day for an "HH:MM" string ("24:00" is the end of the day)."""
+    hours, minutes = str(value).split(':')
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute <= DAY_MINUTES:
+        raise ValueError(f"Invalid time of day: {value}")
+    return minute
+
+
+def compile_send_windows(windows):
+    """Sorted (start, end) minutes of the day for ``[["09:00", "13:00"], ...]``; windows may cross midnight."""
+    ranges = []
+    for start, end in windows:
+        start, end = parse_clock(start), parse_clock(end)
+        if start < end:
+            ranges.append((start, end))
+        else:
+            ranges.extend([(start, DAY_MINUTES), (0, end)])
+    ranges = sorted((start, end) for start, end in ranges if start < end)
+    if not ranges:
+        raise ValueError("Send windows leave no time to send")
+    return ranges
+
+
+class DripCampaign:
+    """One compiled drip campaign.
+
+    Steps are numbered from 1 (Template 1) and every per-step value lives in
+    a list indexed by step number: the AiSensy campaign, media URL and
+    pre-parsed file name, the offset from Template 1 in seconds, and the next
+    step (a number, or a dict by Lead Source for branching steps).
+
+    ``send_windows`` (or their complement, ``quiet_hours``) are local clock
+    ranges in which drip steps may go out, and ``tolerance`` is how far past
+    its offset SendSlots may move a step to keep under the hourly cap.
+    """
+
+    def __init__(self, config, time_scale=1.0, default_tolerance=0.0):
+        self.name = config['name']
+        self.lead_sources = list(config.get('lead_sources') or [])
+        steps = config.get('steps') or []
+        if not steps:
+            raise ValueError(f"Drip campaign {self.name} has no steps")
+
+        self.last_step = len(steps)
+        self.templates = [""] * (self.last_step + 1)
+        self.media = [("", "")] * (self.last_step + 1)
+        self.offsets = [None] * (self.last_step + 1)
+        self.next_steps = [None] * (self.last_step + 1)
+        for step, step_config in enumerate(steps, 1):
+            media_url = step_config.get('media_url') or ""
+            self.templates[step] = step_config.get('campaign') or ""
+            self.media[step] = (media_url, media_filename(media_url))
+            self.offsets[step] = parse_offset(step_config.get('offset', 0), time_scale)
+            self.next_steps[step] = self.compile_next(step, step_config.get('next', step + 1))
+
+        send_windows = config.get('send_windows')
+        quiet_hours = config.get('quiet_hours')
+        if not send_windows and quiet_hours:
+            send_windows = [[quiet_hours[1], quiet_hours[0]]]
+        self.send_windows = compile_send_windows(send_windows) if send_windows else None
+        tolerance = config.get('tolerance')
+        self.tolerance = parse_offset(tolerance, time_scale) if tolerance is not None else default_tolerance
+        timezone_name = config.get('timezone')
+        self.timezone = ZoneInfo(timezone_name) if timezone_name and ZoneInfo else None
+
+    def compile_next(self, step, next_step):
+        """Validates a step's ``next``: a step number, null (end) or {lead source: step, "default": step}.
+
+        A next step must come after ``step``, so no campaign can loop and resend
+        a template.
+        """
+        branches = next_step if isinstance(next_step, dict) else {'default': next_step}
+        for target in branches.values():
+            if target is None:
+                continue
+            if isinstance(target, bool) or not isinstance(target, int) or target > self.last_step + 1:
+                raise ValueError(f"Drip campaign {self.name} step {step}: invalid next step {target!r}")
+            if target <= step:
+                raise ValueError(f"Drip campaign {self.name} step {step}: next step {target} does not move forward")
+        # Running off the end of the list finishes the campaign
+        branches = {source: None if target == self.last_step + 1 else target for source, target in branches.items()}
+        return branches if isinstance(next_step, dict) else branches['default']
+
+    def has_step(self, step):
+        return isinstance(step, int) and 1 <= step <= self.last_step
+
+    def template(self, step):
+        """AiSensy campaign name for a step ("" if there is none)."""
+        return self.templates[step] if self.has_step(step) else ""
+
+    def step_media(self, step):
+        """(media URL, file name) for a step."""
+        return self.media[step] if self.has_step(step) else ("", "")
+
+    def next_step(self, step, lead_source=None):
+        """The step after ``step`` for this lead, or None when the campaign is finished."""
+        next_step = self.next_steps[step] if self.has_step(step) else None
+        if isinstance(next_step, dict):
+            return next_step.get(lead_source or '', next_step.get('default'))
+        return next_step
+
+    def send_at(self, t1_sent_at, step):
+        """When a step is due: Template 1's send time plus the step offset, moved out of quiet hours."""
+        if not self.has_step(step):
+            return None
+        return self.shift_into_send_window(t1_sent_at + timedelta(seconds=self.offsets[step]))
+
+    def send_times(self, t1_sent_ats, step):
+        """``send_at`` for a group of entries moving to the same step; the offset is looked up once.
+
+        ``t1_sent_ats`` are datetimes or ISO strings; unparseable ones give None.
+        """
+        if not self.has_step(step):
+            return [None] * len(t1_sent_ats)
+        offset = timedelta(seconds=self.offsets[step])
+        shift = self.shift_into_send_window if self.send_windows else None
+        send_times = []
+        for t1_sent_at in t1_sent_ats:
+            if isinstance(t1_sent_at, str):
+                try:
+                    t1_sent_at = datetime.fromisoformat(t1_sent_at)
+                except ValueError:
+                    t1_sent_at = None
+            if t1_sent_at is None:
+                send_times.append(None)
+                continue
+            send_time = t1_sent_at + offset
+            send_times.append(shift(send_time) if shift else send_time)
+        return send_times
+
+    def shift_into_send_window(self, when):
+        """The first naive local time at or after ``when`` inside a send window."""
+        if self.send_windows is None:
+            return when
+        local = when.astimezone(self.timezone) if self.timezone else when
+        minute = local.hour * 60 + local.minute
+        for start, end in self.send_windows:
+            if minute < end:
+                if minute >= start:
+                    return when
+                resume = local.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+                break
+        else:
+            start = self.send_windows[0][0]
+            resume = (local + timedelta(days=1)).replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+        return resume.astimezone().replace(tzinfo=None) if self.timezone else resume
+
+
+class SendSlots:
+    """Drip sends booked per local hour, used to spread steps under an hourly cap.
+
+    ``counts`` maps an hour (``"YYYY-MM-DDTHH"``, the first 13 characters of a
+    naive ISO time) to the sends already queued in it. A cap of 0 only moves
+    sends into their campaign's send windows.
+    """
+
+    def __init__(self, hourly_cap, counts=None):
+        self.hourly_cap = max(int(hourly_cap), 0)
+        self.counts = counts if counts is not None else {}
+
+    def book(self, campaign, send_time):
+        """Books and returns the slot for a step due at ``send_time``.
+
+        That is the first time inside the campaign's send windows, no earlier
+        than ``send_time`` and no later than its tolerance, in an hour that is
+        under the cap. Sends in one hour are spaced evenly across it. If every
+        hour in the tolerance is full, the least booked one is used. Send
+        windows always win over the tolerance.
+        """
+        slot = campaign.shift_into_send_window(send_time)
+        if not self.hourly_cap:
+            return slot
+
+        latest = send_time + timedelta(seconds=campaign.tolerance)
+        spacing = 3600 / self.hourly_cap
+        fallback = None
+        while True:
+            hour = slot.replace(minute=0, second=0, microsecond=0)
+            key = hour.isoformat()[:13]
+            booked = self.counts.get(key, 0)
+            if booked < self.hourly_cap:
+                spaced = max(slot, hour + timedelta(seconds=booked * spacing))
+                if campaign.shift_into_send_window(spaced) == spaced:
+                    self.counts[key] = booked + 1
+                    return spaced
+            if fallback is None or booked < fallback[0]:
+                fallback = (booked, key, slot)
+            next_slot = campaign.shift_into_send_window(hour + timedelta(hours=1))
+            if next_slot > latest:
+                break
+            slot = next_slot
+
+        booked, key, slot = fallback
+        self.counts[key] = booked + 1
+        return slot
+
+
+class DripEngine:
+    """The compiled drip campaigns, compiled once at startup."""
+
+    def __init__(self, campaigns, default_campaign):
+        self.campaigns = {campaign.name: campaign for campaign in campaigns}
+        if default_campaign not in self.campaigns:
+            raise ValueError(f"Default drip campaign {default_campaign} is not defined")
+        self.default = self.campaigns[default_campaign]
+        self.by_lead_source = {}
+        for campaign in campaigns:
+            for source in campaign.lead_sources:
+                self.by_lead_source.setdefault(source, campaign)
+
+    def get(self, name):
+        """The campaign a drip entry belongs to (the default one for unknown names)."""
+        return self.campaigns.get(name) or self.default
+
+    def for_lead_source(self, lead_source):
+        """The campaign a new lead is enrolled in."""
+        return self.by_lead_source.get(lead_source or '', self.default)
+
+
+def compile_drip_campaigns(config, time_scale=1.0, default_tolerance=0.0):
+    """Compiles a campaigns config (``{"default_campaign": ..., "campaigns": [...]}``)."""
+    campaigns = [
+        DripCampaign(campaign, time_scale, default_tolerance) for campaign in config.get('campaigns') or []
+    ]
+    if not campaigns:
+        raise ValueError("No drip campaigns defined")
+    return DripEngine(campaigns, config.get('default_campaign') or campaigns[0].name)
+
+
+def load_drip_engine(path, default_config, time_scale=1.0, default_tolerance=0.0):
+    """Compiles the campaigns in ``path``, or ``default_config`` when the file does not exist.
+
+    ``default_tolerance`` (seconds) applies to campaigns without a ``tolerance``.
+    """
+    config = default_config
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    try:
+        return compile_drip_campaigns(config, time_scale, default_tolerance)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid drip campaign config {path}: {e}") from e
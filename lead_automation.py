@@ -1,23 +1,117 @@
 import requests
+from requests.adapters import HTTPAdapter
+import argparse
 import csv
+import heapq
+import itertools
 import json
+import math
 import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from urllib.parse import unquote, urlparse
 
-from dotenv import load_dotenv
-import pandas as pd
+from contact_index import ContactIndex, phone_block_key, phone_key
+from drip_engine import SendSlots, load_drip_engine
+from lead_store import LeadStore
+from metrics import Metrics
+from resilience import CircuitBreaker, CircuitOpenError, ResilientClient, backoff_delay, request_may_have_been_sent
+from send_ledger import (
+    ALREADY_SENT, BACKING_OFF, IN_FLIGHT, UNCONFIRMED, FAILED as LEDGER_FAILED, SENT as LEDGER_SENT,
+    UNKNOWN as LEDGER_UNKNOWN, SendLedger
+)
+from state_files import StateFileError, atomic_open, atomic_write_json, file_lock, read_json
+
+
+def load_env_file():
+    """Loads the nearest .env (next to this file or in a parent directory), like ``load_dotenv()``.
+
+    python-dotenv is only imported when there is a file, so cron runs configured
+    through the environment (GitHub Actions secrets) skip it. ``LOAD_DOTENV=false``
+    turns it off (tenant workers, which get their whole environment explicitly).
+    """
+    if os.getenv('LOAD_DOTENV', 'true').strip().lower() == 'false':
+        return
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, '.env')
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
 
-load_dotenv()
+load_env_file()
 
 # --- Configuration ---
 CLIENT_ID = os.getenv('ZOHO_CLIENT_ID')
 CLIENT_SECRET = os.getenv('ZOHO_CLIENT_SECRET')
-TOKEN_URL = "https://accounts.zoho.com/oauth/v2/token"
+ZOHO_ACCOUNTS_URL = os.getenv('ZOHO_ACCOUNTS_URL', 'https://accounts.zoho.com').rstrip('/')
+TOKEN_URL = f"{ZOHO_ACCOUNTS_URL}/oauth/v2/token"
 TOKEN_FILE = "zoho_tokens.json"
 LEADS_CSV_FILE = "erickson_leads.csv"
 LAST_RUN_FILE = "last_run.json"
+ACCESS_TOKEN_DEFAULT_LIFETIME = 3600  # Seconds, when Zoho omits expires_in
+ACCESS_TOKEN_REFRESH_MARGIN = int(os.getenv('ACCESS_TOKEN_REFRESH_MARGIN', '300'))  # Refresh this many seconds early
+
+# State storage: "files" (CSV + JSON) or "sqlite" (single indexed database)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'files').strip().lower()
+LEADS_DB_FILE = "leads.db"
+LEADS_PARQUET = os.getenv('LEADS_PARQUET', 'false').strip().lower() == 'true'  # Also keep a Parquet lead history (needs pyarrow)
+LEADS_PARQUET_DIR = "leads_parquet"
+LEADS_TIMEZONE = os.getenv('LEADS_TIMEZONE', '')  # IANA zone of naive local timestamps (default: the machine's)
+SEND_LEDGER_FILE = "send_ledger.db"  # Idempotency ledger of every WhatsApp send
+SEND_LEDGER_PENDING_TIMEOUT = int(os.getenv('SEND_LEDGER_PENDING_TIMEOUT', '60'))  # Minutes before a stuck claim is retried
+RUN_LOCK_FILE = "lead_automation.lock"  # Advisory lock held for the duration of a run
+MESSAGE_STATUS_LOG_FILE = "message_status.log"  # Append-only status events, folded into the CSV
+MESSAGE_STATUS_COMPACTING_FILE = "message_status.log.compacting"  # Log renamed aside while it is folded in
+MESSAGE_STATUS_COMPACT_THRESHOLD = int(os.getenv('MESSAGE_STATUS_COMPACT_THRESHOLD', '500'))
+LEADS_CSV_STREAMING = os.getenv('LEADS_CSV_STREAMING', 'false').strip().lower() == 'true'  # Scan the CSV instead of indexing it in memory
+LEADS_CSV_CHUNK_ROWS = int(os.getenv('LEADS_CSV_CHUNK_ROWS', '50000'))  # Rows per pandas chunk when scanning the CSV
+RECENT_LEAD_COLUMNS = (  # Columns returned for recent leads; the rest are never parsed
+    'id', 'first_name', 'last_name', 'email', 'phone', 'lead_source', 'created_time', 'message_sent'
+)
+DEDUP_NEAR_DUPLICATES = os.getenv('DEDUP_NEAR_DUPLICATES', 'false').strip().lower() == 'true'  # Also match phones that differ only in country prefix
+RUN_REPORT_FILE = "run_report.json"  # Stage timings, counters and latencies of the last run
+
+# Zoho lead fetch
+TARGET_LEAD_SOURCES = [
+    source.strip()
+    for source in os.getenv('TARGET_LEAD_SOURCES', "Google Ads 2025,Form Submission,Whatsapp Marketing,Youtube Ads").split(',')
+    if source.strip()
+]
+ZOHO_LEAD_FIELDS = "First_Name,Last_Name,Email,Phone,Mobile,Lead_Source,Referral_Code,Referral_Status,Record_Status__s,Created_Time,Modified_Time"
+ZOHO_PAGE_SIZE = 200  # Zoho's maximum per_page
+ZOHO_IDS_PER_REQUEST = 100  # Zoho's maximum ids per GET Records call
+ZOHO_FETCH_MODE = os.getenv('ZOHO_FETCH_MODE', 'coql').strip().lower()  # "coql" (filtered, per source) or "list"
+ZOHO_FETCH_WORKERS = int(os.getenv('ZOHO_FETCH_WORKERS', '4'))  # Concurrent COQL queries
+ZOHO_COQL_PAGE_SIZE = 2000  # Zoho's maximum COQL limit
+ZOHO_COQL_MAX_OFFSET = 100000  # Zoho's maximum COQL offset + limit
+ZOHO_TO_CSV_FIELDS = [
+    ('id', 'id'), ('First_Name', 'first_name'), ('Last_Name', 'last_name'), ('Email', 'email'),
+    ('Lead_Source', 'lead_source'), ('Referral_Code', 'referral_code'),
+    ('Referral_Status', 'referral_status'), ('Record_Status__s', 'record_status'),
+    ('Created_Time', 'created_time'), ('Modified_Time', 'modified_time'),
+]
+PHONE_NON_DIGITS = re.compile(r'\D')
+
+# HTTP Configuration
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))  # Seconds to open a connection
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))  # Seconds to wait for a response
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))  # Retries per request for connection errors, 429 and 5xx
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))  # Seconds; doubles per retry, with full jitter
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '30'))  # Longest single backoff, in seconds
+HTTP_RETRY_AFTER_MAX = float(os.getenv('HTTP_RETRY_AFTER_MAX', '60'))  # Longer Retry-After waits are left to a later run
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))  # Consecutive failures that open a circuit
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '60'))  # How long an open circuit refuses requests
 
 # Logging Configuration
 VERBOSE_LOGGING = os.getenv('VERBOSE_LOGGING', 'false').lower() == 'true'
@@ -25,6 +119,14 @@ MAX_DETAILED_LOGS = int(os.getenv('MAX_DETAILED_LOGS', '5'))  # Max detailed log
 
 # AiSensy Configuration
 AISENSY_API_KEY = os.getenv('AISENSY_API_KEY')
+AISENSY_API_URL = os.getenv('AISENSY_API_URL', "https://backend.aisensy.com/campaign/t1/api/v2")
+AISENSY_RATE_PER_SECOND = float(os.getenv('AISENSY_RATE_PER_SECOND', '5'))  # Sustained messages per second
+AISENSY_BURST = int(os.getenv('AISENSY_BURST', '5'))  # Messages allowed back-to-back before throttling
+AISENSY_MAX_WORKERS = int(os.getenv('AISENSY_MAX_WORKERS', '8'))  # Concurrent in-flight sends
+SEND_RETRY_BASE_MINUTES = float(os.getenv('SEND_RETRY_BASE_MINUTES', '2'))  # Backoff before a failed send is tried again
+SEND_RETRY_MAX_MINUTES = float(os.getenv('SEND_RETRY_MAX_MINUTES', '360'))  # Longest backoff between send attempts
+DRIP_MAX_ATTEMPTS = int(os.getenv('DRIP_MAX_ATTEMPTS', '8'))  # Failed attempts before a drip entry is dropped
+TEMPLATE1_MAX_ATTEMPTS = int(os.getenv('TEMPLATE1_MAX_ATTEMPTS', '8'))  # Failed attempts before a lead is saved as 'Failed'
 
 # WhatsApp drip tracking
 WHATSAPP_DRIP_FILE = "whatsapp_drip.json"
@@ -38,14 +140,229 @@ TEMPLATE_CAMPAIGNS = {
     5: os.getenv("AISENSY_CAMPAIGN_T5") or "Template_5",
 }
 TEMPLATE_MEDIA_URLS = {
-    1: "https://www.erickson.co.in/wp-content/uploads/2026/01/Gemini_Generated_Image_2gc1ir2gc1ir2gc1-1-1.png",
-    2: "https://xmonks.com/Gemini_Generated_Image_cl9aeicl9aeicl9a%20%281%29.png",
-    3: "https://xmonks.com/Gemini_Generated_Image_j1tessj1tessj1te%20%281%29.png",
-    4: "https://www.xmonks.com/Gemini_Generated_Image_f8q9dsf8q9dsf8q9%20%281%29.png",
-    5: "https://xmonks.com/Gemini_Generated_Image_4o47sw4o47sw4o47%20%281%29.png",
+    1: os.getenv("AISENSY_MEDIA_T1") or "https://www.erickson.co.in/wp-content/uploads/2026/01/Gemini_Generated_Image_2gc1ir2gc1ir2gc1-1-1.png",
+    2: os.getenv("AISENSY_MEDIA_T2") or "https://xmonks.com/Gemini_Generated_Image_cl9aeicl9aeicl9a%20%281%29.png",
+    3: os.getenv("AISENSY_MEDIA_T3") or "https://xmonks.com/Gemini_Generated_Image_j1tessj1tessj1te%20%281%29.png",
+    4: os.getenv("AISENSY_MEDIA_T4") or "https://www.xmonks.com/Gemini_Generated_Image_f8q9dsf8q9dsf8q9%20%281%29.png",
+    5: os.getenv("AISENSY_MEDIA_T5") or "https://xmonks.com/Gemini_Generated_Image_4o47sw4o47sw4o47%20%281%29.png",
 }
 DRIP_SCHEDULE_DAYS = {1: 0, 2: 1, 3: 3, 4: 5, 5: 6}
-DRIP_SCHEDULE_MINUTES = {1: 0, 2: 1, 3: 3, 4: 5, 5: 6}
+DRIP_CAMPAIGNS_FILE = os.getenv("DRIP_CAMPAIGNS_FILE", "drip_campaigns.json")  # Campaign definitions; without it the templates above are the only campaign
+DRIP_TIME_SCALE = 1 / 1440 if DRIP_SCHEDULE_UNIT == "minutes" else 1.0  # minutes: a day of offset lasts a minute (testing)
+DRIP_HOURLY_CAP = int(os.getenv("DRIP_HOURLY_CAP", "0"))  # Drip sends booked per hour before steps move to later hours; 0 = no cap
+DRIP_SLOT_TOLERANCE_HOURS = float(os.getenv("DRIP_SLOT_TOLERANCE_HOURS", "12"))  # Furthest a step may move past its offset for the cap
+DEFAULT_DRIP_CAMPAIGNS = {
+    'default_campaign': DRIP_CAMPAIGN_NAME,
+    'campaigns': [{
+        'name': DRIP_CAMPAIGN_NAME,
+        'steps': [
+            {'campaign': TEMPLATE_CAMPAIGNS[step], 'media_url': TEMPLATE_MEDIA_URLS[step],
+             'offset': {'days': DRIP_SCHEDULE_DAYS[step]}}
+            for step in sorted(TEMPLATE_CAMPAIGNS)
+        ],
+    }],
+}
+
+class TokenBucket:
+    """Thread-safe token bucket used to cap the AiSensy send rate."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = max(float(capacity or 1), 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hands out no tokens for ``seconds`` (e.g. a 429 Retry-After), then refills from empty."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated_at = self.paused_until
+
+    def acquire(self):
+        """Block until one token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def send_hour(entry):
+    """The local hour ("YYYY-MM-DDTHH") a drip entry is due in, or None."""
+    return (entry.get('next_retry_at') or entry.get('next_send_at') or '')[:13] or None
+
+
+class DripDueQueue:
+    """Min-heap of drip entries keyed on their cached next_send_ts.
+
+    Also counts the queued entries per phone, so ``has_phone`` is a dict hit,
+    and per send hour (``hours``, see SendSlots).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.phones = {}
+        self.hours = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def has_phone(self, phone):
+        return phone in self.phones
+
+    def push(self, entry):
+        """Adds an entry; entries without a valid send time are never due."""
+        due_ts = entry.get('next_send_ts')
+        heapq.heappush(self.heap, (math.inf if due_ts is None else due_ts, next(self.counter), entry))
+        phone = entry.get('phone')
+        self.phones[phone] = self.phones.get(phone, 0) + 1
+        hour = send_hour(entry)
+        if hour:
+            self.hours[hour] = self.hours.get(hour, 0) + 1
+
+    def pop_due(self, now_ts):
+        """Removes and returns every entry due at or before now_ts."""
+        due = []
+        while self.heap and self.heap[0][0] <= now_ts:
+            entry = heapq.heappop(self.heap)[2]
+            phone = entry.get('phone')
+            self.phones[phone] -= 1
+            if not self.phones[phone]:
+                del self.phones[phone]
+            hour = send_hour(entry)
+            if hour:
+                self.hours[hour] -= 1
+                if not self.hours[hour]:
+                    del self.hours[hour]
+            due.append(entry)
+        return due
+
+    def next_due_ts(self):
+        """Returns the earliest send time in the queue, or None."""
+        if not self.heap or self.heap[0][0] == math.inf:
+            return None
+        return self.heap[0][0]
+
+    def entries(self):
+        """Returns the entries ordered by send time."""
+        return [entry for _, _, entry in sorted(self.heap, key=lambda item: item[:2])]
+
+
+def without_send_ts(entry):
+    """Returns a drip entry without its cached next_send_ts, for saving."""
+    return {key: value for key, value in entry.items() if key != 'next_send_ts'}
+
+
+def file_signature(path):
+    """Returns (mtime_ns, size) for a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_csv_contacts(path):
+    """Yields (id, phone, email, first_name) for every row of the leads CSV."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if 'id' not in header:
+            return
+        columns = [header.index(name) if name in header else None
+                   for name in ('id', 'phone', 'email', 'first_name')]
+        for row in reader:
+            yield tuple(row[col] if col is not None and col < len(row) else None for col in columns)
+
+
+def read_csv_header(path):
+    """Returns a CSV file's column names from a byte read of its first line."""
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+    return next(csv.reader([first_line.decode('utf-8-sig')]), [])
+
+
+class LeadIndex:
+    """In-memory ContactIndex (lead IDs, phones, emails) of the leads CSV.
+
+    Loaded once per process and kept current by ``add_rows`` when we append
+    to the file ourselves; any other change to the file (mtime or size) makes
+    the next lookup reload it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.contacts = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+        self.signature = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Reloads the index if the file changed since it was last read."""
+        with self.lock:
+            signature = file_signature(self.path)
+            if signature == self.signature:
+                return
+            contacts = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+            if signature is not None:
+                for values in read_csv_contacts(self.path):
+                    contacts.add(*values)
+            self.contacts, self.signature = contacts, signature
+
+    def get_ids(self):
+        """Returns the lead IDs, as a dict of lead ID to contact ID (do not mutate)."""
+        self.refresh()
+        return self.contacts.by_id
+
+    def get_contacts(self):
+        """Returns the current ContactIndex (do not mutate)."""
+        self.refresh()
+        return self.contacts
+
+    def add_rows(self, rows):
+        """Records rows we just appended to the file without re-reading it."""
+        rows = [row for row in rows if row.get('id') is not None]
+        self.add_values(
+            [row['id'] for row in rows], [row.get('phone') for row in rows],
+            [row.get('email') for row in rows], [row.get('first_name') for row in rows]
+        )
+
+    def add_values(self, ids, phones, emails, first_names):
+        """Records appended leads (parallel columns) without re-reading the file."""
+        with self.lock:
+            for values in zip(ids, phones, emails, first_names):
+                self.contacts.add(*values)
+            self.signature = file_signature(self.path)
+
+
+_LEAD_INDEXES = {}
+_LEAD_INDEXES_LOCK = threading.Lock()
+
+
+def get_lead_index(path):
+    """Returns the process-wide LeadIndex for a leads CSV path."""
+    key = os.path.abspath(path)
+    with _LEAD_INDEXES_LOCK:
+        if key not in _LEAD_INDEXES:
+            _LEAD_INDEXES[key] = LeadIndex(key)
+        return _LEAD_INDEXES[key]
+
+
+# Process-wide access token cache, shared by every LeadAutomation instance
+_TOKEN_CACHE = {}
+_TOKEN_LOCK = threading.RLock()
+
 
 class LeadAutomation:
     def __init__(self):
@@ -54,20 +371,178 @@ class LeadAutomation:
             'lead_source', 'referral_code', 'referral_status', 'record_status', 
             'created_time', 'modified_time', 'fetched_at', 'message_sent'
         ]
+        self.fetch_watermark = None
+        self.coql_unavailable = False  # Set once Zoho reports the token lacks the COQL scope
+        self.send_rate_limiter = TokenBucket(AISENSY_RATE_PER_SECOND, AISENSY_BURST)
+        self.metrics = Metrics()  # Current run
+        self.metrics_total = Metrics()  # Every run of this process
+        # Long-lived pooled sessions, reused across runs by the local scheduler
+        self.zoho_session = self.create_http_session(pool_size=max(4, ZOHO_FETCH_WORKERS), name='zoho')
+        self.aisensy_session = self.create_http_session(pool_size=AISENSY_MAX_WORKERS, name='aisensy')
+        # Retries and circuit breakers around the sessions; breakers also outlive a run
+        self.zoho_breaker = CircuitBreaker('Zoho', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        self.aisensy_breaker = CircuitBreaker('AiSensy', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        self.zoho_client = self.create_http_client(self.zoho_session, self.zoho_breaker, name='zoho')
+        self.aisensy_client = self.create_http_client(
+            self.aisensy_session, self.aisensy_breaker, name='aisensy', rate_limiter=self.send_rate_limiter
+        )
+        # Drip campaigns compiled once into per-step tables (templates, media, offsets)
+        self.drip_engine = load_drip_engine(
+            DRIP_CAMPAIGNS_FILE, DEFAULT_DRIP_CAMPAIGNS, DRIP_TIME_SCALE,
+            default_tolerance=DRIP_SLOT_TOLERANCE_HOURS * 3600 * DRIP_TIME_SCALE
+        )
+        self.store = self.open_store() if STATE_BACKEND == 'sqlite' else None
+        self.history = self.open_history() if LEADS_PARQUET else None
+        self.token_refresh_timer = None
+        self.token_refresh_lock = threading.Lock()
+        self.token_refresher_closed = False
+        self.send_ledger = SendLedger(SEND_LEDGER_FILE, pending_timeout_minutes=SEND_LEDGER_PENDING_TIMEOUT)
+        self.drip_queue = None
+        self.drip_queue_signature = None
+
+    def open_store(self):
+        """Opens the SQLite state store, importing the CSV/JSON state the first time."""
+        store = LeadStore(LEADS_DB_FILE)
+        leads_imported, drip_imported = store.import_from_files(LEADS_CSV_FILE, WHATSAPP_DRIP_FILE)
+        if leads_imported or drip_imported:
+            print(f"✅ Imported {leads_imported} leads and {drip_imported} drip entries into {LEADS_DB_FILE}")
+        self.schedule_stored_drip_entries(store)
+        return store
+
+    def schedule_stored_drip_entries(self, store):
+        """Gives stored drip rows without a next_send_at a schedule, or removes them.
+
+        Rows imported from the JSON queue (or written by older versions) may have
+        no schedule. Finished entries and entries without a usable t1_sent_at can
+        never come due, so they are removed.
+        """
+        entries = store.get_unscheduled_drip_entries()
+        if not entries:
+            return
+        scheduled, removed = [], []
+        for entry in entries:
+            if self.prepare_drip_entry(entry) and entry.get('next_send_at'):
+                scheduled.append(entry)
+            else:
+                removed.append(entry)
+        store.upsert_drip_entries(scheduled, removed=removed)
+        print(f"🔧 Drip rows without a schedule: {len(scheduled)} scheduled, {len(removed)} removed")
+
+    def open_history(self):
+        """Opens the Parquet lead history, backfilling it from the CSV the first time.
 
-    def get_template_campaign(self, step):
-        """Get the AiSensy campaign name for a drip step."""
-        return TEMPLATE_CAMPAIGNS.get(step, "")
+        Returns None (CSV only) when pyarrow is not installed.
+        """
+        from lead_history import LeadHistory, parquet_available  # pandas and pyarrow, only when enabled
 
-    def get_template_media(self, step):
-        """Get the media URL and filename for a drip step."""
-        media_url = TEMPLATE_MEDIA_URLS.get(step, "")
-        if not media_url:
-            return "", ""
+        if not parquet_available():
+            print("⚠️ LEADS_PARQUET is set but pyarrow is not installed; using the CSV only")
+            return None
+        history = LeadHistory(LEADS_PARQUET_DIR, self.leads_csv_headers, timezone=LEADS_TIMEZONE)
+        if not history.exists():
+            imported = history.import_csv(LEADS_CSV_FILE, chunk_rows=LEADS_CSV_CHUNK_ROWS)
+            if imported:
+                print(f"✅ Imported {imported} leads into {LEADS_PARQUET_DIR}/")
+        return history
+
+    def create_http_session(self, pool_size, name):
+        """Creates a keep-alive requests session with a sized connection pool.
+
+        Every response's latency and status class is recorded in the run metrics
+        as ``<name>_http_seconds`` and ``<name>_http_<N>xx``.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, pool_size))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        def record_response(response, *args, **kwargs):
+            self.metrics.observe(f'{name}_http_seconds', response.elapsed.total_seconds())
+            self.metrics.inc(f'{name}_http_{response.status_code // 100}xx')
+
+        session.hooks['response'].append(record_response)
+        return session
+
+    def create_http_client(self, session, breaker, name, rate_limiter=None):
+        """Wraps a session in a ResilientClient.
+
+        Retries, 429s and refused requests are counted as ``<name>_retry``,
+        ``<name>_throttled`` and ``<name>_circuit_open``. A 429's Retry-After
+        also pauses ``rate_limiter``, so every sender backs off, not just the
+        one that was throttled.
+        """
+        return ResilientClient(
+            session, breaker,
+            max_retries=HTTP_MAX_RETRIES,
+            backoff_base=HTTP_BACKOFF_BASE,
+            backoff_max=HTTP_BACKOFF_MAX,
+            retry_after_max=HTTP_RETRY_AFTER_MAX,
+            rate_limiter=rate_limiter,
+            on_throttle=rate_limiter.pause if rate_limiter is not None else None,
+            on_event=lambda event: self.metrics.inc(f'{name}_{event}'),
+        )
 
-        parsed = urlparse(media_url)
-        filename = unquote(os.path.basename(parsed.path))
-        return media_url, filename
+    @contextmanager
+    def track_run(self, name):
+        """Collects fresh metrics for the enclosed run and writes RUN_REPORT_FILE after it."""
+        self.metrics = Metrics()
+        try:
+            with self.metrics.timer(name):
+                yield
+        finally:
+            self.write_run_report(name)
+
+    def write_run_report(self, name):
+        """Writes the current run's metrics next to last_run.json and adds them to the process totals.
+
+        A full ``automation`` run replaces the top level of RUN_REPORT_FILE.
+        Other runs (daemon drip wakeups, webhook batches) are stored under
+        ``runs`` by name, so they do not overwrite the last full run's report.
+        """
+        run = {'run': name, 'finished_at': datetime.now().isoformat()}
+        run.update(self.metrics.to_dict())
+        self.metrics_total.merge(self.metrics)
+        self.metrics_total.inc(f'runs_{name}')
+        try:
+            try:
+                report = read_json(RUN_REPORT_FILE, default={})
+            except StateFileError:
+                report = {}
+            runs = report.get('runs', {}) if isinstance(report, dict) else {}
+            if name == 'automation' or not isinstance(report, dict):
+                report = run
+            else:
+                runs[name] = run
+            report['runs'] = runs
+            atomic_write_json(RUN_REPORT_FILE, report, indent=2)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not write run report: {e}")
+
+    def close(self):
+        """Closes the pooled HTTP sessions, the send ledger and the state store.
+
+        Stops the token refresher first, waiting for a refresh in progress.
+        """
+        with self.token_refresh_lock:
+            self.token_refresher_closed = True
+            timer, self.token_refresh_timer = self.token_refresh_timer, None
+        if timer is not None:
+            timer.cancel()
+            if timer is not threading.current_thread():
+                timer.join()
+        self.zoho_session.close()
+        self.aisensy_session.close()
+        self.send_ledger.close()
+        if self.store:
+            self.store.close()
+
+    def get_template_campaign(self, step, campaign=None):
+        """Get the AiSensy campaign name for a drip step (of the default drip campaign if none is given)."""
+        return (campaign or self.drip_engine.default).template(step)
+
+    def get_template_media(self, step, campaign=None):
+        """Get the media URL and filename for a drip step (of the default drip campaign if none is given)."""
+        return (campaign or self.drip_engine.default).step_media(step)
 
     def is_message_success(self, response):
         """Determines if a WhatsApp message send was successful."""
@@ -104,6 +579,18 @@ class LeadAutomation:
         if not processed_leads:
             return
 
+        if self.history:
+            self.history.append(processed_leads)
+
+        if self.store:
+            self.store.upsert_leads(processed_leads)
+            print(f"✅ {len(processed_leads)} leads saved to {LEADS_DB_FILE}")
+            return
+
+        lead_index = None if LEADS_CSV_STREAMING else get_lead_index(LEADS_CSV_FILE)
+        if lead_index:
+            lead_index.refresh()  # pick up outside changes before we move the signature
+
         file_exists = os.path.exists(LEADS_CSV_FILE)
         with open(LEADS_CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=self.leads_csv_headers)
@@ -111,167 +598,391 @@ class LeadAutomation:
                 writer.writeheader()
             writer.writerows(processed_leads)
 
+        if lead_index:
+            lead_index.add_rows(processed_leads)
+
         print(f"✅ {len(processed_leads)} leads saved to {LEADS_CSV_FILE}")
 
     def load_drip_entries(self):
         """Load the WhatsApp drip tracking entries from JSON."""
-        if not os.path.exists(WHATSAPP_DRIP_FILE):
-            return []
+        if self.store:
+            return self.store.load_drip_entries()
 
+        # Raises StateFileError rather than returning [] for a corrupted file,
+        # so a bad read can never be saved back over the real queue.
         try:
-            with open(WHATSAPP_DRIP_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-        except Exception as e:
-            print(f"⚠️ Error loading drip file: {e}")
-            return []
+            data = read_json(WHATSAPP_DRIP_FILE, default=[])
+        except StateFileError as e:
+            print(f"❌ Error loading drip file: {e}")
+            raise
+        return data if isinstance(data, list) else []
+
+    def save_drip_entries(self, entries, removed=None):
+        """Save WhatsApp drip tracking entries to JSON.
+
+        With the SQLite backend only the given entries are upserted and
+        ``removed`` entries deleted; the JSON file is always rewritten whole.
+        The cached next_send_ts is left out (prepare_drip_entry re-derives it).
+        """
+        if self.store:
+            self.store.upsert_drip_entries(entries, removed=removed)
+            return
 
-    def save_drip_entries(self, entries):
-        """Save WhatsApp drip tracking entries to JSON."""
         try:
-            with open(WHATSAPP_DRIP_FILE, 'w', encoding='utf-8') as f:
-                json.dump(entries, f, indent=2)
+            atomic_write_json(WHATSAPP_DRIP_FILE, [without_send_ts(entry) for entry in entries],
+                              indent=2, backup=True)
         except Exception as e:
             print(f"❌ Error saving drip file: {e}")
 
-    def calculate_next_send_at(self, t1_sent_at, step):
-        """Calculate next send time based on Template 1 send time."""
+    def calculate_next_send_at(self, t1_sent_at, step, campaign=None):
+        """Calculate next send time based on Template 1 send time and the campaign's step offset."""
         if isinstance(t1_sent_at, str):
             try:
                 t1_sent_at = datetime.fromisoformat(t1_sent_at)
             except Exception:
                 return None
-        schedule_unit = DRIP_SCHEDULE_UNIT or "days"
-
-        if schedule_unit == "minutes":
-            minutes_offset = DRIP_SCHEDULE_MINUTES.get(step)
-            if minutes_offset is None:
-                return None
-            return (t1_sent_at + timedelta(minutes=minutes_offset)).isoformat()
-
-        days_offset = DRIP_SCHEDULE_DAYS.get(step)
-        if days_offset is None:
+        if t1_sent_at is None:
             return None
-        return (t1_sent_at + timedelta(days=days_offset)).isoformat()
+        send_at = (campaign or self.drip_engine.default).send_at(t1_sent_at, step)
+        return send_at.isoformat() if send_at else None
 
     def add_to_drip_queue(self, drip_entries):
-        """Add new entries to the drip queue, avoiding duplicates by phone."""
+        """Add new entries to the drip queue, avoiding duplicates by phone.
+
+        Send slots are only booked for entries that are actually queued.
+        """
         if not drip_entries:
             return
 
-        existing_entries = self.load_drip_entries()
-        existing_by_phone = {entry.get('phone'): entry for entry in existing_entries}
+        if self.store:
+            queued = self.store.get_queued_drip_phones(entry.get('phone') for entry in drip_entries)
+            accepted = []
+            for entry in drip_entries:
+                phone = entry.get('phone')
+                if not phone or phone in queued or not self.prepare_drip_entry(entry):
+                    continue
+                queued.add(phone)
+                accepted.append(entry)
+            self.book_drip_slots(self.get_drip_send_slots(), accepted)
+            added_count = self.store.add_drip_entries(accepted)
+            if added_count:
+                print(f"✅ Added {added_count} numbers to drip queue")
+            return
+
+        # Reuse the in-memory heap (and its phone counts) while it still matches the file on disk
+        signature = file_signature(WHATSAPP_DRIP_FILE)
+        if self.drip_queue is None or signature != self.drip_queue_signature:
+            try:
+                entries = self.load_drip_entries()
+            except StateFileError:
+                print(f"❌ Not queuing {len(drip_entries)} drip entries until {WHATSAPP_DRIP_FILE} is repaired")
+                return
+            self.drip_queue, _ = self.build_drip_queue(entries)
+            self.drip_queue_signature = signature
+        queue = self.drip_queue
+        slots = self.get_drip_send_slots(queue)
 
         added_count = 0
         for entry in drip_entries:
             phone = entry.get('phone')
-            if not phone or phone in existing_by_phone:
+            if not phone or queue.has_phone(phone) or not self.prepare_drip_entry(entry):
                 continue
-            existing_entries.append(entry)
-            existing_by_phone[phone] = entry
+            self.book_drip_slots(slots, [entry])
+            queue.push(entry)
             added_count += 1
 
         if added_count:
-            self.save_drip_entries(existing_entries)
+            self.save_drip_entries(queue.entries())
+            self.drip_queue_signature = file_signature(WHATSAPP_DRIP_FILE)
             print(f"✅ Added {added_count} numbers to drip queue")
 
-    def process_drip_queue(self):
-        """Send due drip templates and update the queue."""
-        entries = self.load_drip_entries()
-        if not entries:
-            return
+    def get_drip_send_slots(self, queue=None):
+        """SendSlots holding the drip sends already queued per hour (``queue`` for the JSON backend)."""
+        if not DRIP_HOURLY_CAP:
+            return SendSlots(0)
+        if self.store:
+            return SendSlots(DRIP_HOURLY_CAP, self.store.count_drip_sends_by_hour(datetime.now().isoformat()[:13]))
+        return SendSlots(DRIP_HOURLY_CAP, dict(queue.hours) if queue is not None else {})
 
-        now = datetime.now()
-        updated_entries = []
-        completed_count = 0
-        sent_count = 0
-        due_count = 0
+    def book_drip_slots(self, slots, entries):
+        """Moves each prepared entry's next_send_at to its booked send slot (see SendSlots.book)."""
+        for entry in entries:
+            try:
+                send_time = datetime.fromisoformat(entry['next_send_at'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            campaign = self.drip_engine.get(entry.get('drip_campaign'))
+            entry['next_send_at'] = slots.book(campaign, send_time).isoformat()
+            self.prepare_drip_entry(entry)  # Re-derives next_send_ts from the booked slot
+
+    def prepare_drip_entry(self, entry):
+        """Fills in next_step/next_send_at and caches next_send_ts (epoch seconds).
+
+        After a failed send the entry is due at its next_retry_at instead.
+        next_send_ts is always re-derived, never trusted from disk (it is not
+        saved, see save_drip_entries), so a hand-edited next_send_at is honored.
+
+        Returns False for entries that are already past their campaign's last step.
+        """
+        campaign = self.drip_engine.get(entry.get('drip_campaign'))
+        next_step = entry.get('next_step')
+        if next_step is None:
+            next_step = campaign.next_step(entry.get('last_step_sent', 1), entry.get('lead_source'))
+            entry['next_step'] = next_step
+
+        if not campaign.has_step(next_step):
+            return False
+
+        if not entry.get('next_send_at'):
+            entry['next_send_at'] = self.calculate_next_send_at(entry.get('t1_sent_at'), next_step, campaign)
+
+        try:
+            entry['next_send_ts'] = datetime.fromisoformat(
+                entry.get('next_retry_at') or entry['next_send_at']
+            ).timestamp()
+        except Exception:
+            entry['next_send_ts'] = None
+        return True
+
+    def schedule_drip_retry(self, entry, response):
+        """Records a failed drip send on the entry and sets its next_retry_at.
+
+        Deferred sends (circuit open, in flight elsewhere, backing off) were
+        not attempted and do not count. Returns False once the entry has
+        failed DRIP_MAX_ATTEMPTS times and should be dropped.
+        """
+        if not response.get('deferred'):
+            entry['attempts'] = entry.get('attempts', 0) + 1
+            if entry['attempts'] >= DRIP_MAX_ATTEMPTS:
+                return False
 
+        retry_at = response.get('retry_at')
+        if retry_at is None:
+            delay_minutes = SEND_RETRY_BASE_MINUTES if response.get('deferred') else \
+                backoff_delay(entry['attempts'], SEND_RETRY_BASE_MINUTES, SEND_RETRY_MAX_MINUTES)
+            retry_at = time.time() + 60 * delay_minutes
+        entry['next_retry_at'] = datetime.fromtimestamp(retry_at).isoformat()
+        entry.pop('next_send_ts', None)
+        self.prepare_drip_entry(entry)
+        return True
+
+    def build_drip_queue(self, entries):
+        """Builds a due-time heap from drip entries. Returns (queue, completed entries)."""
+        queue = DripDueQueue()
+        completed = []
         for entry in entries:
-            next_step = entry.get('next_step')
-            if next_step is None:
-                last_step = entry.get('last_step_sent', 1)
-                next_step = last_step + 1
+            if self.prepare_drip_entry(entry):
+                queue.push(entry)
+            else:
+                completed.append(entry)
+        return queue, completed
 
-            if next_step > 5:
-                completed_count += 1
-                continue
+    def get_drip_queue(self, now):
+        """Returns (queue, completed entries) for this run.
 
-            next_send_at = entry.get('next_send_at')
-            if not next_send_at:
-                next_send_at = self.calculate_next_send_at(entry.get('t1_sent_at'), next_step)
-                entry['next_send_at'] = next_send_at
+        The SQLite backend only loads due rows. The JSON backend keeps the heap
+        in memory between runs of the same process and only rebuilds it when
+        the file changes on disk.
+        """
+        if self.store:
+            return self.build_drip_queue(self.store.get_due_drip_entries(now.isoformat()))
 
+        signature = file_signature(WHATSAPP_DRIP_FILE)
+        if self.drip_queue is None or signature != self.drip_queue_signature:
             try:
-                next_send_dt = datetime.fromisoformat(next_send_at) if next_send_at else None
-            except Exception:
-                next_send_dt = None
+                entries = self.load_drip_entries()
+            except StateFileError:
+                return DripDueQueue(), []
+            self.drip_queue, completed = self.build_drip_queue(entries)
+            self.drip_queue_signature = signature
+            return self.drip_queue, completed
+        return self.drip_queue, []
+
+    def next_drip_due_ts(self):
+        """Returns the epoch time the next drip message is due, or None if none is queued."""
+        if self.store:
+            next_send_at = self.store.get_next_drip_send_at()
+            try:
+                return datetime.fromisoformat(next_send_at).timestamp() if next_send_at else None
+            except ValueError:
+                return None
+        queue, _ = self.get_drip_queue(datetime.now())
+        return queue.next_due_ts()
+
+    def run_drip_queue(self):
+        """Sends due drip messages under the run lock, without polling Zoho."""
+        with file_lock(RUN_LOCK_FILE, blocking=False) as locked:
+            if not locked:
+                print("⏭️ Another automation run holds the state lock, skipping drip processing")
+                return
+            with self.track_run('drip'):
+                self.process_drip_queue()
 
-            if next_send_dt and next_send_dt <= now:
-                due_count += 1
-                campaign_name = self.get_template_campaign(next_step)
-                media_url, media_filename = self.get_template_media(next_step)
-                phone = entry.get('phone')
-                first_name = entry.get('first_name', 'Friend')
-                user_name = f"{first_name} {entry.get('last_name', '')}".strip()
+    def process_drip_queue(self):
+        """Send due drip templates and update the queue.
 
-                if not phone or not campaign_name or not media_url:
-                    updated_entries.append(entry)
-                    continue
+        Only entries popped off the due-time heap are looked at, so the work
+        per run scales with the number of due messages. Due entries are grouped
+        by (campaign, step): each group builds its payload skeleton and its
+        next-step update once, and all groups are sent in one pipelined batch.
+        """
+        now = datetime.now()
+        queue, removed_entries = self.get_drip_queue(now)
+        due = queue.pop_due(now.timestamp())
+        if not due and not removed_entries:
+            return
 
-                response = self.send_aisensy_message(
-                    phone=phone,
-                    user_name=user_name,
-                    campaign_name=campaign_name,
-                    media_url=media_url,
-                    media_filename=media_filename,
-                    template_params=[first_name]
-                )
+        changed_entries = []
+        completed_count = len(removed_entries)
+        sent_count = 0
+        deferred_count = 0
+        abandoned_count = 0
+        unknown_count = 0
+        due_count = len(due)
+
+        # Entries at the same (campaign, step) share a template, media and payload skeleton
+        groups = {}
+        for entry in due:
+            campaign = self.drip_engine.get(entry.get('drip_campaign'))
+            step = entry['next_step']
+            groups.setdefault((campaign.name, step), (campaign, step, []))[2].append(entry)
+
+        payloads = []
+        ledger_keys = []
+        send_groups = []
+        for campaign, step, entries in groups.values():
+            campaign_name = campaign.template(step)
+            media_url, media_filename = campaign.step_media(step)
+            if not campaign_name or not media_url:
+                for entry in entries:
+                    queue.push(entry)
+                continue
 
-                if self.is_message_success(response):
+            skeleton = self.aisensy_payload(campaign_name, media_url, media_filename)
+            group_entries = []
+            for entry in entries:
+                phone = entry.get('phone')
+                if not phone:
+                    queue.push(entry)
+                    continue
+                first_name = entry.get('first_name', 'Friend')
+                payloads.append(dict(
+                    skeleton,
+                    destination=phone,
+                    userName=f"{first_name} {entry.get('last_name', '')}".strip(),
+                    templateParams=[first_name],
+                ))
+                ledger_keys.append((str(entry.get('lead_id') or phone), step, entry.get('drip_campaign') or campaign.name))
+                group_entries.append(entry)
+            if group_entries:
+                send_groups.append((campaign, step, campaign_name, group_entries))
+
+        # Every group goes out in one pipelined dispatch; responses come back in payload order
+        responses = iter(self.send_aisensy_messages(payloads, ledger_keys=ledger_keys))
+        sent_at = now.isoformat()
+        slots = self.get_drip_send_slots(queue)
+
+        for campaign, step, campaign_name, entries in send_groups:
+            advanced = {}  # next step (None: finished) -> entries sent this run
+            for entry in entries:
+                response = next(responses)
+                if response.get('unknown'):
+                    # AiSensy may have sent this step; move on rather than risk sending it twice
+                    unknown_count += 1
+                    if unknown_count <= 3:
+                        print(f"⚠️ Drip step {step} to {entry.get('phone')} has an unknown outcome; "
+                              f"not resending: {response}")
+                elif not self.is_message_success(response):
+                    deferred_count += bool(response.get('deferred'))
+                    if self.schedule_drip_retry(entry, response):
+                        # Same step again once the backoff has passed
+                        queue.push(entry)
+                        changed_entries.append(entry)
+                    else:
+                        abandoned_count += 1
+                        removed_entries.append(entry)
+                        if abandoned_count <= 3:
+                            print(f"❌ Dropping drip entry {entry.get('phone')} after {entry['attempts']} "
+                                  f"failed attempts at step {step}: {response}")
+                    continue
+                else:
                     sent_count += 1
-                    entry['last_step_sent'] = next_step
-                    entry['last_sent_at'] = now.isoformat()
-                    entry['last_campaign'] = campaign_name
 
-                    if next_step >= 5:
+                entry.pop('attempts', None)
+                entry.pop('next_retry_at', None)
+                advanced.setdefault(campaign.next_step(step, entry.get('lead_source')), []).append(entry)
+
+            # One state update per group (per branch): the step, template and offset are shared
+            for next_step, next_entries in advanced.items():
+                update = {'last_step_sent': step, 'last_sent_at': sent_at, 'last_campaign': campaign_name}
+                if next_step is None:
+                    for entry in next_entries:
+                        entry.update(update)
+                    completed_count += len(next_entries)
+                    removed_entries.extend(next_entries)
+                    continue
+
+                update['next_step'] = next_step
+                update['next_campaign'] = campaign.template(next_step)
+                send_times = campaign.send_times([entry.get('t1_sent_at') for entry in next_entries], next_step)
+                for entry, send_time in zip(next_entries, send_times):
+                    entry.update(update)
+                    if send_time is None:
+                        # No usable t1_sent_at to schedule from: the entry could never come due
                         completed_count += 1
+                        removed_entries.append(entry)
                         continue
-
-                    next_step = next_step + 1
-                    entry['next_step'] = next_step
-                    entry['next_send_at'] = self.calculate_next_send_at(entry.get('t1_sent_at'), next_step)
-                    entry['next_campaign'] = self.get_template_campaign(next_step)
-                else:
-                    # Keep entry unchanged to retry on next run
-                    pass
-
-            updated_entries.append(entry)
-
-        if sent_count or completed_count or len(updated_entries) != len(entries):
-            self.save_drip_entries(updated_entries)
+                    send_time = slots.book(campaign, send_time)
+                    entry['next_send_at'] = send_time.isoformat()
+                    entry['next_send_ts'] = send_time.timestamp()
+                    queue.push(entry)
+                    changed_entries.append(entry)
+
+        self.metrics.inc('drip_due', due_count)
+        self.metrics.inc('drip_sent', sent_count)
+        self.metrics.inc('drip_failed', len(payloads) - sent_count - unknown_count)
+        self.metrics.inc('drip_unknown', unknown_count)
+        self.metrics.inc('drip_send_groups', len(send_groups))
+        self.metrics.inc('drip_completed', completed_count)
+        self.metrics.inc('drip_deferred', deferred_count)
+        self.metrics.inc('drip_abandoned', abandoned_count)
+
+        if changed_entries or removed_entries:
+            if self.store:
+                self.save_drip_entries(changed_entries, removed=removed_entries)
+            else:
+                self.save_drip_entries(queue.entries())
+                self.drip_queue_signature = file_signature(WHATSAPP_DRIP_FILE)
             if sent_count:
                 print(f"✅ Drip messages sent: {sent_count}")
-            if due_count and sent_count < due_count:
-                print(f"⚠️ Drip messages failed: {due_count - sent_count}")
+            if due_count and sent_count + unknown_count < due_count:
+                print(f"⚠️ Drip messages failed: {due_count - sent_count - unknown_count} "
+                      f"({deferred_count} deferred, {abandoned_count} dropped, the rest retried with backoff)")
             if completed_count:
                 print(f"✅ Drip entries completed: {completed_count}")
     
     def is_first_run(self):
         """Check if this is the first time running the automation."""
+        if self.store:
+            return self.store.count_leads() == 0
         return not os.path.exists(LEADS_CSV_FILE)
     
-    def save_last_run_time(self):
-        """Save the current time as last run time."""
+    def save_last_run_time(self, zoho_modified_since=None):
+        """Save the current time as last run time, plus the Zoho fetch watermark."""
         try:
             current_time = datetime.now().isoformat()
-            with open(LAST_RUN_FILE, 'w') as f:
-                json.dump({'last_run': current_time}, f, indent=2)
+            data = {'last_run': current_time}
+            zoho_modified_since = zoho_modified_since or self.get_fetch_watermark()
+            if zoho_modified_since:
+                data['zoho_modified_since'] = zoho_modified_since
+            atomic_write_json(LAST_RUN_FILE, data, indent=2)
             print(f"✅ Last run time saved: {current_time}")
         except Exception as e:
             print(f"❌ Error saving last run time: {e}")
-            # Still create the file even if there's an error
+            # Still create the file even if there's an error (never clobber an existing one)
             try:
+                if os.path.exists(LAST_RUN_FILE):
+                    return
                 with open(LAST_RUN_FILE, 'w') as f:
                     f.write('{"last_run": "' + datetime.now().isoformat() + '"}')
                 print("✅ Fallback: Last run file created")
@@ -288,6 +999,16 @@ class LeadAutomation:
             except:
                 pass
         return None
+
+    def get_fetch_watermark(self):
+        """Get the Modified_Time watermark used for incremental Zoho fetches."""
+        if os.path.exists(LAST_RUN_FILE):
+            try:
+                with open(LAST_RUN_FILE, 'r') as f:
+                    return json.load(f).get('zoho_modified_since')
+            except Exception:
+                pass
+        return None
         
     def load_environment_tokens(self):
         """Loads tokens from environment variables (for GitHub Actions)."""
@@ -334,24 +1055,58 @@ class LeadAutomation:
             return {}
 
     def save_tokens(self, token_data):
-        """Saves the relevant tokens to the JSON file with timestamp."""
-        current_time = datetime.now().isoformat()
+        """Saves the relevant tokens to the JSON file with timestamp and expiry."""
+        now = datetime.now()
+        current_time = now.isoformat()
+        expires_in = int(token_data.get('expires_in') or ACCESS_TOKEN_DEFAULT_LIFETIME)
         data_to_save = {
             'access_token': token_data.get('access_token'),
             'access_token_timestamp': current_time,
+            'access_token_expires_at': (now + timedelta(seconds=expires_in)).isoformat(),
             'refresh_token': token_data.get('refresh_token'),
             'api_domain': token_data.get('api_domain')
         }
-        with open(TOKEN_FILE, 'w') as f:
-            json.dump(data_to_save, f, indent=4)
+        atomic_write_json(TOKEN_FILE, data_to_save, indent=4, backup=True)
+        _TOKEN_CACHE.clear()
+        _TOKEN_CACHE.update(data_to_save)
         print(f"✅ Tokens saved to {TOKEN_FILE} at {current_time}")
 
-    def is_access_token_valid(self, stored_tokens):
-        """Check if the stored access token is still valid (within 55 minutes of creation)."""
+    def load_cached_tokens(self):
+        """Returns the last saved access token data, from memory or TOKEN_FILE."""
+        if _TOKEN_CACHE.get('access_token'):
+            return dict(_TOKEN_CACHE)
+        try:
+            cached = read_json(TOKEN_FILE, default={}) or {}
+        except StateFileError:
+            return {}
+        if cached.get('access_token'):
+            _TOKEN_CACHE.update(cached)
+        return cached
+
+    def is_access_token_valid(self, stored_tokens, quiet=False):
+        """Check if the stored access token is still valid.
+
+        Uses the expiry Zoho returned (``expires_in``) less ACCESS_TOKEN_REFRESH_MARGIN;
+        tokens saved before expiries were recorded fall back to the 55 minute rule.
+        """
         access_token = stored_tokens.get('access_token')
         timestamp_str = stored_tokens.get('access_token_timestamp')
+        expires_at_str = stored_tokens.get('access_token_expires_at')
         
-        if not access_token or not timestamp_str:
+        if not access_token or not (timestamp_str or expires_at_str):
+            return False
+
+        if expires_at_str:
+            try:
+                seconds_left = (datetime.fromisoformat(expires_at_str) - datetime.now()).total_seconds()
+            except ValueError:
+                return False
+            if seconds_left > ACCESS_TOKEN_REFRESH_MARGIN:
+                if not quiet:
+                    print(f"✅ Access token is still valid ({int(seconds_left / 60)} minutes left)")
+                return True
+            if not quiet:
+                print("⏰ Access token expired or about to expire")
             return False
         
         try:
@@ -382,7 +1137,7 @@ class LeadAutomation:
             print("❌ Missing ZOHO_CLIENT_ID or ZOHO_CLIENT_SECRET environment variables")
             return None
         
-        token_url = "https://accounts.zoho.com/oauth/v2/token"
+        token_url = TOKEN_URL
         
         data = {
             'refresh_token': refresh_token,
@@ -396,7 +1151,7 @@ class LeadAutomation:
         print(f"   Using refresh_token: {refresh_token[:8]}..." if refresh_token else "   No refresh_token")
         
         try:
-            response = requests.post(token_url, data=data)
+            response = self.zoho_client.post(token_url, data=data, timeout=HTTP_TIMEOUT)
             print(f"   Response status: {response.status_code}")
             
             if response.status_code == 200:
@@ -412,86 +1167,317 @@ class LeadAutomation:
             print(f"❌ Error refreshing token: {str(e)}")
             return None
 
-    def get_valid_token_data(self):
-        """Gets valid token data for Zoho API calls - only refresh if needed."""
-        stored_tokens = self.load_tokens()
-        refresh_token = stored_tokens.get('refresh_token')
-        
-        if not refresh_token:
-            print("❌ No refresh token found. Please check ZOHO_REFRESH_TOKEN secret.")
-            print("💡 Make sure you have set the following GitHub Secrets:")
-            print("   - ZOHO_CLIENT_ID")
-            print("   - ZOHO_CLIENT_SECRET") 
-            print("   - ZOHO_REFRESH_TOKEN")
-            print("   - ZOHO_API_DOMAIN")
-            return None
-        
-        # Always try to refresh the access token for GitHub Actions to ensure it's valid
-        print("🔄 Refreshing access token for reliability...")
-        token_data = self.refresh_access_token(refresh_token)
-        
-        if token_data and 'access_token' in token_data:
-            if 'api_domain' in token_data:
+    def get_valid_token_data(self, force_refresh=False):
+        """Gets valid token data for Zoho API calls - only refresh if needed.
+
+        Reuses the cached access token (in memory, then TOKEN_FILE) until it is
+        within ACCESS_TOKEN_REFRESH_MARGIN of expiry. ``force_refresh`` skips the
+        cache, e.g. after Zoho rejects the token with a 401.
+        """
+        with _TOKEN_LOCK:
+            stored_tokens = self.load_tokens()
+            refresh_token = stored_tokens.get('refresh_token')
+
+            if not refresh_token:
+                print("❌ No refresh token found. Please check ZOHO_REFRESH_TOKEN secret.")
+                print("💡 Make sure you have set the following GitHub Secrets:")
+                print("   - ZOHO_CLIENT_ID")
+                print("   - ZOHO_CLIENT_SECRET") 
+                print("   - ZOHO_REFRESH_TOKEN")
+                print("   - ZOHO_API_DOMAIN")
+                return None
+
+            if not force_refresh:
+                cached = self.load_cached_tokens()
+                # A token minted from a different refresh token (rotated secret) is not reused
+                same_grant = cached.get('refresh_token') in (None, refresh_token)
+                if same_grant and self.is_access_token_valid(cached):
+                    cached['api_domain'] = cached.get('api_domain') or stored_tokens.get('api_domain')
+                    cached['refresh_token'] = refresh_token
+                    return cached
+
+            print("🔄 Refreshing access token...")
+            token_data = self.refresh_access_token(refresh_token)
+
+            if token_data and 'access_token' in token_data:
+                # Zoho does not send the refresh token back; keep the one we used
+                token_data.setdefault('refresh_token', refresh_token)
+                if 'api_domain' not in token_data:
+                    # Use stored api_domain if not in response
+                    token_data['api_domain'] = stored_tokens.get('api_domain')
                 self.save_tokens(token_data)
+                return token_data
             else:
-                # Use stored api_domain if not in response
-                token_data['api_domain'] = stored_tokens.get('api_domain')
-                self.save_tokens(token_data)
-            return token_data
+                print("❌ Failed to obtain valid access token")
+                print("💡 This usually means:")
+                print("   1. ZOHO_REFRESH_TOKEN is invalid or expired")
+                print("   2. ZOHO_CLIENT_ID or ZOHO_CLIENT_SECRET is wrong")
+                print("   3. Your Zoho OAuth app needs to be re-authorized")
+                return None
+
+    def start_token_refresher(self):
+        """Refreshes the access token in the background shortly before it expires.
+
+        For long-running processes; each refresh schedules the next one until
+        ``close()``.
+        """
+        with self.token_refresh_lock:
+            if self.token_refresh_timer is None:
+                self.schedule_token_refresh_locked()
+
+    def schedule_token_refresh_locked(self):
+        """Arms the next background token refresh; the caller holds token_refresh_lock."""
+        if self.token_refresher_closed:
+            return
+
+        def refresh():
+            with self.token_refresh_lock:
+                if self.token_refresher_closed:
+                    return
+            self.get_valid_token_data(force_refresh=True)
+            # The timer stays set while refreshing, so close() waits for it
+            with self.token_refresh_lock:
+                self.schedule_token_refresh_locked()
+
+        cached = self.load_cached_tokens()
+        try:
+            expires_at = datetime.fromisoformat(cached['access_token_expires_at'])
+            delay = (expires_at - datetime.now()).total_seconds() - ACCESS_TOKEN_REFRESH_MARGIN
+        except (KeyError, TypeError, ValueError):
+            delay = 0
+        # Never spin: wait at least a minute between refresh attempts
+        self.token_refresh_timer = threading.Timer(max(delay, 60), refresh)
+        self.token_refresh_timer.daemon = True
+        self.token_refresh_timer.start()
+
+    def fetch_zoho_leads(self, access_token, api_domain, modified_since=None):
+        """Fetches leads from Zoho CRM with phone numbers - filtered by specific Lead Sources.
+
+        Uses the COQL planner (one filtered query per Lead_Source, run
+        concurrently) unless ZOHO_FETCH_MODE=list. Sources whose COQL query
+        failed (e.g. the token lacks the ZohoCRM.coql.READ scope) are fetched
+        by paging the whole module instead, and merged with the others. Once
+        Zoho answers OAUTH_SCOPE_MISMATCH, the rest of this process pages the
+        module directly. The newest ``Modified_Time`` seen is kept on
+        ``self.fetch_watermark`` for the next run.
+        """
+        if ZOHO_FETCH_MODE != 'coql' or self.coql_unavailable:
+            return self.fetch_zoho_leads_list(access_token, api_domain, modified_since)
+
+        leads, failed_sources = self.fetch_zoho_leads_coql(access_token, api_domain, modified_since)
+        if not failed_sources:
+            return leads
+
+        print(f"🔄 Falling back to paging the Leads module for: {', '.join(failed_sources)}")
+        fallback_leads = self.fetch_zoho_leads_list(
+            access_token, api_domain, modified_since, lead_sources=failed_sources
+        )
+        fallback_failed = self.fetch_watermark is None
+        leads_by_id = {str(lead.get('id')): lead for lead in leads + fallback_leads}
+        leads = sorted(leads_by_id.values(), key=lambda lead: lead.get('Modified_Time') or '')
+        if fallback_failed:
+            # Keep the old watermark so the failed sources are fetched again next run
+            print("⚠️ Leads module fetch failed; the watermark is not advanced this run")
         else:
-            print("❌ Failed to obtain valid access token")
-            print("💡 This usually means:")
-            print("   1. ZOHO_REFRESH_TOKEN is invalid or expired")
-            print("   2. ZOHO_CLIENT_ID or ZOHO_CLIENT_SECRET is wrong")
-            print("   3. Your Zoho OAuth app needs to be re-authorized")
+            # Only from leads actually kept: the module pages also cover the COQL sources, filtered out here
+            self.fetch_watermark = self.get_latest_modified_time(leads) or modified_since
+        return leads
+
+    def zoho_error_code(self, response):
+        """Returns the ``code`` of a Zoho error body (e.g. INVALID_TOKEN), or None."""
+        try:
+            body = response.json()
+        except ValueError:
             return None
+        return body.get('code') if isinstance(body, dict) else None
+
+    def refresh_rejected_token(self, rejected_token):
+        """Returns a new access token after Zoho rejected ``rejected_token`` with a 401, or None.
+
+        Concurrent fetches that hit the same 401 share one refresh.
+        """
+        with _TOKEN_LOCK:
+            token_data = self.get_valid_token_data()
+            if token_data and token_data.get('access_token') != rejected_token:
+                return token_data['access_token']
+            print("🔄 Zoho rejected the access token, refreshing...")
+            token_data = self.get_valid_token_data(force_refresh=True)
+            return token_data['access_token'] if token_data else None
+
+    def build_coql_query(self, lead_source, modified_since=None, offset=0, inclusive=False):
+        """Builds the COQL query for one Lead_Source page."""
+        source = lead_source.replace("\\", "\\\\").replace("'", "\\'")
+        criteria = f"Lead_Source = '{source}'"
+        if modified_since:
+            criteria = f"({criteria} and Modified_Time {'>=' if inclusive else '>'} '{modified_since}')"
+        return (
+            f"select id, {ZOHO_LEAD_FIELDS.replace(',', ', ')} from Leads where {criteria} "
+            f"order by Modified_Time asc limit {ZOHO_COQL_PAGE_SIZE} offset {offset}"
+        )
+
+    def fetch_coql_source(self, access_token, api_domain, lead_source, modified_since=None):
+        """Pages through the COQL results for one Lead_Source. Returns (leads, requests).
+
+        Zoho caps the COQL offset, so past ZOHO_COQL_MAX_OFFSET the query
+        restarts from the last Modified_Time seen (duplicates are merged by id).
+        A 401 INVALID_TOKEN refreshes the access token and retries once; a 401
+        OAUTH_SCOPE_MISMATCH marks COQL unavailable and fails the source.
+        """
+        url = f"{api_domain}/crm/v8/coql"
+        headers = {'Authorization': f'Zoho-oauthtoken {access_token}'}
+        leads = []
+        requests_made = 0
+        token_retried = False
+        since, inclusive, offset = modified_since, False, 0
+
+        while True:
+            query = self.build_coql_query(lead_source, since, offset, inclusive)
+            response = self.zoho_client.post(url, headers=headers, json={'select_query': query}, timeout=HTTP_TIMEOUT)
+            requests_made += 1
+            if response.status_code == 401:
+                code = self.zoho_error_code(response)
+                if code == 'OAUTH_SCOPE_MISMATCH':
+                    # A new token has the same scopes; no refresh can fix this
+                    if not self.coql_unavailable:
+                        print("⚠️ The Zoho token lacks the COQL scope; paging the Leads module from now on")
+                    self.coql_unavailable = True
+                elif code == 'INVALID_TOKEN' and not token_retried:
+                    token_retried = True
+                    access_token = self.refresh_rejected_token(access_token)
+                    if access_token:
+                        headers['Authorization'] = f'Zoho-oauthtoken {access_token}'
+                        continue
+            if response.status_code == 204:
+                break
+            response.raise_for_status()
 
-    def fetch_zoho_leads(self, access_token, api_domain):
-        """Fetches leads from Zoho CRM with phone numbers - filtered by specific Lead Sources."""
-        target_sources = ["Google Ads 2025", "Form Submission", "Whatsapp Marketing","Youtube Ads"]
+            body = response.json()
+            page = body.get('data', [])
+            leads.extend(page)
+            if not body.get('info', {}).get('more_records') or not page:
+                break
+
+            offset += ZOHO_COQL_PAGE_SIZE
+            if offset + ZOHO_COQL_PAGE_SIZE > ZOHO_COQL_MAX_OFFSET:
+                last_modified = page[-1].get('Modified_Time')
+                if not last_modified or (inclusive and last_modified == since):
+                    print(f"⚠️ COQL offset limit reached for '{lead_source}'; the rest is left for the next run")
+                    break
+                since, inclusive, offset = last_modified, True, 0
+        return leads, requests_made
+
+    def fetch_zoho_leads_coql(self, access_token, api_domain, modified_since=None):
+        """Fetches only target-source leads with concurrent COQL queries, one per Lead_Source.
+
+        Returns (leads, failed sources): the leads of the sources that
+        succeeded, de-duplicated by id, and the sources whose query failed.
+        """
+        target_sources = TARGET_LEAD_SOURCES
+        print(f"📞 Fetching leads from Zoho CRM via COQL (Lead Sources: {', '.join(target_sources)})...")
+        if modified_since:
+            print(f"🔍 Incremental fetch: records modified since {modified_since}")
+        self.fetch_watermark = None
+
+        def fetch_source(source):
+            try:
+                return self.fetch_coql_source(access_token, api_domain, source, modified_since)
+            except requests.exceptions.RequestException as e:
+                print(f"❌ COQL fetch failed for '{source}': {e}")
+                if getattr(e, 'response', None) is not None:
+                    print(f"❌ Response: {e.response.text[:500]}")
+                return None
+
+        workers = max(1, min(ZOHO_FETCH_WORKERS, len(target_sources)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fetch_source, target_sources))
+        failed_sources = [source for source, result in zip(target_sources, results) if result is None]
+        results = [result for result in results if result is not None]
+
+        leads_by_id = {}
+        for source_leads, _ in results:
+            for lead in source_leads:
+                leads_by_id[str(lead.get('id'))] = lead
+        leads = sorted(leads_by_id.values(), key=lambda lead: lead.get('Modified_Time') or '')
+
+        requests_made = sum(count for _, count in results)
+        print(f"📄 Fetched {len(leads)} leads with {requests_made} COQL request(s) across {len(results)} sources")
+        self.fetch_watermark = self.get_latest_modified_time(leads) or modified_since
+        fetched_sources = [source for source in target_sources if source not in failed_sources]
+        print(f"✅ Final result: {len(leads)} leads with Lead_Source in {fetched_sources}")
+        return leads, failed_sources
+
+    def fetch_zoho_leads_list(self, access_token, api_domain, modified_since=None, lead_sources=None):
+        """Fetches leads by paging the whole Leads module, then filters by Lead Source.
+
+        ``lead_sources`` narrows the filter (default: TARGET_LEAD_SOURCES).
+
+        Pages using ``page``/``page_token`` and, when ``modified_since`` is
+        given, only asks Zoho for records modified after that watermark
+        (``If-Modified-Since``). The newest ``Modified_Time`` seen is kept on
+        ``self.fetch_watermark`` for the next run.
+        """
+        target_sources = lead_sources or TARGET_LEAD_SOURCES
         print(f"📞 Fetching leads from Zoho CRM (Lead Sources: {', '.join(target_sources)})...")
+        self.fetch_watermark = None
 
         headers = {
             'Authorization': f'Zoho-oauthtoken {access_token}'
         }
-        
-        # Include phone field and other important fields + Lead_Source
-        fields = "First_Name,Last_Name,Email,Phone,Mobile,Lead_Source,Referral_Code,Referral_Status,Record_Status__s,Created_Time,Modified_Time"
-        
-        # Try different formats for Zoho criteria
-        # Method 1: Simple format without URL encoding
-        url = f"{api_domain}/crm/v8/Leads?fields={fields}&criteria=Lead_Source:equals:Google Ads 2025 Landing Page&per_page=200"
+        if modified_since:
+            headers['If-Modified-Since'] = modified_since
+            print(f"🔍 Incremental fetch: records modified since {modified_since}")
+        else:
+            print("🔍 Full fetch: no watermark found, reading the whole Leads module")
+
+        url = f"{api_domain}/crm/v8/Leads"
+        params = {
+            'fields': ZOHO_LEAD_FIELDS,
+            'per_page': ZOHO_PAGE_SIZE,
+            'sort_by': 'Modified_Time',
+            'sort_order': 'asc',
+            'page': 1,
+        }
 
+        leads = []
+        pages = 0
+        token_retried = False
         try:
-            print(f"🔍 API URL: {url}")
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            leads_data = response.json()
-            leads = leads_data.get('data', [])
-            
-            # If no leads found with simple criteria, try alternative format
-            if not leads:
-                print("🔄 Trying alternative criteria format...")
-                # Method 2: Try fetching all and filter manually
-                url2 = f"{api_domain}/crm/v8/Leads?fields={fields}&per_page=200"
-                response2 = requests.get(url2, headers=headers)
-                response2.raise_for_status()
-                leads_data2 = response2.json()
-                leads = leads_data2.get('data', [])
-            
-            # If still no leads, try search API
-            if not leads:
-                print("🔄 Trying COQL search API...")
-                search_url = f"{api_domain}/crm/v8/coql"
-                coql_query = {
-                    "select_query": f"select {fields} from Leads where Lead_Source in ('Google Ads 2025 Landing Page', 'Form Submission', 'Whatsapp Marketing','Youtube Ads') limit 200"
-                }
-                search_response = requests.post(search_url, headers=headers, json=coql_query)
-                if search_response.status_code == 200:
-                    search_data = search_response.json()
-                    leads = search_data.get('data', [])
-            
+            while True:
+                response = self.zoho_client.get(url, headers=headers, params=params, timeout=HTTP_TIMEOUT)
+
+                if response.status_code == 401 and not token_retried \
+                        and self.zoho_error_code(response) == 'INVALID_TOKEN':
+                    # Cached token was revoked or expired early; refresh once and retry
+                    token_retried = True
+                    access_token = self.refresh_rejected_token(access_token)
+                    if access_token:
+                        headers['Authorization'] = f"Zoho-oauthtoken {access_token}"
+                        continue
+
+                # 304 = nothing modified since the watermark, 204 = empty module
+                if response.status_code in (204, 304):
+                    break
+                response.raise_for_status()
+
+                leads_data = response.json()
+                leads.extend(leads_data.get('data', []))
+                pages += 1
+
+                info = leads_data.get('info', {})
+                if not info.get('more_records'):
+                    break
+
+                # Zoho only serves the first 2000 records by page number,
+                # anything past that has to be walked with the page token.
+                next_page_token = info.get('next_page_token')
+                if next_page_token:
+                    params.pop('page', None)
+                    params['page_token'] = next_page_token
+                else:
+                    params['page'] = params.get('page', 1) + 1
+
+            print(f"📄 Fetched {len(leads)} leads across {pages} page(s)")
+
             # Debug: Print lead sources if any found
             if leads:
                 print("🔍 Sample lead sources from response:")
@@ -499,8 +1485,10 @@ class LeadAutomation:
                     lead_source = lead.get('Lead_Source', 'No Lead_Source')
                     first_name = lead.get('First_Name', 'No Name')
                     print(f"  Lead {i+1}: {first_name} - Lead_Source = '{lead_source}'")
-            
-            # Apply manual filter to ensure only target leads (since API filtering seems inconsistent)
+
+            self.fetch_watermark = self.get_latest_modified_time(leads) or modified_since
+
+            # Apply manual filter to ensure only target leads
             if leads:
                 target_leads = []
                 for lead in leads:
@@ -509,10 +1497,10 @@ class LeadAutomation:
                         lead_source = ''
                     if lead_source in target_sources:
                         target_leads.append(lead)
-                
+
                 print(f"🔍 Manual filtering: {len(target_leads)} target leads out of {len(leads)} fetched")
                 leads = target_leads
-            
+
             print(f"✅ Final result: {len(leads)} leads with Lead_Source in {target_sources}")
             return leads
 
@@ -522,13 +1510,135 @@ class LeadAutomation:
                 print(f"❌ Response: {e.response.text}")
             return []
 
+    def fetch_zoho_leads_by_ids(self, access_token, api_domain, lead_ids):
+        """Fetches specific leads by ID (e.g. the IDs in a Zoho notification)."""
+        headers = {
+            'Authorization': f'Zoho-oauthtoken {access_token}'
+        }
+        url = f"{api_domain}/crm/v8/Leads"
+        lead_ids = [str(lead_id) for lead_id in dict.fromkeys(lead_ids) if lead_id]
+        leads = []
+        try:
+            for start in range(0, len(lead_ids), ZOHO_IDS_PER_REQUEST):
+                params = {
+                    'ids': ','.join(lead_ids[start:start + ZOHO_IDS_PER_REQUEST]),
+                    'fields': ZOHO_LEAD_FIELDS,
+                }
+                response = self.zoho_client.get(url, headers=headers, params=params, timeout=HTTP_TIMEOUT)
+                if response.status_code == 204:
+                    continue
+                response.raise_for_status()
+                leads.extend(response.json().get('data', []))
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Error fetching leads by ID from Zoho: {e}")
+        return leads
+
+    def extract_webhook_lead_ids(self, payload):
+        """Returns the lead IDs in a Zoho webhook or notification payload.
+
+        Notifications API callbacks carry ``ids``; workflow webhooks carry lead
+        fields (one lead, or a ``data`` list), of which only ``id`` is used.
+        Nothing else in a payload is trusted: the leads are fetched from Zoho.
+        """
+        if isinstance(payload, list):
+            ids = []
+            for item in payload:
+                ids.extend(self.extract_webhook_lead_ids(item))
+            return ids
+
+        if not isinstance(payload, dict):
+            return []
+        if payload.get('module') not in (None, 'Leads'):
+            return []
+        if payload.get('operation') == 'delete':
+            return []
+
+        if isinstance(payload.get('data'), list):
+            ids = [lead.get('id') for lead in payload['data'] if isinstance(lead, dict)]
+        elif payload.get('ids'):
+            ids = payload['ids'] if isinstance(payload['ids'], list) else str(payload['ids']).split(',')
+        else:
+            ids = [payload.get('id')]
+        # Zoho record IDs are numeric
+        return [str(lead_id).strip() for lead_id in ids if str(lead_id or '').strip().isdigit()]
+
+    def process_incoming_leads(self, leads):
+        """Runs pushed leads through the Template 1 pipeline without a Zoho poll.
+
+        Used by the webhook receiver, with leads it fetched from Zoho by ID. Takes the run lock (waiting for it), and
+        leaves the fetch watermark alone so the polling sweep still reconciles
+        anything a webhook missed. Returns the leads whose send failed.
+        """
+        target_leads = [lead for lead in leads if (lead.get('Lead_Source') or '') in TARGET_LEAD_SOURCES]
+        print(f"📨 Webhook: {len(target_leads)} target leads out of {len(leads)} received")
+        if not target_leads:
+            return []
+
+        with file_lock(RUN_LOCK_FILE), self.track_run('webhook'):
+            if self.is_first_run():
+                # No baseline yet: let the first polling run save everything
+                print("⏭️ First run has not happened yet, leaving webhook leads to the polling sweep")
+                return []
+            with self.metrics.timer('find_new_leads'):
+                new_leads = self.find_new_leads(target_leads)
+            if not new_leads:
+                return []
+            with self.metrics.timer('send_welcome_messages'):
+                return self.send_welcome_messages_to_new_leads(new_leads)
+
+    def parse_zoho_time(self, value):
+        """Parses a Zoho ISO-8601 timestamp, returning None if it is invalid."""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    def get_latest_modified_time(self, leads):
+        """Returns the newest Modified_Time among leads as an ISO string."""
+        latest = None
+        for lead in leads:
+            modified = self.parse_zoho_time(lead.get('Modified_Time'))
+            if modified and (latest is None or modified > latest):
+                latest = modified
+        return latest.isoformat() if latest else None
+
+    def get_next_watermark(self, failed_leads=None):
+        """Works out the watermark to persist after a run.
+
+        Leads whose Template 1 send failed are not saved to the CSV and must be
+        fetched again, so the watermark is held just before the oldest of them.
+        """
+        watermark = self.fetch_watermark
+        if not failed_leads:
+            return watermark
+
+        oldest_failed = None
+        for lead in failed_leads:
+            modified = self.parse_zoho_time(lead.get('Modified_Time'))
+            if modified and (oldest_failed is None or modified < oldest_failed):
+                oldest_failed = modified
+
+        if oldest_failed is None:
+            return watermark
+        held = oldest_failed - timedelta(seconds=1)
+        current = self.parse_zoho_time(watermark)
+        if current is None or held < current:
+            return held.isoformat()
+        return watermark
+
     def normalize_phone_number(self, phone):
-        """Normalizes phone number to international format."""
-        if not phone:
+        """Normalizes phone number to international format.
+
+        Anything but a non-empty string (None, or NaN from a DataFrame column
+        for a record without the field) is a missing phone.
+        """
+        if not isinstance(phone, str) or not phone:
             return None
             
         # Remove all non-digit characters
-        phone = ''.join(filter(str.isdigit, phone))
+        phone = PHONE_NON_DIGITS.sub('', phone)
         
         # Add +91 for Indian numbers if not present
         if len(phone) == 10:
@@ -549,66 +1659,240 @@ class LeadAutomation:
             
         return phone
 
-    def save_leads_to_csv(self, leads, message_sent_value='No'):
-        """Saves leads to CSV file with timestamp - ONLY test leads."""
-        current_time = datetime.now().isoformat()
-        processed_leads = []
-        target_sources = ["Google Ads 2025 Landing Page", "Form Submission", "Whatsapp Marketing","Youtube Ads"]
+    def normalize_phone_numbers(self, phones):
+        """Batch ``normalize_phone_number`` over a pandas Series of raw phones."""
+        # One pass of the compiled regex per value; pandas' object-dtype .str
+        # methods loop in Python too and measured slower for this.
+        import pandas as pd
 
-        for lead in leads:
-            # FILTER: Only save leads with target Lead Sources
-            lead_source = lead.get('Lead_Source', '')
-            if lead_source is None:
-                lead_source = ''
+        return pd.Series(
+            [self.normalize_phone_number(phone) for phone in phones.to_numpy(dtype=object)],
+            index=phones.index,
+            dtype=object
+        )
 
-            if lead_source not in target_sources:
-                print(f"⚠️ Skipping lead {lead.get('First_Name', 'Unknown')} - Lead_Source is '{lead.get('Lead_Source', 'None')}', not in target sources")
-                continue
+    def build_processed_leads_frame(self, leads, fetched_at, message_sent_value, target_sources=None):
+        """Builds CSV-ready lead rows for a whole batch of Zoho records at once.
+
+        Same rows as ``build_processed_lead``: the Lead_Source filter is a set
+        lookup, columns are built in one DataFrame construction and phones are
+        normalized over the whole column.
+        """
+        import pandas as pd
+
+        if target_sources is not None:
+            target_sources = set(target_sources)
+            leads = [lead for lead in leads if (lead.get('Lead_Source') or '') in target_sources]
+
+        columns = [zoho_field for zoho_field, _ in ZOHO_TO_CSV_FIELDS] + ['Mobile', 'Phone']
+        df = pd.DataFrame.from_records(leads, columns=columns)
+
+        raw_phones = df['Mobile'].where(df['Mobile'].fillna('').astype(bool), df['Phone'])
+        frame = df[[zoho_field for zoho_field, _ in ZOHO_TO_CSV_FIELDS]].fillna('')
+        frame.columns = [csv_column for _, csv_column in ZOHO_TO_CSV_FIELDS]
+        frame['phone'] = self.normalize_phone_numbers(raw_phones)
+        frame['fetched_at'] = fetched_at
+        frame['message_sent'] = message_sent_value
+        return frame[self.leads_csv_headers]
+
+    def append_processed_frame(self, frame):
+        """Append a DataFrame of processed leads in one write."""
+        if frame.empty:
+            return
 
-            processed_leads.append(
-                self.build_processed_lead(
-                    lead,
-                    fetched_at=current_time,
-                    message_sent_value=message_sent_value
-                )
+        if self.history:
+            self.history.append(frame)
+
+        if self.store:
+            self.store.upsert_lead_values(
+                frame[self.leads_csv_headers].fillna('').astype(str).itertuples(index=False, name=None)
             )
+            print(f"✅ {len(frame)} leads saved to {LEADS_DB_FILE}")
+            return
 
-        self.append_processed_leads(processed_leads)
-        return processed_leads
+        lead_index = None if LEADS_CSV_STREAMING else get_lead_index(LEADS_CSV_FILE)
+        if lead_index:
+            lead_index.refresh()
+
+        file_exists = os.path.exists(LEADS_CSV_FILE)
+        with open(LEADS_CSV_FILE, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            if not file_exists:
+                writer.writerow(self.leads_csv_headers)
+            writer.writerows(frame[self.leads_csv_headers].itertuples(index=False, name=None))
+
+        if lead_index:
+            lead_index.add_values(frame['id'].astype(str), frame['phone'], frame['email'], frame['first_name'])
+        print(f"✅ {len(frame)} leads saved to {LEADS_CSV_FILE}")
+
+    def save_leads_to_csv(self, leads, message_sent_value='No'):
+        """Saves leads to CSV file with timestamp - ONLY test leads.
+
+        Returns the saved rows as a DataFrame.
+        """
+        current_time = datetime.now().isoformat()
+        target_sources = TARGET_LEAD_SOURCES
+
+        # FILTER: Only save leads with target Lead Sources
+        frame = self.build_processed_leads_frame(
+            leads,
+            fetched_at=current_time,
+            message_sent_value=message_sent_value,
+            target_sources=target_sources
+        )
+        skipped = len(leads) - len(frame)
+        if skipped:
+            print(f"⚠️ Skipping {skipped} leads - Lead_Source not in target sources")
+
+        self.append_processed_frame(frame)
+        return frame
 
     def get_existing_lead_ids(self):
         """Get list of existing lead IDs from CSV to compare."""
+        if self.store:
+            return self.store.get_lead_ids()
+
         if not os.path.exists(LEADS_CSV_FILE):
             return set()
         
         try:
-            df = pd.read_csv(LEADS_CSV_FILE)
-            return set(df['id'].astype(str).tolist())
+            return get_lead_index(LEADS_CSV_FILE).get_ids()
         except Exception as e:
             print(f"❌ Error reading existing CSV: {e}")
             return set()
 
+    def find_existing_ids_in_csv(self, lead_ids):
+        """Returns which of the given lead IDs are in the leads CSV.
+
+        Streams the file row by row and keeps only matches, so memory depends
+        on the number of IDs asked about, not on the size of the file.
+        """
+        wanted = {str(lead_id) for lead_id in lead_ids}
+        found = set()
+        if not wanted or not os.path.exists(LEADS_CSV_FILE):
+            return found
+
+        try:
+            with open(LEADS_CSV_FILE, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                if 'id' not in header:
+                    return found
+                id_col = header.index('id')
+                for row in reader:
+                    if id_col < len(row) and row[id_col] in wanted:
+                        found.add(row[id_col])
+                        if len(found) == len(wanted):
+                            break
+        except Exception as e:
+            print(f"❌ Error reading existing CSV: {e}")
+        return found
+
+    def find_existing_contacts_in_csv(self, candidates):
+        """Returns a ContactIndex of the CSV rows matching any candidate.
+
+        ``candidates`` are (lead_id, phone, email, first_name) tuples. Streams
+        the file like ``find_existing_ids_in_csv``, so memory depends on the
+        candidates and their matches, not on the size of the file.
+        """
+        wanted = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+        for candidate in candidates:
+            wanted.add(*candidate)
+        found = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+        if not len(wanted) or not os.path.exists(LEADS_CSV_FILE):
+            return found
+
+        try:
+            for values in read_csv_contacts(LEADS_CSV_FILE):
+                if wanted.match(*values):
+                    found.add(*values)
+        except Exception as e:
+            print(f"❌ Error reading existing CSV: {e}")
+        return found
+
+    def load_contact_index(self, candidates):
+        """Returns a ContactIndex of the known contacts the candidates could duplicate.
+
+        ``candidates`` are (lead_id, normalized phone, email, first_name)
+        tuples. Without streaming the process-wide index of the whole CSV is
+        returned; the SQLite store and the streaming scan load only the leads
+        that share a key with a candidate.
+        """
+        candidates = list(candidates)
+        if self.store:
+            contacts = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+            # Stored phones may or may not carry the leading '+'
+            digits = [phone_key(phone) for _, phone, _, _ in candidates if phone_key(phone)]
+            rows = self.store.find_contacts(
+                lead_ids=[lead_id for lead_id, _, _, _ in candidates],
+                phones=digits + [f"+{phone}" for phone in digits],
+                emails=[email for _, _, email, _ in candidates],
+                phone_blocks=[phone_block_key(phone) for _, phone, _, _ in candidates] if DEDUP_NEAR_DUPLICATES else (),
+            )
+            for row in rows:
+                contacts.add(*row)
+            return contacts
+        if LEADS_CSV_STREAMING:
+            return self.find_existing_contacts_in_csv(candidates)
+        return get_lead_index(LEADS_CSV_FILE).get_contacts()
+
     def get_new_leads_from_last_6_hours(self):
-        """Gets leads that were created in the last 6 hours."""
-        if not os.path.exists(LEADS_CSV_FILE):
+        """Gets leads that were created in the last 6 hours.
+
+        With the Parquet history only the partitions fetched in the window are
+        read. Otherwise the CSV is read in chunks of LEADS_CSV_CHUNK_ROWS rows as
+        plain strings, keeping only recent rows, so memory does not grow with
+        the lead history. Only RECENT_LEAD_COLUMNS are loaded and returned.
+        """
+        import pandas as pd
+
+        six_hours_ago = pd.Timestamp.now(tz='UTC') - pd.Timedelta(hours=6)
+
+        if self.store:
+            # Index range scan on created_time; a day of slack covers UTC offsets
+            since = (six_hours_ago - pd.Timedelta(days=1)).date().isoformat()
+            chunks = [pd.DataFrame(self.store.get_leads_created_since(since),
+                                   columns=self.leads_csv_headers)[list(RECENT_LEAD_COLUMNS)]]
+        elif self.history:
+            chunks = [self.history.read_created_since(six_hours_ago, columns=RECENT_LEAD_COLUMNS)]
+        elif not os.path.exists(LEADS_CSV_FILE):
             print("📝 No existing CSV file found. All leads will be considered new.")
             return []
-        
+        else:
+            chunks = None
+
         try:
-            df = pd.read_csv(LEADS_CSV_FILE)
-            
-            # Convert created_time to datetime
-            df['created_time'] = pd.to_datetime(df['created_time'], errors='coerce')
-            
-            # Get leads from last 6 hours
-            six_hours_ago = datetime.now() - timedelta(hours=6)
-            recent_leads = df[df['created_time'] >= six_hours_ago]
-            
-            # Remove duplicates based on email or phone
-            recent_leads = recent_leads.drop_duplicates(subset=['email', 'phone'], keep='last')
-            
-            print(f"🔍 Found {len(recent_leads)} new leads from last 6 hours")
-            return recent_leads.to_dict('records')
+            if chunks is None:
+                # A callable usecols tolerates older CSVs without message_sent
+                chunks = pd.read_csv(LEADS_CSV_FILE, dtype=str, keep_default_na=False,
+                                     usecols=lambda name: name in RECENT_LEAD_COLUMNS,
+                                     chunksize=LEADS_CSV_CHUNK_ROWS)
+
+            recent = []
+            for chunk in chunks:
+                created = pd.to_datetime(chunk['created_time'], errors='coerce', utc=True)
+                recent.append(chunk[created >= six_hours_ago])
+            recent_leads = pd.concat(recent, ignore_index=True) if recent else pd.DataFrame(columns=RECENT_LEAD_COLUMNS)
+
+            # Apply status changes still waiting in the log
+            overrides = self.load_message_status_overrides()
+            if overrides and not recent_leads.empty:
+                lead_ids = recent_leads['id'].astype(str)
+                pending = lead_ids.isin(overrides.keys())
+                recent_leads.loc[pending, 'message_sent'] = lead_ids[pending].map(overrides)
+
+            # One row per contact (same ID, phone or email), keeping the latest
+            contacts = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+            unique_leads = []
+            for row in reversed(recent_leads.to_dict('records')):
+                keys = (row.get('id'), row.get('phone'), row.get('email'), row.get('first_name'))
+                if contacts.match(*keys) is None:
+                    unique_leads.append(row)
+                contacts.add(*keys)
+            unique_leads.reverse()
+
+            print(f"🔍 Found {len(unique_leads)} new leads from last 6 hours")
+            return unique_leads
             
         except Exception as e:
             print(f"❌ Error processing CSV: {e}")
@@ -616,7 +1900,14 @@ class LeadAutomation:
 
     def find_new_leads(self, current_leads):
         """Compare current leads with existing CSV to find new ones - optimized for large datasets."""
-        existing_ids = self.get_existing_lead_ids()
+        with self.metrics.timer('load_existing_ids'):
+            if self.store:
+                # Indexed primary-key lookups for just the fetched IDs
+                existing_ids = self.store.get_existing_ids(lead.get('id', '') for lead in current_leads)
+            elif LEADS_CSV_STREAMING:
+                existing_ids = self.find_existing_ids_in_csv(lead.get('id', '') for lead in current_leads)
+            else:
+                existing_ids = self.get_existing_lead_ids()
         
         new_leads = []
         total_leads = len(current_leads)
@@ -640,55 +1931,189 @@ class LeadAutomation:
             
         return new_leads
 
-    def send_aisensy_message(self, phone, user_name, campaign_name, media_url, media_filename, template_params=None):
-        """Sends a WhatsApp message via AiSensy API."""
-        url = "https://backend.aisensy.com/campaign/t1/api/v2"
+    def aisensy_payload(self, campaign_name, media_url, media_filename):
+        """The part of an AiSensy request body shared by every recipient of a campaign step.
 
-        payload = {
+        Add ``destination``, ``userName`` and ``templateParams`` per recipient
+        with ``dict(skeleton, destination=..., ...)``.
+        """
+        return {
             "apiKey": AISENSY_API_KEY,
             "campaignName": campaign_name,
-            "destination": phone,
-            "userName": user_name,
             "source": "Zoho CRM Automation",
             "media": {
                 "url": media_url,
                 "filename": media_filename
             },
-            "templateParams": template_params or []
         }
 
+    def send_aisensy_message(self, phone, user_name, campaign_name, media_url, media_filename, template_params=None):
+        """Sends a WhatsApp message via AiSensy API."""
+        return self.post_aisensy_payload(dict(
+            self.aisensy_payload(campaign_name, media_url, media_filename),
+            destination=phone,
+            userName=user_name,
+            templateParams=template_params or [],
+        ))
+
+    def post_aisensy_payload(self, payload):
+        """Posts one AiSensy request body and returns the parsed response.
+
+        An error after the request may have gone out (read timeout, connection
+        reset) gives a response marked ``unknown``: AiSensy may have sent the
+        message, so it must not be retried automatically.
+        """
         headers = {"Content-Type": "application/json"}
 
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            return response.json()
+            # A send is not idempotent: only retried when AiSensy cannot have acted on it
+            response = self.aisensy_client.post(
+                AISENSY_API_URL, idempotent=False, json=payload, headers=headers, timeout=HTTP_TIMEOUT
+            )
+        except CircuitOpenError as e:
+            return {"status_code": 0, "error": str(e), "deferred": True, "retry_at": e.retry_at}
         except Exception as e:
+            if request_may_have_been_sent(e):
+                return {"status_code": 0, "error": str(e) or type(e).__name__, "unknown": True}
             return {"status_code": 0, "error": str(e)}
 
+        try:
+            return response.json()
+        except ValueError:
+            # The request went through; an unparseable body must not look like
+            # a network failure, or the message would be sent again.
+            return {"status_code": response.status_code, "error": response.text[:200]}
+
+    def send_aisensy_messages(self, payloads, ledger_keys=None):
+        """Sends many AiSensy messages concurrently under the shared rate limit.
+
+        ``payloads`` are AiSensy request bodies, normally one ``aisensy_payload``
+        skeleton per campaign step copied with each recipient's fields. They are
+        pipelined over the pooled connections by AISENSY_MAX_WORKERS senders.
+        ``ledger_keys`` optionally gives a (lead_id, step, campaign) key per
+        message; each keyed send is claimed in the send ledger first, so a send
+        that already went out is answered from the ledger instead of repeated.
+        A keyed send that fails is held back in the ledger until its
+        ``retry_at`` (exponential backoff with jitter on its attempt count).
+        Sends that were not attempted (circuit open, in flight elsewhere or
+        still backing off) get a failure response marked ``deferred``. A send
+        whose outcome is unknown (see post_aisensy_payload), now or in an
+        earlier run, gets a response marked ``unknown`` and is never resent.
+        Returns the responses in the same order.
+        """
+        if not payloads:
+            return []
+
+        ledger_keys = ledger_keys or [None] * len(payloads)
+        responses = [None] * len(payloads)
+
+        circuit_retry_at = self.aisensy_breaker.retry_at()
+        if circuit_retry_at > time.time():
+            print(f"🔌 AiSensy circuit is open; deferring {len(payloads)} send(s) "
+                  f"until {datetime.fromtimestamp(circuit_retry_at).strftime('%H:%M:%S')}")
+            self.metrics.inc('aisensy_deferred', len(payloads))
+            return [
+                {'status_code': 0, 'error': 'AiSensy circuit open', 'deferred': True, 'retry_at': circuit_retry_at}
+                for _ in payloads
+            ]
+
+        pending = []
+        already_sent = 0
+        in_flight = 0
+        backing_off = 0
+        unconfirmed = 0
+
+        for i, (payload, key) in enumerate(zip(payloads, ledger_keys)):
+            if key is None:
+                pending.append(i)
+                continue
+            claim = self.send_ledger.claim(*key, phone=payload.get('destination'))
+            if claim == ALREADY_SENT:
+                already_sent += 1
+                responses[i] = {'status': 'success', 'deduplicated': True}
+            elif claim == IN_FLIGHT:
+                in_flight += 1
+                responses[i] = {'status_code': 0, 'error': 'send already in flight in another run', 'deferred': True}
+            elif claim == BACKING_OFF:
+                backing_off += 1
+                responses[i] = {'status_code': 0, 'error': 'backing off after a failed send', 'deferred': True}
+            elif claim == UNCONFIRMED:
+                unconfirmed += 1
+                responses[i] = {'status_code': 0, 'error': 'an earlier send has an unknown outcome', 'unknown': True}
+            else:
+                pending.append(i)
+
+        self.metrics.inc('ledger_already_sent', already_sent)
+        self.metrics.inc('ledger_in_flight', in_flight)
+        self.metrics.inc('ledger_backing_off', backing_off)
+        self.metrics.inc('ledger_unconfirmed', unconfirmed)
+        if already_sent or in_flight or backing_off or unconfirmed:
+            print(f"⏭️ Send ledger: {already_sent} already sent, {in_flight} in flight elsewhere, "
+                  f"{backing_off} backing off after a failure, {unconfirmed} with an unknown outcome (not re-sent)")
+
+        def send_one(i):
+            wait_start = time.perf_counter()
+            self.send_rate_limiter.acquire()
+            self.metrics.observe('aisensy_rate_limit_wait_seconds', time.perf_counter() - wait_start)
+            response = self.post_aisensy_payload(payloads[i])
+            key = ledger_keys[i]
+            if key is None:
+                return response
+            if self.is_message_success(response):
+                self.send_ledger.record(*key, LEDGER_SENT, detail=json.dumps(response)[:500])
+                return response
+            if response.get('unknown'):
+                self.metrics.inc('aisensy_unknown')
+                self.send_ledger.record(*key, LEDGER_UNKNOWN, detail=json.dumps(response)[:500])
+                return response
+
+            if response.get('deferred'):
+                self.metrics.inc('aisensy_deferred')
+            else:
+                # Counts this attempt, which is only recorded below
+                attempts = self.send_ledger.get_attempts(*key) + 1
+                response['retry_at'] = time.time() + 60 * backoff_delay(
+                    attempts, SEND_RETRY_BASE_MINUTES, SEND_RETRY_MAX_MINUTES
+                )
+            self.send_ledger.record(
+                *key, LEDGER_FAILED, detail=json.dumps(response)[:500],
+                next_retry_at=datetime.fromtimestamp(response['retry_at']).isoformat(),
+                attempted=not response.get('deferred')
+            )
+            return response
+
+        if pending:
+            workers = max(1, min(AISENSY_MAX_WORKERS, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for i, response in zip(pending, executor.map(send_one, pending)):
+                    responses[i] = response
+        return responses
+
     def send_welcome_messages_to_new_leads(self, new_leads):
         """Sends Template 1 to new leads, saves successes, and queues drip sends."""
         if not new_leads:
             print("📱 No new leads to send messages to.")
-            return
+            return []
 
         successful_sends = 0
         failed_sends = 0
+        abandoned_sends = 0
+        deferred_sends = 0
+        unknown_sends = 0
         no_phone_skips = 0
+        duplicate_skips = 0
         skipped_sends = 0
 
         processed_leads = []
         drip_entries = []
-        target_sources = ["Google Ads 2025", "Form Submission", "Whatsapp Marketing","Youtube Ads"]
-        campaign_name = self.get_template_campaign(1)
-        media_url, media_filename = self.get_template_media(1)
-
-        if not campaign_name or not media_url:
-            print("❌ Missing campaign name for Template 1")
-            return
+        failed_leads = []
+        target_sources = TARGET_LEAD_SOURCES
+        missing_template = set()
 
         print(f"📱 Processing {len(new_leads)} leads for Template 1...")
 
-        for i, lead in enumerate(new_leads, 1):
+        candidates = []
+        for lead in new_leads:
             lead_source = lead.get('Lead_Source', '')
             if lead_source is None:
                 lead_source = ''
@@ -709,17 +2134,63 @@ class LeadAutomation:
                     print("⚠️ ... more leads without phone numbers (suppressing further logs)")
                 continue
 
-            print(f"📱 [{i}/{len(new_leads)}] Sending Template 1 to {first_name} ({phone})")
+            # Each Lead Source is enrolled in one drip campaign, which starts with its Template 1
+            campaign = self.drip_engine.for_lead_source(lead_source)
+            if not campaign.template(1) or not campaign.step_media(1)[0]:
+                if campaign.name not in missing_template:
+                    missing_template.add(campaign.name)
+                    print(f"❌ Missing campaign name for Template 1 of drip campaign {campaign.name}")
+                failed_leads.append(lead)
+                continue
+
+            candidates.append((lead, phone, first_name, campaign))
 
-            response = self.send_aisensy_message(
-                phone=phone,
-                user_name=f"{first_name} {lead.get('Last_Name', '')}".strip(),
-                campaign_name=campaign_name,
-                media_url=media_url,
-                media_filename=media_filename,
-                template_params=[first_name]
+        # One contact gets one Template 1, however many forms they submit
+        with self.metrics.timer('load_contacts'):
+            contacts = self.load_contact_index(
+                (lead.get('id'), phone, lead.get('Email'), lead.get('First_Name'))
+                for lead, phone, _, _ in candidates
             )
+        batch_contacts = ContactIndex(near_duplicates=DEDUP_NEAR_DUPLICATES)
+        to_send = []
+        for lead, phone, first_name, campaign in candidates:
+            keys = (lead.get('id'), phone, lead.get('Email'), lead.get('First_Name'))
+            match = contacts.match(*keys) or batch_contacts.match(*keys)
+            if match:
+                duplicate_skips += 1
+                if duplicate_skips <= 3:
+                    print(f"⏭️ Skipping {first_name} ({phone}) - same contact as lead {match[0]} (matched on {match[1]})")
+                elif duplicate_skips == 4:
+                    print("⏭️ ... more duplicate contacts (suppressing further logs)")
+                continue
+            batch_contacts.add(*keys)
+            to_send.append((lead, phone, first_name, campaign))
+
+        if to_send:
+            print(f"📱 Sending Template 1 to {len(to_send)} leads "
+                  f"(up to {AISENSY_RATE_PER_SECOND:g} msg/s, {AISENSY_MAX_WORKERS} workers)")
+
+        # One payload skeleton per drip campaign's Template 1
+        skeletons = {}
+        for _, _, _, campaign in to_send:
+            if campaign.name not in skeletons:
+                skeletons[campaign.name] = self.aisensy_payload(campaign.template(1), *campaign.step_media(1))
+
+        ledger_keys = [(str(lead.get('id') or phone), 1, campaign.name) for lead, phone, _, campaign in to_send]
+        responses = self.send_aisensy_messages(
+            [
+                dict(
+                    skeletons[campaign.name],
+                    destination=phone,
+                    userName=f"{first_name} {lead.get('Last_Name', '')}".strip(),
+                    templateParams=[first_name],
+                )
+                for lead, phone, first_name, campaign in to_send
+            ],
+            ledger_keys=ledger_keys
+        )
 
+        for i, ((lead, phone, first_name, campaign), key, response) in enumerate(zip(to_send, ledger_keys, responses), 1):
             if self.is_message_success(response):
                 successful_sends += 1
                 sent_at = datetime.now().isoformat()
@@ -732,124 +2203,276 @@ class LeadAutomation:
                     )
                 )
 
-                next_step = 2
-                drip_entries.append({
-                    'phone': phone,
-                    'lead_id': str(lead.get('id', '')),
-                    'first_name': lead.get('First_Name', ''),
-                    'last_name': lead.get('Last_Name', ''),
-                    'drip_campaign': DRIP_CAMPAIGN_NAME,
-                    't1_sent_at': sent_at,
-                    'last_step_sent': 1,
-                    'next_step': next_step,
-                    'next_send_at': self.calculate_next_send_at(sent_at, next_step),
-                    'next_campaign': self.get_template_campaign(next_step)
-                })
-                print(f"✅ Template 1 sent successfully to {first_name}")
+                lead_source = lead.get('Lead_Source') or ''
+                next_step = campaign.next_step(1, lead_source)
+                if next_step is not None:
+                    drip_entries.append({
+                        'phone': phone,
+                        'lead_id': str(lead.get('id', '')),
+                        'first_name': lead.get('First_Name', ''),
+                        'last_name': lead.get('Last_Name', ''),
+                        'lead_source': lead_source,
+                        'drip_campaign': campaign.name,
+                        't1_sent_at': sent_at,
+                        'last_step_sent': 1,
+                        'next_step': next_step,
+                        'next_send_at': self.calculate_next_send_at(sent_at, next_step, campaign),
+                        'next_campaign': campaign.template(next_step)
+                    })
+                print(f"✅ [{i}/{len(to_send)}] Template 1 sent successfully to {first_name} ({phone})")
+            elif response.get('unknown'):
+                # AiSensy may have sent it: saved so it is never sent again, but no drip is started
+                unknown_sends += 1
+                processed_leads.append(
+                    self.build_processed_lead(
+                        lead,
+                        fetched_at=datetime.now().isoformat(),
+                        message_sent_value='Unknown',
+                        phone=phone
+                    )
+                )
+                print(f"⚠️ [{i}/{len(to_send)}] Template 1 to {first_name} ({phone}) has an unknown outcome; "
+                      f"not resending: {response}")
+            elif response.get('deferred'):
+                # Not attempted; the lead is fetched again and retried on a later run
+                deferred_sends += 1
+                failed_leads.append(lead)
+            elif self.send_ledger.get_attempts(*key) >= TEMPLATE1_MAX_ATTEMPTS:
+                # Given up: saved as 'Failed' so it no longer holds the watermark back
+                abandoned_sends += 1
+                processed_leads.append(
+                    self.build_processed_lead(
+                        lead,
+                        fetched_at=datetime.now().isoformat(),
+                        message_sent_value='Failed',
+                        phone=phone
+                    )
+                )
+                print(f"❌ Giving up on Template 1 to {first_name} ({phone}) after "
+                      f"{TEMPLATE1_MAX_ATTEMPTS} failed attempts: {response}")
             else:
                 failed_sends += 1
+                failed_leads.append(lead)
                 if failed_sends <= 5:
                     print(f"❌ Failed to send Template 1 to {first_name}: {response}")
                 elif failed_sends == 6:
                     print("❌ ... more failures (suppressing detailed error logs)")
 
-            time.sleep(2)
-
             if i % 50 == 0:
-                print(f"📊 Progress: {i}/{len(new_leads)} leads processed...")
+                print(f"📊 Progress: {i}/{len(to_send)} leads processed...")
 
         if processed_leads:
             self.append_processed_leads(processed_leads)
             self.add_to_drip_queue(drip_entries)
 
+        self.metrics.inc('template1_sent', successful_sends)
+        self.metrics.inc('template1_failed', failed_sends)
+        self.metrics.inc('template1_abandoned', abandoned_sends)
+        self.metrics.inc('template1_deferred', deferred_sends)
+        self.metrics.inc('template1_unknown', unknown_sends)
+        self.metrics.inc('template1_skipped_no_phone', no_phone_skips)
+        self.metrics.inc('template1_skipped_duplicate', duplicate_skips)
+        self.metrics.inc('template1_skipped_filtered', skipped_sends)
+
         print("\n📊 Template 1 Summary:")
         print(f"✅ Successfully sent: {successful_sends}")
         print(f"❌ Failed to send: {failed_sends}")
+        print(f"🛑 Given up after {TEMPLATE1_MAX_ATTEMPTS} attempts: {abandoned_sends}")
+        print(f"⏸️ Deferred (circuit open or backing off): {deferred_sends}")
+        print(f"❔ Unknown outcome (not resent): {unknown_sends}")
         print(f"⚠️ Skipped (no phone): {no_phone_skips}")
+        print(f"⏭️ Skipped (duplicate contact): {duplicate_skips}")
         print(f"⏭️ Skipped (filtered): {skipped_sends}")
         print(f"📱 Total processed: {len(new_leads)}")
+        return failed_leads
     
     def update_message_status_in_csv(self, leads_with_status):
-        """Update the CSV file with message sent status for the leads."""
-        if not os.path.exists(LEADS_CSV_FILE):
+        """Record message sent status for the leads.
+
+        Each change is appended to MESSAGE_STATUS_LOG_FILE (one JSON line per
+        lead) rather than rewriting the CSV; the log is folded into the CSV by
+        ``compact_message_status`` once it reaches MESSAGE_STATUS_COMPACT_THRESHOLD.
+        """
+        if self.store:
+            self.store.update_message_status(
+                (lead.get('id', ''), lead.get('message_sent', 'No')) for lead in leads_with_status
+            )
+            print(f"✅ Updated message status in {LEADS_DB_FILE} for {len(leads_with_status)} leads")
             return
-        
-        try:
-            # First, check if CSV needs the message_sent column
-            df_test = pd.read_csv(LEADS_CSV_FILE, nrows=1)
-            if 'message_sent' not in df_test.columns:
-                print("🔧 CSV missing 'message_sent' column, fixing structure...")
-                self.fix_csv_structure()
-            
-            # Now read the full CSV
-            df = pd.read_csv(LEADS_CSV_FILE)
-            print(f"✅ Read CSV with {len(df)} valid rows and {len(df.columns)} columns")
-            
-            # Ensure message_sent column exists
-            if 'message_sent' not in df.columns:
-                df['message_sent'] = 'No'
-                print("✅ Added missing 'message_sent' column")
-            
-            # Update message status for each lead
+
+        if not os.path.exists(LEADS_CSV_FILE) or not leads_with_status:
+            return
+
+        recorded_at = datetime.now().isoformat()
+        with open(MESSAGE_STATUS_LOG_FILE, 'a', encoding='utf-8') as f:
             for lead in leads_with_status:
-                lead_id = str(lead.get('id', ''))
-                message_status = lead.get('message_sent', 'No')
-                
-                # Update the specific lead's message status
-                df.loc[df['id'].astype(str) == lead_id, 'message_sent'] = message_status
-            
-            # Save updated CSV
-            df.to_csv(LEADS_CSV_FILE, index=False)
-            print(f"✅ Updated message status in CSV for {len(leads_with_status)} leads")
-            
+                f.write(json.dumps({
+                    'lead_id': str(lead.get('id', '')),
+                    'status': lead.get('message_sent', 'No'),
+                    'ts': recorded_at
+                }) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"✅ Logged message status for {len(leads_with_status)} leads")
+
+        if self.count_message_status_events() >= MESSAGE_STATUS_COMPACT_THRESHOLD:
+            with self.metrics.timer('compact_message_status'):
+                self.compact_message_status()
+
+    def count_message_status_events(self):
+        """Returns the number of status events waiting in the log."""
+        if not os.path.exists(MESSAGE_STATUS_LOG_FILE):
+            return 0
+        with open(MESSAGE_STATUS_LOG_FILE, 'rb') as f:
+            return sum(1 for line in f if line.strip())
+
+    def load_message_status_overrides(self, paths=(MESSAGE_STATUS_COMPACTING_FILE, MESSAGE_STATUS_LOG_FILE)):
+        """Returns {lead_id: status} from the status logs, latest event winning.
+
+        By default this is the log being compacted (if any) followed by the live log.
+        """
+        overrides = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append; skip it
+                        continue
+                    overrides[str(event.get('lead_id', ''))] = event.get('status', 'No')
+        return overrides
+
+    def compact_message_status(self):
+        """Folds the status log into the leads CSV under the run lock.
+
+        Skipped (returns 0) while another run or the webhook receiver holds
+        RUN_LOCK_FILE. The log is first renamed to MESSAGE_STATUS_COMPACTING_FILE,
+        so events appended meanwhile start a new log instead of being lost. The
+        CSV is streamed through ``atomic_open``, so a crash leaves either the old
+        or the new file, and the renamed log is only deleted after the swap.
+        Replaying it twice is harmless.
+        """
+        with file_lock(RUN_LOCK_FILE, blocking=False) as locked:
+            if not locked:
+                print("⏭️ Another automation run holds the state lock, not compacting the status log now")
+                return 0
+            return self.compact_message_status_locked()
+
+    def compact_message_status_locked(self):
+        """``compact_message_status`` for a caller that holds the run lock."""
+        if not os.path.exists(LEADS_CSV_FILE):
+            return 0
+        # A leftover from an interrupted compaction is folded in first; the live log waits for the next one
+        if not os.path.exists(MESSAGE_STATUS_COMPACTING_FILE):
+            if not os.path.exists(MESSAGE_STATUS_LOG_FILE):
+                return 0
+            os.replace(MESSAGE_STATUS_LOG_FILE, MESSAGE_STATUS_COMPACTING_FILE)
+
+        overrides = self.load_message_status_overrides([MESSAGE_STATUS_COMPACTING_FILE])
+        if not overrides:
+            os.remove(MESSAGE_STATUS_COMPACTING_FILE)
+            return 0
+
+        print(f"🗜️ Compacting {len(overrides)} message status updates into {LEADS_CSV_FILE}...")
+        updated = 0
+        try:
+            with atomic_open(LEADS_CSV_FILE, 'w', newline='') as dst, \
+                    open(LEADS_CSV_FILE, 'r', newline='', encoding='utf-8') as src:
+                reader = csv.reader(src)
+                writer = csv.writer(dst, lineterminator='\n')
+                header = next(reader, None)
+                if header is None:
+                    print("❌ CSV file is empty")
+                    return 0
+                if 'message_sent' not in header:
+                    header.append('message_sent')
+                    print("✅ Added missing 'message_sent' column")
+                id_col = header.index('id')
+                status_col = header.index('message_sent')
+                writer.writerow(header)
+
+                for row in reader:
+                    if not row:
+                        continue
+                    if len(row) <= status_col:
+                        row.extend([''] * (status_col - len(row)) + ['No'])
+                    status = overrides.get(row[id_col])
+                    if status is not None:
+                        row[status_col] = status
+                        updated += 1
+                    writer.writerow(row)
+
+            # The Parquet history is append-only: the changes go to its status overlay
+            if self.history:
+                self.history.append_statuses(overrides)
+            os.remove(MESSAGE_STATUS_COMPACTING_FILE)
+            print(f"✅ Updated message status in CSV for {updated} rows")
+            return updated
+
         except Exception as e:
-            print(f"❌ Error updating message status in CSV: {e}")
-            print("🔧 Attempting to recover by fixing CSV structure...")
-            try:
-                self.fix_csv_structure()
-                print("✅ CSV structure fixed, please retry the operation")
-            except Exception as fix_error:
-                print(f"❌ Failed to fix CSV structure: {str(fix_error)}")
+            print(f"❌ Error compacting message status into CSV: {e}")
+            return 0
 
     def fix_csv_structure(self):
         """Fixes CSV structure by adding missing message_sent column if needed."""
         print("🔧 Fixing CSV structure...")
         
         try:
-            # Read file line by line and fix issues
+            # Check header
             with open(LEADS_CSV_FILE, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            if not lines:
+                header = f.readline().strip()
+
+            if not header:
                 print("❌ CSV file is empty")
                 return
-            
-            # Check header
-            header = lines[0].strip()
-            
-            # Check if message_sent column is missing
-            if 'message_sent' not in header:
-                print("✅ Adding missing 'message_sent' column to header")
-                header += ',message_sent'
-                lines[0] = header + '\n'
-                
+
+            if 'message_sent' in header:
+                print("✅ CSV already has 'message_sent' column")
+                return
+
+            # Stream the file line by line into a temp copy, then swap it in
+            print("✅ Adding missing 'message_sent' column to header")
+            rows = 0
+            with atomic_open(LEADS_CSV_FILE, 'w') as dst, \
+                    open(LEADS_CSV_FILE, 'r', encoding='utf-8') as src:
+                next(src)
+                dst.write(header + ',message_sent\n')
+
                 # Add 'No' to all existing data lines for the new column
-                for i in range(1, len(lines)):
-                    if lines[i].strip():  # Only process non-empty lines
-                        lines[i] = lines[i].strip() + ',No\n'
-            
-            # Write the updated CSV
-            with open(LEADS_CSV_FILE, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-            
-            print(f"✅ Fixed CSV structure: {len(lines)-1} data rows updated")
+                for line in src:
+                    if line.strip():  # Only process non-empty lines
+                        dst.write(line.strip() + ',No\n')
+                        rows += 1
+
+            print(f"✅ Fixed CSV structure: {rows} data rows updated")
                 
         except Exception as e:
             print(f"❌ Error fixing CSV structure: {str(e)}")
             raise
 
     def run_automation(self):
-        """Main automation function - simple flow for testing."""
+        """Main automation function - simple flow for testing.
+
+        Holds an advisory lock on RUN_LOCK_FILE for the whole run, so the
+        GitHub Actions job and the local scheduler never work on the same
+        state files at once. Returns False if the run was skipped or could
+        not get a token.
+        """
+        with file_lock(RUN_LOCK_FILE, blocking=False) as locked:
+            if not locked:
+                print("⏭️ Another automation run holds the state lock, skipping this run")
+                return False
+            with self.track_run('automation'):
+                return self.run_pipeline()
+
+    def run_pipeline(self):
+        """Runs one fetch, Template 1 and drip cycle (caller holds the run lock).
+
+        Returns False if no valid token could be obtained, True otherwise.
+        """
         print("🚀 Starting Lead Automation Process...")
         print("=" * 50)
         
@@ -861,40 +2484,53 @@ class LeadAutomation:
             print("🔄 SUBSEQUENT RUN: Will check for new leads and send messages")
         
         # 1. Get valid tokens
-        token_data = self.get_valid_token_data()
+        with self.metrics.timer('token'):
+            token_data = self.get_valid_token_data()
         if not token_data:
-            return
-        
-        # 2. Fetch leads from Zoho
-        leads = self.fetch_zoho_leads(
-            access_token=token_data.get('access_token'),
-            api_domain=token_data.get('api_domain')
-        )
+            return False
         
-        if not leads:
+        # 2. Fetch leads from Zoho (incrementally once a watermark exists)
+        previous_watermark = None if first_run else self.get_fetch_watermark()
+        with self.metrics.timer('fetch_zoho_leads'):
+            leads = self.fetch_zoho_leads(
+                access_token=token_data.get('access_token'),
+                api_domain=token_data.get('api_domain'),
+                modified_since=previous_watermark
+            )
+        self.metrics.inc('leads_fetched', len(leads))
+        failed_leads = []
+
+        if not leads and first_run:
             print("❌ No leads fetched. Exiting.")
-            return
-        
+            return True
+
         # 3. If not first run, find new leads
-        if not first_run:
-            new_leads = self.find_new_leads(leads)
+        if not leads:
+            print("📱 No new or modified leads since last run.")
+        elif not first_run:
+            with self.metrics.timer('find_new_leads'):
+                new_leads = self.find_new_leads(leads)
             
             if new_leads:
                 # Send Template 1 and only save leads after success
-                self.send_welcome_messages_to_new_leads(new_leads)
+                with self.metrics.timer('send_welcome_messages'):
+                    failed_leads = self.send_welcome_messages_to_new_leads(new_leads)
             else:
                 print("📱 No new leads found.")
         else:
             # First run - save all leads to CSV
-            self.save_leads_to_csv(leads)
+            with self.metrics.timer('save_leads'):
+                self.save_leads_to_csv(leads)
             print("📝 First run completed. Next run will check for new leads and send messages.")
 
         # Process drip queue every run
-        self.process_drip_queue()
+        with self.metrics.timer('process_drip_queue'):
+            self.process_drip_queue()
         
-        # Save last run time for tracking
+        # Save last run time (and the fetch watermark) for tracking
         try:
-            self.save_last_run_time()
+            with self.metrics.timer('save_last_run'):
+                self.save_last_run_time(self.get_next_watermark(failed_leads) or previous_watermark)
         except Exception as e:
             print(f"⚠️ Warning: Could not save last run time: {e}")
         
@@ -902,25 +2538,33 @@ class LeadAutomation:
         if not os.path.exists(LAST_RUN_FILE):
             print("⚠️ Last run file missing, creating backup...")
             try:
-                with open(LAST_RUN_FILE, 'w') as f:
-                    json.dump({'last_run': datetime.now().isoformat(), 'backup': True}, f)
+                atomic_write_json(LAST_RUN_FILE, {'last_run': datetime.now().isoformat(), 'backup': True})
                 print("✅ Backup last run file created")
             except Exception as e:
                 print(f"❌ Failed to create backup last run file: {e}")
         
         print("\n🎉 Automation process completed!")
         print("=" * 50)
+        return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zoho CRM to AiSensy WhatsApp lead automation")
+    parser.add_argument('--compact-status', action='store_true',
+                        help=f"fold {MESSAGE_STATUS_LOG_FILE} into {LEADS_CSV_FILE} and exit")
+    args = parser.parse_args()
+
     automation = LeadAutomation()
+
+    if args.compact_status:
+        automation.compact_message_status()
+        automation.close()
+        raise SystemExit(0)
     
     # Check if CSV needs fixing (add message_sent column if missing)
     if os.path.exists(LEADS_CSV_FILE):
         try:
-            # Try to read the CSV to see if it has message_sent column
-            df_check = pd.read_csv(LEADS_CSV_FILE, nrows=1)
-            
-            if 'message_sent' not in df_check.columns:
+            # Only the header line is read; pandas is not needed for this
+            if 'message_sent' not in read_csv_header(LEADS_CSV_FILE):
                 print("🔧 Adding missing 'message_sent' column to existing CSV...")
                 automation.fix_csv_structure()
                 print("✅ CSV structure updated!")
@@ -930,4 +2574,7 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"⚠️ CSV check error: {e}")
     
-    automation.run_automation()
+    try:
+        automation.run_automation()
+    finally:
+        automation.close()
@@ -0,0 +1,168 @@
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from state_files import atomic_open
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency; LeadAutomation falls back to the CSV
+    pa = None
+
+TIMESTAMP_COLUMNS = ['created_time', 'modified_time', 'fetched_at']
+PARTITION_COLUMN = 'fetch_date'
+STATUS_DIR = '_message_status'  # Leading underscore: skipped by scans of the lead dataset
+UTC_OFFSET_SUFFIX = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+
+def parquet_available():
+    """Returns True if pyarrow is installed."""
+    return pa is not None
+
+
+class LeadHistory:
+    """Append-only Parquet dataset of processed leads, partitioned by fetch date.
+
+    Each append writes one file per ``fetch_date=YYYY-MM-DD`` directory, with
+    timestamps stored as UTC timestamps rather than strings. A lead is never
+    fetched before it is created, so "created since T" queries only open the
+    partitions dated on or after T.
+
+    Timestamps without a UTC offset (fetched_at is a naive local time) are
+    local times in ``timezone`` (an IANA name), or the machine's local zone.
+
+    Later message_sent changes are appended to a separate ``_message_status``
+    dataset (see append_statuses) and override the stored value on reads.
+    """
+
+    def __init__(self, path, columns, timezone=None):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the Parquet lead history")
+        self.path = path
+        self.columns = list(columns)
+        self.timezone = timezone or None
+        self.schema = pa.schema(
+            [(col, pa.timestamp('us', tz='UTC') if col in TIMESTAMP_COLUMNS else pa.string())
+             for col in self.columns]
+        )
+        self.partitioning = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor='hive')
+        self.status_path = os.path.join(path, STATUS_DIR)
+        self.status_schema = pa.schema(
+            [('id', pa.string()), ('message_sent', pa.string()), ('updated_at', pa.timestamp('us', tz='UTC'))]
+        )
+
+    def exists(self):
+        """Returns True once the dataset has been written to."""
+        return os.path.isdir(self.path) and any(os.scandir(self.path))
+
+    def to_frame(self, rows):
+        """Builds a typed frame (plus fetch_date) from dict rows or a DataFrame."""
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame.from_records(rows)
+        frame = frame.reindex(columns=self.columns)
+        for col in self.columns:
+            if col in TIMESTAMP_COLUMNS:
+                frame[col] = self.to_utc(frame[col])
+            else:
+                frame[col] = frame[col].map(lambda value: None if pd.isna(value) else str(value))
+        # Rows without a usable fetched_at are filed under today, which is never earlier than their creation
+        today = datetime.now(timezone.utc).date().isoformat()
+        frame[PARTITION_COLUMN] = frame['fetched_at'].dt.strftime('%Y-%m-%d').fillna(today)
+        return frame
+
+    def to_utc(self, values):
+        """Parses ISO timestamps to UTC; naive ones are localized to the history's timezone first."""
+        text = values.astype('string')
+        aware = text.str.contains(UTC_OFFSET_SUFFIX, regex=True, na=False)
+        result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns, UTC]')
+        if aware.any():
+            result[aware] = pd.to_datetime(text[aware], errors='coerce', utc=True, format='ISO8601')
+        naive = pd.to_datetime(text[~aware], errors='coerce', format='ISO8601')
+        if naive.notna().any():
+            if self.timezone:
+                localized = naive.dt.tz_localize(self.timezone, ambiguous='NaT', nonexistent='shift_forward')
+            else:
+                # The machine's zone has no name to hand pandas; a batch shares few distinct times
+                local = {value: pd.Timestamp(value.to_pydatetime().astimezone()) for value in naive.dropna().unique()}
+                localized = pd.to_datetime(naive.map(local), utc=True)
+            result[~aware] = localized.dt.tz_convert('UTC')
+        return result
+
+    def append(self, rows):
+        """Appends leads, one new Parquet file per fetch date. Returns the rows written."""
+        frame = self.to_frame(rows)
+        if frame.empty:
+            return 0
+        for fetch_date, group in frame.groupby(PARTITION_COLUMN):
+            table = pa.Table.from_pandas(group[self.columns], schema=self.schema, preserve_index=False)
+            directory = os.path.join(self.path, f"{PARTITION_COLUMN}={fetch_date}")
+            os.makedirs(directory, exist_ok=True)
+            with atomic_open(os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"), 'wb') as f:
+                pq.write_table(table, f)
+        return len(frame)
+
+    def append_statuses(self, statuses):
+        """Records message_sent changes ({lead_id: status}). Returns the number written."""
+        if not statuses:
+            return 0
+        updated_at = datetime.now(timezone.utc)
+        table = pa.table({
+            'id': [str(lead_id) for lead_id in statuses],
+            'message_sent': [str(status) for status in statuses.values()],
+            'updated_at': [updated_at] * len(statuses),
+        }, schema=self.status_schema)
+        os.makedirs(self.status_path, exist_ok=True)
+        with atomic_open(os.path.join(self.status_path, f"part-{uuid.uuid4().hex}.parquet"), 'wb') as f:
+            pq.write_table(table, f)
+        return len(statuses)
+
+    def read_statuses(self, ids):
+        """Returns the latest recorded message_sent change for each of ``ids``."""
+        ids = [str(lead_id) for lead_id in ids]
+        if not ids or not os.path.isdir(self.status_path):
+            return {}
+        frame = ds.dataset(self.status_path, format='parquet', schema=self.status_schema).to_table(
+            filter=ds.field('id').isin(ids)
+        ).to_pandas().sort_values('updated_at', kind='stable')
+        return dict(zip(frame['id'], frame['message_sent']))
+
+    def import_csv(self, csv_path, chunk_rows=50000):
+        """Backfills the dataset from the leads CSV, in chunks. Returns the rows imported."""
+        if not os.path.exists(csv_path):
+            return 0
+        imported = 0
+        for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            imported += self.append(chunk.mask(chunk == ''))
+        return imported
+
+    def dataset(self):
+        return ds.dataset(self.path, format='parquet', schema=self.schema.append(
+            pa.field(PARTITION_COLUMN, pa.string())), partitioning=self.partitioning)
+
+    def read_created_since(self, since, columns=None):
+        """Returns leads created at or after ``since`` (aware datetime) as a DataFrame.
+
+        Only partitions with fetch_date on or after since's UTC date are read,
+        and only ``columns`` (default: all) are loaded. message_sent reflects
+        the latest change recorded with append_statuses.
+        """
+        columns = list(columns or self.columns)
+        if not self.exists():
+            return pd.DataFrame(columns=columns)
+        since = pd.Timestamp(since).tz_convert('UTC')
+        expression = (
+            (ds.field(PARTITION_COLUMN) >= since.date().isoformat())
+            & (ds.field('created_time') >= pa.scalar(since.to_pydatetime(), type=pa.timestamp('us', tz='UTC')))
+        )
+        overlay = 'message_sent' in columns
+        read_columns = columns + ['id'] if overlay and 'id' not in columns else columns
+        frame = self.dataset().to_table(columns=read_columns, filter=expression).to_pandas()
+        if overlay:
+            statuses = self.read_statuses(frame['id'].dropna().unique())
+            if statuses:
+                changed = frame['id'].isin(statuses.keys())
+                frame.loc[changed, 'message_sent'] = frame.loc[changed, 'id'].map(statuses)
+        return frame[columns]
@@ -0,0 +1,316 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+LEAD_COLUMNS = [
+    'id', 'first_name', 'last_name', 'email', 'phone',
+    'lead_source', 'referral_code', 'referral_status', 'record_status',
+    'created_time', 'modified_time', 'fetched_at', 'message_sent'
+]
+
+# SQLite caps the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    id TEXT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    phone TEXT,
+    lead_source TEXT,
+    referral_code TEXT,
+    referral_status TEXT,
+    record_status TEXT,
+    created_time TEXT,
+    modified_time TEXT,
+    fetched_at TEXT,
+    message_sent TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(phone);
+CREATE INDEX IF NOT EXISTS idx_leads_created_time ON leads(created_time);
+CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(lower(email));
+CREATE INDEX IF NOT EXISTS idx_leads_phone_block ON leads(substr(phone, -10));
+
+CREATE TABLE IF NOT EXISTS drip (
+    phone TEXT PRIMARY KEY,
+    lead_id TEXT,
+    next_step INTEGER,
+    next_send_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_drip_next_send_at ON drip(next_send_at);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _chunks(values, size=SQLITE_MAX_PARAMS):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class LeadStore:
+    """Single-file SQLite store for processed leads and the WhatsApp drip queue."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
+
+    # --- Meta ---
+
+    def get_meta(self, key):
+        """Returns a value from the meta table, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def set_meta(self, key, value):
+        """Stores a value in the meta table."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO meta(key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    # --- Leads ---
+
+    def count_leads(self):
+        """Returns the number of stored leads."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def upsert_leads(self, rows):
+        """Inserts or updates lead rows (dicts) in one transaction."""
+        return self.upsert_lead_values(
+            tuple('' if row.get(col) is None else str(row.get(col)) for col in LEAD_COLUMNS)
+            for row in rows
+        )
+
+    def upsert_lead_values(self, values):
+        """Inserts or updates lead rows given as tuples in LEAD_COLUMNS order."""
+        values = [value for value in values if value[0] not in (None, '')]
+        if not values:
+            return 0
+        placeholders = ', '.join('?' for _ in LEAD_COLUMNS)
+        updates = ', '.join(f"{col} = excluded.{col}" for col in LEAD_COLUMNS if col != 'id')
+        sql = (
+            f"INSERT INTO leads({', '.join(LEAD_COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}"
+        )
+        with self.lock, self.conn:
+            self.conn.executemany(sql, values)
+        return len(values)
+
+    def get_lead_ids(self):
+        """Returns the set of all stored lead IDs."""
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT id FROM leads")}
+
+    def get_existing_ids(self, lead_ids):
+        """Returns which of the given lead IDs are already stored."""
+        existing = set()
+        with self.lock:
+            for chunk in _chunks({str(lead_id) for lead_id in lead_ids}):
+                placeholders = ', '.join('?' for _ in chunk)
+                rows = self.conn.execute(f"SELECT id FROM leads WHERE id IN ({placeholders})", chunk)
+                existing.update(row[0] for row in rows)
+        return existing
+
+    def has_phone(self, phone):
+        """Returns True if any stored lead has this phone number."""
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM leads WHERE phone = ? LIMIT 1", (phone,)).fetchone()
+        return row is not None
+
+    def find_contacts(self, lead_ids=(), phones=(), emails=(), phone_blocks=()):
+        """Returns (id, phone, email, first_name) of stored leads matching any given key.
+
+        Emails are matched case-insensitively and ``phone_blocks`` against the
+        last 10 digits of the phone, each through its own index.
+        """
+        lookups = [
+            ("id", {str(value) for value in lead_ids if value}),
+            ("phone", {value for value in phones if value}),
+            ("lower(email)", {value.lower() for value in emails if value}),
+            ("substr(phone, -10)", {value for value in phone_blocks if value}),
+        ]
+        found = {}
+        with self.lock:
+            for expression, values in lookups:
+                for chunk in _chunks(values):
+                    placeholders = ', '.join('?' for _ in chunk)
+                    rows = self.conn.execute(
+                        f"SELECT id, phone, email, first_name FROM leads WHERE {expression} IN ({placeholders})",
+                        chunk
+                    )
+                    found.update((row[0], tuple(row)) for row in rows)
+        return list(found.values())
+
+    def get_leads_created_since(self, created_after):
+        """Returns leads whose created_time sorts at or after the given ISO string."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM leads WHERE created_time >= ? ORDER BY created_time", (created_after,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def update_message_status(self, statuses):
+        """Sets message_sent for (lead_id, status) pairs in one transaction."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE leads SET message_sent = ? WHERE id = ?",
+                [(status, str(lead_id)) for lead_id, status in statuses]
+            )
+
+    # --- Drip queue ---
+
+    def _drip_row(self, entry):
+        # The next_send_at column is when the entry is next due: its retry time after a failed send
+        return (
+            entry.get('phone'),
+            str(entry.get('lead_id', '')),
+            entry.get('next_step'),
+            entry.get('next_retry_at') or entry.get('next_send_at'),
+            # next_send_ts is a cache derived from next_send_at on load; never persist it
+            json.dumps({key: value for key, value in entry.items() if key != 'next_send_ts'}),
+        )
+
+    def load_drip_entries(self):
+        """Returns every drip entry."""
+        with self.lock:
+            rows = self.conn.execute("SELECT data FROM drip ORDER BY next_send_at").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_due_drip_entries(self, now_iso):
+        """Returns drip entries due at or before now_iso, using the next_send_at index."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT data FROM drip WHERE next_send_at <= ? ORDER BY next_send_at",
+                (now_iso,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_unscheduled_drip_entries(self):
+        """Returns drip entries without a next_send_at (never returned as due)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT data FROM drip WHERE next_send_at IS NULL").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_next_drip_send_at(self):
+        """Returns the earliest next_send_at in the drip queue, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT MIN(next_send_at) FROM drip").fetchone()
+        return row[0]
+
+    def count_drip_sends_by_hour(self, from_hour):
+        """Returns {"YYYY-MM-DDTHH": queued drip sends} for the hours from ``from_hour`` on."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT substr(next_send_at, 1, 13), COUNT(*) FROM drip WHERE next_send_at >= ? GROUP BY 1",
+                (from_hour,)
+            ).fetchall()
+        return dict(rows)
+
+    def get_queued_drip_phones(self, phones):
+        """Returns which of the given phones already have a drip entry."""
+        queued = set()
+        with self.lock:
+            for chunk in _chunks(set(phones)):
+                placeholders = ', '.join('?' for _ in chunk)
+                rows = self.conn.execute(f"SELECT phone FROM drip WHERE phone IN ({placeholders})", chunk)
+                queued.update(row[0] for row in rows)
+        return queued
+
+    def add_drip_entries(self, entries):
+        """Adds drip entries, ignoring phones already queued. Returns the number added."""
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO drip(phone, lead_id, next_step, next_send_at, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._drip_row(entry) for entry in entries if entry.get('phone')]
+            )
+            return self.conn.total_changes - before
+
+    def upsert_drip_entries(self, entries, removed=None):
+        """Writes changed drip entries and deletes removed ones in one transaction."""
+        with self.lock, self.conn:
+            if entries:
+                self.conn.executemany(
+                    "INSERT INTO drip(phone, lead_id, next_step, next_send_at, data) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(phone) DO UPDATE SET lead_id = excluded.lead_id, "
+                    "next_step = excluded.next_step, next_send_at = excluded.next_send_at, "
+                    "data = excluded.data",
+                    [self._drip_row(entry) for entry in entries if entry.get('phone')]
+                )
+            if removed:
+                self.conn.executemany(
+                    "DELETE FROM drip WHERE phone = ?",
+                    [(entry.get('phone'),) for entry in removed if entry.get('phone')]
+                )
+
+    def count_drip_entries(self):
+        """Returns the number of queued drip entries."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM drip").fetchone()[0]
+
+    # --- One-time import ---
+
+    def import_from_files(self, csv_path, drip_path):
+        """Imports the legacy CSV and drip JSON once. Returns (leads, drip entries) imported."""
+        if self.get_meta('imported_at'):
+            return 0, 0
+
+        lead_rows = []
+        if os.path.exists(csv_path):
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('message_sent') in (None, ''):
+                        row['message_sent'] = 'No'
+                    lead_rows.append(row)
+
+        drip_entries = []
+        if os.path.exists(drip_path):
+            with open(drip_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                # Campaigns have any number of steps, so finished entries are only
+                # recognised (and removed) by the first drip run
+                drip_entries = [entry for entry in data if isinstance(entry, dict)]
+
+        leads_imported = self.upsert_leads(lead_rows)
+        drip_imported = self.add_drip_entries(drip_entries)
+
+        self.set_meta('imported_at', datetime.now().isoformat())
+        return leads_imported, drip_imported
+
+
+if __name__ == "__main__":
+    from lead_automation import LEADS_CSV_FILE, LEADS_DB_FILE, WHATSAPP_DRIP_FILE
+
+    store = LeadStore(LEADS_DB_FILE)
+    leads_imported, drip_imported = store.import_from_files(LEADS_CSV_FILE, WHATSAPP_DRIP_FILE)
+    print(f"✅ Imported {leads_imported} leads and {drip_imported} drip entries into {LEADS_DB_FILE}")
+    print(f"📊 {store.count_leads()} leads, {store.count_drip_entries()} drip entries stored")
+    store.close()
@@ -0,0 +1,180 @@
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (self.max,), self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'p50': round(p50, 6) if p50 is not None else None,
+            'p95': round(p95, 6) if p95 is not None else None,
+            'max': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self.counts)},
+        }
+
+
+class Metrics:
+    """Thread-safe stage timers, counters and latency histograms for one or more runs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}
+        self.timers = {}  # name -> [total seconds, calls]
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        """Adds value to a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Records one observation (seconds) in a latency histogram."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def add_time(self, name, seconds):
+        """Adds one timed call to a stage timer."""
+        with self.lock:
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += 1
+
+    @contextmanager
+    def timer(self, name):
+        """Times the enclosed block as stage ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def merge(self, other):
+        """Adds another Metrics' totals into this one (e.g. a run into process totals)."""
+        with self.lock, other.lock:
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (seconds, calls) in other.timers.items():
+                timer = self.timers.setdefault(name, [0.0, 0])
+                timer[0] += seconds
+                timer[1] += calls
+            for name, histogram in other.histograms.items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(histogram.buckets)
+                self.histograms[name].merge(histogram)
+
+    def to_dict(self):
+        """Returns a JSON-serialisable report."""
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'stages': {
+                    name: {'seconds': round(seconds, 6), 'calls': calls}
+                    for name, (seconds, calls) in self.timers.items()
+                },
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def prometheus_text(self, prefix='lead_automation'):
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+            if self.timers:
+                seconds_metric = f"{prefix}_stage_seconds_total"
+                calls_metric = f"{prefix}_stage_calls_total"
+                lines.append(f"# TYPE {seconds_metric} counter")
+                lines += [f'{seconds_metric}{{stage="{name}"}} {seconds:.6f}'
+                          for name, (seconds, _) in sorted(self.timers.items())]
+                lines.append(f"# TYPE {calls_metric} counter")
+                lines += [f'{calls_metric}{{stage="{name}"}} {calls}'
+                          for name, (_, calls) in sorted(self.timers.items())]
+
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}_{_metric_name(name)}"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{metric}_sum {histogram.sum:.6f}", f"{metric}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def start_metrics_server(get_metrics, port, host='0.0.0.0'):
+    """Serves ``get_metrics().prometheus_text()`` at /metrics on a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = get_metrics().prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"📈 Prometheus metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** max(attempt, 0))))
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def request_may_have_been_sent(error):
+    """Whether a request that raised ``error`` may have reached the server.
+
+    Only failures to connect (connect timeout, refused connection, DNS, TLS
+    handshake, proxy) and requests that could not be built are known not to
+    have gone out; a read timeout or a connection reset mid-request is
+    ambiguous, and so is any other error.
+    """
+    if isinstance(error, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError,
+                          requests.exceptions.ProxyError, requests.exceptions.InvalidURL,
+                          requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema,
+                          requests.exceptions.InvalidHeader)):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return not isinstance(reason, NewConnectionError)
+    return True
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of making a request while a provider's circuit is open."""
+
+    def __init__(self, name, retry_at):
+        super().__init__(f"{name} circuit open, retrying after {datetime.fromtimestamp(retry_at).isoformat()}")
+        self.retry_at = retry_at
+
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker for one provider.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests are refused for ``reset_timeout`` seconds. Then a single trial
+    request is let through (half-open): success closes the circuit, failure
+    opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = float(reset_timeout)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def retry_at(self):
+        """Epoch time the circuit will next let a request through."""
+        with self.lock:
+            return self.opened_at + self.reset_timeout if self.state == OPEN else time.time()
+
+    def allow(self):
+        """Returns True if a request may be made now."""
+        with self.lock:
+            if self.state == OPEN and time.time() >= self.opened_at + self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"✅ {self.name} circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                print(f"🔌 {self.name} circuit open after {self.failures} failure(s); "
+                      f"pausing requests for {self.reset_timeout:g}s")
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.trial_in_flight = False
+
+
+class ResilientClient:
+    """Wraps a requests session with bounded retries and a circuit breaker.
+
+    Connection errors, 429 and 5xx responses are retried up to
+    ``max_retries`` times with full-jitter exponential backoff, or after the
+    server's ``Retry-After`` when it sends one (if that is no longer than
+    ``retry_after_max``; otherwise the response is returned to the caller).
+    Requests that are not idempotent (``idempotent=False``, e.g. a WhatsApp
+    send) are only retried when the server cannot have acted on them: a
+    failure to connect (see request_may_have_been_sent), 429 or 503.
+
+    ``on_throttle(seconds)`` is called for every 429 that carries a
+    Retry-After, and ``on_event(name)`` for every ``retry``, ``throttled`` and
+    ``circuit_open`` event. ``rate_limiter`` is acquired before each retry.
+    """
+
+    def __init__(self, session, breaker, max_retries=3, backoff_base=0.5, backoff_max=30.0,
+                 retry_after_max=60.0, rate_limiter=None, on_throttle=None, on_event=None):
+        self.session = session
+        self.breaker = breaker
+        self.max_retries = max(int(max_retries), 0)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.rate_limiter = rate_limiter
+        self.on_throttle = on_throttle
+        self.on_event = on_event or (lambda name: None)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, idempotent=True, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        """Makes the request, retrying as described above. Returns the final response.
+
+        Raises CircuitOpenError while the circuit is open, or the last
+        requests exception once retries are used up.
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.on_event('circuit_open')
+                raise CircuitOpenError(self.breaker.name, self.breaker.retry_at())
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                retryable = idempotent or not request_may_have_been_sent(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            else:
+                status = response.status_code
+                if status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+                retryable = status in (429, 503) or (idempotent and status >= 500)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if status == 429:
+                    self.on_event('throttled')
+                    if retry_after is not None and self.on_throttle:
+                        self.on_throttle(retry_after)
+                if retry_after is not None and retry_after > self.retry_after_max:
+                    return response
+                delay = retry_after if retry_after is not None else \
+                    backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                response.close()
+
+            self.on_event('retry')
+            time.sleep(delay)
+            attempt += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
@@ -1,19 +1,88 @@
+import os
+import signal
+import threading
 import time
-import schedule
+import traceback
 
 from lead_automation import LeadAutomation
+from metrics import start_metrics_server
 
+POLL_INTERVAL_MINUTES = float(os.getenv('POLL_INTERVAL_MINUTES', '2'))  # Zoho poll interval
+MIN_SLEEP_SECONDS = 1
+METRICS_PORT = int(os.getenv('METRICS_PORT') or 0)  # Serve Prometheus /metrics on this port when set
+ERROR_BACKOFF_SECONDS = float(os.getenv('ERROR_BACKOFF_SECONDS', '30'))  # Wait after a failed cycle, doubled per failure
+ERROR_BACKOFF_MAX_SECONDS = float(os.getenv('ERROR_BACKOFF_MAX_SECONDS', '1800'))  # Longest wait after failures
 
-def run_once():
-    automation = LeadAutomation()
+
+def run_once(automation):
     automation.run_automation()
 
 
+def run_daemon(automation, poll_interval=POLL_INTERVAL_MINUTES * 60, stop_event=None):
+    """Runs the automation until stop_event is set.
+
+    The same LeadAutomation (tokens, lead index, drip heap, HTTP pools) is kept
+    for the life of the process. Instead of a fixed tick, it sleeps until the
+    next Zoho poll or the next drip send time, whichever comes first.
+
+    A cycle that raises is logged and counted (``daemon_cycle_errors``), and
+    the loop waits with exponential backoff before trying again.
+    """
+    stop_event = stop_event or threading.Event()
+    next_poll = time.time()
+    failures = 0
+
+    while not stop_event.is_set():
+        now = time.time()
+        try:
+            if now >= next_poll:
+                run_once(automation)
+                # Keep the Zoho access token fresh between cycles
+                automation.start_token_refresher()
+                next_poll = time.time() + poll_interval
+            else:
+                # Woken early for a drip send
+                automation.run_drip_queue()
+            failures = 0
+        except Exception as e:
+            failures += 1
+            automation.metrics_total.inc('daemon_cycle_errors')
+            traceback.print_exc()
+            delay = min(ERROR_BACKOFF_SECONDS * 2 ** (failures - 1), ERROR_BACKOFF_MAX_SECONDS)
+            print(f"❌ Cycle failed ({failures} in a row): {e}; retrying in {delay:.0f}s")
+            stop_event.wait(delay)
+            continue
+
+        wake_at = next_poll
+        drip_due = automation.next_drip_due_ts()
+        # Failed sends are rescheduled with backoff, so entries still due could not
+        # be sent at all (e.g. no campaign configured); leave them for the next poll
+        if drip_due is not None and drip_due > time.time():
+            wake_at = min(wake_at, drip_due)
+        delay = max(wake_at - time.time(), MIN_SLEEP_SECONDS)
+        print(f"💤 Sleeping {delay:.0f}s until the next {'poll' if wake_at == next_poll else 'drip send'}")
+        stop_event.wait(delay)
+
+
 if __name__ == "__main__":
-    # Run once on startup, then every 2 minutes.
-    run_once()
-    schedule.every(2).minutes.do(run_once)
+    # One instance for the life of the process so the HTTP connection pools
+    # (and their keep-alive connections) are reused across cycles.
+    automation = LeadAutomation()
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        # Let the current cycle finish; the loop exits before the next one
+        print(f"\n🛑 Received signal {signum}, shutting down after the current cycle...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    if METRICS_PORT:
+        start_metrics_server(lambda: automation.metrics_total, METRICS_PORT)
 
-    while True:
-        schedule.run_pending()
-        time.sleep(30)
+    try:
+        run_daemon(automation, stop_event=stop_event)
+    finally:
+        automation.close()
+        print("👋 Scheduler stopped")
@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    lead_id TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    campaign TEXT NOT NULL,
+    phone TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    detail TEXT,
+    next_retry_at TEXT,
+    PRIMARY KEY (lead_id, step, campaign)
+);
+"""
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+UNKNOWN = 'unknown'  # The request may or may not have reached the provider
+
+# Results of SendLedger.claim
+CLAIMED = 'claimed'
+ALREADY_SENT = 'already_sent'
+IN_FLIGHT = 'in_flight'
+BACKING_OFF = 'backing_off'
+UNCONFIRMED = 'unconfirmed'
+
+
+class SendLedger:
+    """Idempotency ledger of WhatsApp sends keyed on (lead_id, step, campaign).
+
+    A send must be claimed before it goes out. Claiming is atomic across
+    processes (SQLite ``BEGIN IMMEDIATE``), so overlapping runs and retries
+    can never send the same step to the same lead twice. A failed send can
+    carry a ``next_retry_at``, before which it is not claimed again. A send
+    whose outcome is UNKNOWN (e.g. a read timeout) is never claimed again.
+    """
+
+    def __init__(self, path, pending_timeout_minutes=60):
+        self.path = path
+        self.pending_timeout = timedelta(minutes=pending_timeout_minutes)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sends)")}
+        if 'next_retry_at' not in columns:  # Ledgers created before retry backoff
+            self.conn.execute("ALTER TABLE sends ADD COLUMN next_retry_at TEXT")
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
+
+    def claim(self, lead_id, step, campaign, phone=None):
+        """Marks a send as pending and says whether the caller may send it.
+
+        Returns CLAIMED (go ahead), ALREADY_SENT (treat as delivered),
+        IN_FLIGHT (another run is sending it), BACKING_OFF (it failed and
+        its next_retry_at has not passed) or UNCONFIRMED (an earlier attempt
+        may have been delivered; resending could duplicate it). A pending claim older than the
+        pending timeout is assumed abandoned by a crashed run and re-claimed.
+        """
+        key = (str(lead_id), int(step), campaign)
+        now = datetime.now()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT status, updated_at, next_retry_at FROM sends "
+                    "WHERE lead_id = ? AND step = ? AND campaign = ?",
+                    key
+                ).fetchone()
+
+                if row:
+                    status, updated_at, next_retry_at = row
+                    if status == SENT:
+                        self.conn.execute("COMMIT")
+                        return ALREADY_SENT
+                    if status == UNKNOWN:
+                        self.conn.execute("COMMIT")
+                        return UNCONFIRMED
+                    if status == PENDING and now - datetime.fromisoformat(updated_at) < self.pending_timeout:
+                        self.conn.execute("COMMIT")
+                        return IN_FLIGHT
+                    if status == FAILED and next_retry_at and now.isoformat() < next_retry_at:
+                        self.conn.execute("COMMIT")
+                        return BACKING_OFF
+
+                self.conn.execute(
+                    "INSERT INTO sends(lead_id, step, campaign, phone, status, attempts, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?) "
+                    "ON CONFLICT(lead_id, step, campaign) DO UPDATE SET status = excluded.status, "
+                    "phone = excluded.phone, updated_at = excluded.updated_at",
+                    key + (phone, PENDING, now.isoformat())
+                )
+                self.conn.execute("COMMIT")
+                return CLAIMED
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def record(self, lead_id, step, campaign, status, detail=None, next_retry_at=None, attempted=True):
+        """Records the outcome (SENT, FAILED or UNKNOWN) of a claimed send.
+
+        ``next_retry_at`` (ISO time) holds a failed send back until then.
+        ``attempted`` is False for a claim that was deferred without the
+        request going out, which does not count as an attempt.
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE sends SET status = ?, updated_at = ?, detail = ?, next_retry_at = ?, "
+                "attempts = attempts + ? "
+                "WHERE lead_id = ? AND step = ? AND campaign = ?",
+                (status, datetime.now().isoformat(), detail, next_retry_at, int(bool(attempted)),
+                 str(lead_id), int(step), campaign)
+            )
+
+    def get_attempts(self, lead_id, step, campaign):
+        """Returns how many times a send has actually been made."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT attempts FROM sends WHERE lead_id = ? AND step = ? AND campaign = ?",
+                (str(lead_id), int(step), campaign)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_status(self, lead_id, step, campaign):
+        """Returns the recorded status for a send, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM sends WHERE lead_id = ? AND step = ? AND campaign = ?",
+                (str(lead_id), int(step), campaign)
+            ).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,137 @@
+import json
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class StateFileError(Exception):
+    """Raised when a state file exists but neither it nor its backup can be read."""
+
+
+def backup_path(path):
+    """Returns the path of the previous-generation copy of a state file."""
+    return f"{path}.bak"
+
+
+def _fsync_directory(path):
+    if os.name != 'posix':
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path, mode='w', encoding='utf-8', newline=None, backup=False):
+    """Opens a temp file next to ``path`` and swaps it in when the block succeeds.
+
+    The data is fsynced before an atomic rename, so readers only ever see the
+    old or the new file. With ``backup=True`` the old file is kept as ``.bak``.
+    If the block raises, the temp file is removed and ``path`` is untouched.
+
+    The temp file gets a unique name (mkstemp), so concurrent writers never
+    share or truncate each other's temp file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.')
+    binary = 'b' in mode
+    try:
+        f = os.fdopen(fd, mode, **({} if binary else {'encoding': encoding, 'newline': newline}))
+    except BaseException:
+        os.close(fd)
+        os.remove(temp_path)
+        raise
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        if os.path.exists(path):
+            # mkstemp creates the file 0600; keep the permissions of the file being replaced
+            os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+        if backup and os.path.exists(path):
+            os.replace(path, backup_path(path))
+        os.replace(temp_path, path)
+        _fsync_directory(path)
+    except BaseException:
+        f.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=2, backup=False):
+    """Writes JSON to ``path`` atomically."""
+    with atomic_open(path, 'w', backup=backup) as f:
+        json.dump(data, f, indent=indent)
+
+
+def read_json(path, default=None):
+    """Reads a JSON state file, falling back to its ``.bak`` generation.
+
+    Returns ``default`` when neither file exists and raises StateFileError when
+    a file exists but cannot be parsed, so callers never mistake a corrupted
+    file for an empty one.
+    """
+    errors = []
+    for candidate in (path, backup_path(path)):
+        if not os.path.exists(candidate):
+            continue
+        try:
+            with open(candidate, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            errors.append(f"{candidate}: {e}")
+            continue
+        if candidate != path:
+            print(f"⚠️ {path} unreadable, recovered from {candidate}")
+        return data
+
+    if errors:
+        raise StateFileError("; ".join(errors))
+    return default
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Holds an advisory lock on ``path`` (created if missing).
+
+    Yields True once the lock is held. With ``blocking=False`` it yields False
+    immediately if another process holds it.
+    """
+    f = open(path, 'a+')
+    locked = False
+    try:
+        if fcntl:
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(f.fileno(), flags)
+                locked = True
+            except BlockingIOError:
+                locked = False
+        else:
+            f.seek(0)
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                locked = True
+            except OSError:
+                locked = False
+        yield locked
+    finally:
+        if locked:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        f.close()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+# lead_automation reads its configuration from the environment at import time,
+# so it is only imported inside the worker, after the tenant's env is applied.
+
+TENANT_WORKERS = int(os.getenv('TENANT_WORKERS') or 0) or os.cpu_count() or 1
+
+# Process settings a worker keeps from the runner; every other setting comes from the tenant's env
+TENANT_INHERITED_ENV = [
+    'PATH', 'HOME', 'LANG', 'LC_ALL', 'TZ', 'TMPDIR', 'SYSTEMROOT',
+    'SSL_CERT_FILE', 'REQUESTS_CA_BUNDLE', 'HTTP_PROXY', 'HTTPS_PROXY', 'NO_PROXY',
+]
+TENANT_REQUIRED_ENV = [
+    'ZOHO_CLIENT_ID', 'ZOHO_CLIENT_SECRET', 'ZOHO_REFRESH_TOKEN', 'ZOHO_API_DOMAIN',
+    'AISENSY_API_KEY', 'TARGET_LEAD_SOURCES',
+]
+# The built-in drip campaign; not needed when the tenant has its own drip campaigns file
+TENANT_DRIP_ENV = ['WHATSAPP_DRIP_CAMPAIGN'] + [
+    f'AISENSY_{kind}_T{step}' for kind in ('CAMPAIGN', 'MEDIA') for step in range(1, 6)
+]
+DRIP_CAMPAIGNS_FILE_DEFAULT = "drip_campaigns.json"  # lead_automation's default, looked up in the state_dir
+
+
+def load_tenants(config_path):
+    """Loads the tenant list, resolving each state_dir relative to the config file.
+
+    The config is a JSON list of objects with ``name``, ``state_dir`` and
+    ``env`` (the environment variables that configure that tenant).
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        tenants = json.load(f)
+    if not isinstance(tenants, list):
+        raise ValueError(f"{config_path} must contain a JSON list of tenants")
+
+    base_dir = os.path.dirname(os.path.abspath(config_path))
+    names = set()
+    for tenant in tenants:
+        name = tenant.get('name')
+        if not name or name in names:
+            raise ValueError(f"Every tenant needs a unique name (got {name!r})")
+        names.add(name)
+        tenant['state_dir'] = os.path.join(base_dir, tenant.get('state_dir') or name)
+        tenant['env'] = {key: str(value) for key, value in (tenant.get('env') or {}).items()}
+    return tenants
+
+
+def missing_tenant_env(tenant):
+    """Returns the required settings a tenant's env leaves unset or empty.
+
+    Nothing falls back to the runner's environment, .env or the built-in
+    (Erickson) defaults, so every credential and template must be given.
+    """
+    env = tenant['env']
+    required = list(TENANT_REQUIRED_ENV)
+    campaigns_file = env.get('DRIP_CAMPAIGNS_FILE') or DRIP_CAMPAIGNS_FILE_DEFAULT
+    if not os.path.exists(os.path.join(tenant['state_dir'], campaigns_file)):
+        required += TENANT_DRIP_ENV
+    return [key for key in required if not env.get(key, '').strip()]
+
+
+def tenant_environ(tenant, parent_environ=None):
+    """The complete environment of a tenant's worker: a few process settings plus the tenant's env."""
+    parent_environ = os.environ if parent_environ is None else parent_environ
+    environ = {key: parent_environ[key] for key in TENANT_INHERITED_ENV if key in parent_environ}
+    environ.update(tenant['env'])
+    environ['LOAD_DOTENV'] = 'false'
+    return environ
+
+
+def run_tenant(tenant):
+    """Runs one automation cycle for a tenant in this (fresh) worker process."""
+    started = time.time()
+    environ = tenant_environ(tenant)
+    os.environ.clear()
+    os.environ.update(environ)
+    os.makedirs(tenant['state_dir'], exist_ok=True)
+    os.chdir(tenant['state_dir'])
+
+    result = {'name': tenant['name'], 'ok': False}
+    try:
+        from lead_automation import RUN_REPORT_FILE, LeadAutomation
+
+        automation = LeadAutomation()
+        try:
+            completed = automation.run_automation()
+        finally:
+            automation.close()
+
+        if os.path.exists(RUN_REPORT_FILE):
+            with open(RUN_REPORT_FILE, 'r', encoding='utf-8') as f:
+                result['counters'] = json.load(f).get('counters', {})
+        result['ok'] = completed
+        if not completed:
+            result['error'] = "run skipped or no valid Zoho token"
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = round(time.time() - started, 2)
+    return result
+
+
+def run_tenants(tenants, workers=TENANT_WORKERS):
+    """Runs every tenant in a process pool. Returns the results as they finish.
+
+    Each task gets a fresh spawned process (``maxtasksperchild=1``). Every tenant
+    therefore has its own module configuration, state directory, tokens and
+    send rate limiter, and a slow tenant only ties up its own worker. A tenant
+    missing a required setting fails without being started.
+    """
+    results = []
+    runnable = []
+    for tenant in tenants:
+        missing = missing_tenant_env(tenant)
+        if missing:
+            result = {'name': tenant['name'], 'ok': False, 'seconds': 0,
+                      'error': f"missing required settings: {', '.join(missing)}"}
+            print(f"🏢 {result['name']}: ❌ {result['error']}")
+            results.append(result)
+        else:
+            runnable.append(tenant)
+    if not runnable:
+        return results
+
+    context = multiprocessing.get_context('spawn')
+    workers = max(1, min(workers, len(runnable)))
+    with context.Pool(processes=workers, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(run_tenant, runnable):
+            status = "✅" if result['ok'] else f"❌ {result.get('error')}"
+            print(f"🏢 {result['name']}: {status} ({result['seconds']}s)")
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the lead automation for several tenants in parallel")
+    parser.add_argument('config', help="JSON file with the tenant list (see tenants.example.json)")
+    parser.add_argument('--workers', type=int, default=TENANT_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument('--only', help="comma-separated tenant names to run")
+    args = parser.parse_args()
+
+    tenants = load_tenants(args.config)
+    if args.only:
+        wanted = set(args.only.split(','))
+        tenants = [tenant for tenant in tenants if tenant['name'] in wanted]
+
+    print(f"🚀 Running {len(tenants)} tenant(s) on up to {min(args.workers, len(tenants)) or 1} worker(s)...")
+    results = run_tenants(tenants, args.workers) if tenants else []
+    failed = [result['name'] for result in results if not result['ok']]
+    print(f"🎉 {len(results) - len(failed)} tenant(s) succeeded, {len(failed)} failed")
+    raise SystemExit(1 if failed else 0)
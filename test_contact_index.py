@@ -0,0 +1,60 @@
+import csv
+
+from contact_index import ContactIndex, email_key, phone_block_key, phone_key
+from lead_automation import LEADS_CSV_FILE
+
+
+def test_keys_normalize_phones_and_emails():
+    assert phone_key('+919876543210') == '919876543210'
+    assert phone_key('+91 98765-43210') == '919876543210'
+    assert phone_block_key('+919876543210') == '9876543210'
+    assert phone_block_key('+1234') is None
+    assert email_key(' Asha@Example.COM ') == 'asha@example.com'
+    assert email_key('not-an-email') is None
+
+
+def test_any_shared_key_is_the_same_contact():
+    index = ContactIndex()
+    assert index.add('1', phone='+919876543210', email='asha@example.com') == '1'
+    assert index.match(lead_id='1') == ('1', 'id')
+    assert index.match(lead_id='2', phone='+919876543210') == ('1', 'phone')
+    assert index.match(lead_id='3', email='ASHA@example.com') == ('1', 'email')
+    assert index.match(lead_id='4', phone='+919999999999', email='ravi@example.com') is None
+
+    # A lead matched on email joins the contact, so its phone now matches too
+    assert index.add('5', phone='+918888888888', email='asha@example.com') == '1'
+    assert index.match(phone='+918888888888') == ('1', 'phone')
+    assert len(index) == 2
+
+
+def test_near_duplicates_need_the_option_and_a_similar_name():
+    exact = ContactIndex()
+    exact.add('1', phone='+919876543210', name='Asha')
+    assert exact.match(phone='+9876543210', name='Asha') is None
+
+    fuzzy = ContactIndex(near_duplicates=True)
+    fuzzy.add('1', phone='+919876543210', name='Asha')
+    assert fuzzy.match(phone='+9876543210', name='asha.') == ('1', 'near_phone')
+    assert fuzzy.match(phone='+9876543210', name='Ravi') is None
+
+
+def test_template_1_goes_once_per_contact(make_automation, monkeypatch):
+    automation = make_automation(TARGET_LEAD_SOURCES=['Form Submission'])
+    with open(LEADS_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=automation.leads_csv_headers)
+        writer.writeheader()
+        writer.writerow({'id': '100', 'email': 'old@example.com', 'phone': '+917777777777', 'message_sent': 'Yes'})
+
+    sent = []
+    monkeypatch.setattr(automation, 'post_aisensy_payload',
+                        lambda payload: sent.append(payload['destination']) or {'status': 'success'})
+
+    lead = {'Lead_Source': 'Form Submission', 'First_Name': 'Asha'}
+    automation.send_welcome_messages_to_new_leads([
+        dict(lead, id='1', Phone='9876543210'),
+        dict(lead, id='2', Mobile='+91 98765 43210'),  # Same phone, second form
+        dict(lead, id='3', Phone='9123456789', Email='OLD@example.com'),  # Known contact by email
+        dict(lead, id='4', Phone='9000000000'),
+    ])
+
+    assert sorted(sent) == ['+919000000000', '+919876543210']
@@ -0,0 +1,109 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from lead_automation import DRIP_CAMPAIGNS_FILE, WHATSAPP_DRIP_FILE
+
+CAMPAIGNS = {
+    'default_campaign': 'Drip',
+    'campaigns': [{
+        'name': 'Drip',
+        'steps': [
+            {'campaign': 'T1', 'media_url': 'https://example.com/t1.png'},
+            {'campaign': 'T2', 'media_url': 'https://example.com/t2.png', 'offset': {'days': 1},
+             'next': {'Youtube Ads': 3, 'default': None}},
+            {'campaign': 'T3', 'media_url': 'https://example.com/t3.png', 'offset': {'days': 3}},
+        ],
+    }],
+}
+
+
+def entry(lead_id, step, lead_source, due_in):
+    now = datetime.now()
+    return {
+        'phone': f'+9198765000{lead_id}', 'lead_id': lead_id, 'first_name': f'Lead {lead_id}',
+        'lead_source': lead_source, 'drip_campaign': 'Drip',
+        't1_sent_at': (now - timedelta(days=2)).isoformat(),
+        'next_step': step, 'next_send_at': (now + due_in).isoformat(),
+    }
+
+
+def stored_entries(automation):
+    if automation.store:
+        entries = automation.store.load_drip_entries()
+    else:
+        with open(WHATSAPP_DRIP_FILE, encoding='utf-8') as f:
+            entries = json.load(f)
+    return {entry['lead_id']: entry for entry in entries}
+
+
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_due_entries_go_out_in_one_dispatch_grouped_by_step(make_automation, monkeypatch, tmp_path, backend):
+    (tmp_path / DRIP_CAMPAIGNS_FILE).write_text(json.dumps(CAMPAIGNS))
+    due = timedelta(minutes=-1)
+    (tmp_path / WHATSAPP_DRIP_FILE).write_text(json.dumps([
+        entry('11', 2, 'Website', due),
+        entry('12', 2, 'Youtube Ads', due),
+        entry('13', 3, 'Youtube Ads', due),
+        entry('14', 2, 'Website', timedelta(days=1)),
+    ]))
+    automation = make_automation(STATE_BACKEND=backend, DRIP_HOURLY_CAP=0)
+
+    dispatches = []
+
+    def send_aisensy_messages(payloads, ledger_keys=None):
+        dispatches.append([(payload['campaignName'], key) for payload, key in zip(payloads, ledger_keys)])
+        return [{'status': 'success'} for _ in payloads]
+
+    monkeypatch.setattr(automation, 'send_aisensy_messages', send_aisensy_messages)
+    automation.process_drip_queue()
+
+    assert len(dispatches) == 1
+    assert sorted(dispatches[0]) == [('T2', ('11', 2, 'Drip')), ('T2', ('12', 2, 'Drip')), ('T3', ('13', 3, 'Drip'))]
+    assert automation.metrics.to_dict()['counters']['drip_send_groups'] == 2
+
+    entries = stored_entries(automation)
+    assert sorted(entries) == ['12', '14']  # 11 finished on its branch, 13 after the last step
+    assert entries['12']['next_step'] == 3
+    assert entries['12']['next_campaign'] == 'T3'
+    t1_sent_at = datetime.fromisoformat(entries['12']['t1_sent_at'])
+    assert datetime.fromisoformat(entries['12']['next_send_at']) == t1_sent_at + timedelta(days=3)
+
+    automation.process_drip_queue()
+    assert len(dispatches) == 1  # Nothing else is due
+
+
+def test_failed_sends_stay_on_their_step(make_automation, monkeypatch, tmp_path):
+    (tmp_path / DRIP_CAMPAIGNS_FILE).write_text(json.dumps(CAMPAIGNS))
+    (tmp_path / WHATSAPP_DRIP_FILE).write_text(json.dumps([entry('21', 2, 'Youtube Ads', timedelta(minutes=-1))]))
+    automation = make_automation()
+    monkeypatch.setattr(automation, 'send_aisensy_messages',
+                        lambda payloads, ledger_keys=None: [{'status_code': 500} for _ in payloads])
+
+    automation.process_drip_queue()
+
+    stored = stored_entries(automation)['21']
+    assert stored['next_step'] == 2
+    assert stored['attempts'] == 1
+    assert stored['next_retry_at'] > datetime.now().isoformat()
+
+
+def test_edited_next_send_at_wins_over_a_stale_cached_timestamp(make_automation, monkeypatch, tmp_path):
+    (tmp_path / DRIP_CAMPAIGNS_FILE).write_text(json.dumps(CAMPAIGNS))
+    edited = entry('31', 2, 'Website', timedelta(minutes=-1))
+    edited['next_send_ts'] = (datetime.now() + timedelta(days=1)).timestamp()  # Left over from an older save
+    (tmp_path / WHATSAPP_DRIP_FILE).write_text(json.dumps([edited]))
+    automation = make_automation(DRIP_HOURLY_CAP=0)
+
+    dispatches = []
+
+    def send_aisensy_messages(payloads, ledger_keys=None):
+        dispatches.append(list(ledger_keys))
+        return [{'status_code': 500} for _ in payloads]
+
+    monkeypatch.setattr(automation, 'send_aisensy_messages', send_aisensy_messages)
+    automation.process_drip_queue()
+
+    assert dispatches == [[('31', 2, 'Drip')]]
+    assert 'next_send_ts' not in stored_entries(automation)['31']
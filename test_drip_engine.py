@@ -0,0 +1,104 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from drip_engine import DripCampaign, SendSlots, compile_drip_campaigns, load_drip_engine, parse_offset
+
+
+def campaign_config(**overrides):
+    config = {
+        'name': 'Drip',
+        'steps': [
+            {'campaign': 'T1', 'media_url': 'https://example.com/a%20b.png'},
+            {'campaign': 'T2', 'offset': {'days': 1}},
+            {'campaign': 'T3', 'offset': {'days': 3}},
+        ],
+    }
+    config.update(overrides)
+    return config
+
+
+def with_next(step, next_step):
+    config = campaign_config()
+    config['steps'][step - 1]['next'] = next_step
+    return config
+
+
+def test_steps_compile_into_per_step_tables():
+    campaign = DripCampaign(campaign_config())
+    assert campaign.template(1) == 'T1' and campaign.template(4) == ''
+    assert campaign.step_media(1) == ('https://example.com/a%20b.png', 'a b.png')
+    assert campaign.offsets[2] == 86400
+    assert [campaign.next_step(step) for step in (1, 2, 3)] == [2, 3, None]
+    assert parse_offset({'hours': 2, 'minutes': 30}) == 9000
+
+
+@pytest.mark.parametrize('step, next_step', [
+    (2, 2),
+    (3, 1),
+    (2, {'Youtube Ads': 1, 'default': 3}),
+    (1, 5),
+    (1, '2'),
+    (1, True),
+])
+def test_next_steps_that_loop_or_do_not_exist_are_rejected(step, next_step):
+    with pytest.raises(ValueError):
+        DripCampaign(with_next(step, next_step))
+
+
+def test_forward_branches_by_lead_source():
+    campaign = DripCampaign(with_next(1, {'Youtube Ads': 3, 'default': 2}))
+    assert campaign.next_step(1, 'Youtube Ads') == 3
+    assert campaign.next_step(1, 'Website') == 2
+    assert DripCampaign(with_next(1, 4)).next_step(1) is None  # Past the last step finishes
+
+
+def test_invalid_config_file_fails_to_load(tmp_path):
+    path = tmp_path / 'drip_campaigns.json'
+    path.write_text(json.dumps({'campaigns': [with_next(3, 3)]}))
+    with pytest.raises(ValueError, match='does not move forward'):
+        load_drip_engine(str(path), None)
+
+
+def test_send_windows_move_steps_to_the_next_window():
+    campaign = DripCampaign(campaign_config(send_windows=[['09:00', '13:00'], ['15:00', '20:00']]))
+    day = datetime(2026, 3, 2)
+    assert campaign.shift_into_send_window(day.replace(hour=10)) == day.replace(hour=10)
+    assert campaign.shift_into_send_window(day.replace(hour=13, minute=30)) == day.replace(hour=15)
+    assert campaign.shift_into_send_window(day.replace(hour=22)) == day.replace(hour=9) + timedelta(days=1)
+    assert campaign.send_at(day.replace(hour=21), 2) == day.replace(hour=9) + timedelta(days=2)
+
+
+def test_quiet_hours_cross_midnight():
+    campaign = DripCampaign(campaign_config(quiet_hours=['21:00', '09:00']))
+    day = datetime(2026, 3, 2)
+    assert campaign.shift_into_send_window(day.replace(hour=23)) == day.replace(hour=9) + timedelta(days=1)
+    assert campaign.shift_into_send_window(day.replace(hour=3)) == day.replace(hour=9)
+
+
+def test_send_slots_spread_steps_under_the_hourly_cap():
+    campaign = DripCampaign(campaign_config(tolerance={'hours': 2}))
+    slots = SendSlots(hourly_cap=2)
+    due = datetime(2026, 3, 2, 10, 0)
+    booked = [slots.book(campaign, due) for _ in range(7)]
+    assert booked[:6] == [due + timedelta(minutes=30 * i) for i in range(6)]
+    # Every hour within the tolerance is full: the least booked one takes the overflow
+    assert booked[6].hour in (10, 11, 12)
+    assert sum(slots.counts.values()) == 7
+
+
+def test_lead_sources_pick_the_campaign():
+    engine = compile_drip_campaigns({
+        'default_campaign': 'Drip',
+        'campaigns': [campaign_config(), campaign_config(name='Ads', lead_sources=['Youtube Ads'])],
+    })
+    assert engine.for_lead_source('Youtube Ads').name == 'Ads'
+    assert engine.for_lead_source('Website').name == 'Drip'
+    assert engine.get('unknown').name == 'Drip'
+
+
+def test_example_campaigns_compile():
+    example = os.path.join(os.path.dirname(__file__), 'drip_campaigns.example.json')
+    assert load_drip_engine(example, None).campaigns
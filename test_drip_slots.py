@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from lead_automation import WHATSAPP_DRIP_FILE
+
+
+def stored_send_times(automation):
+    if automation.store:
+        entries = automation.store.load_drip_entries()
+    else:
+        with open(WHATSAPP_DRIP_FILE, encoding='utf-8') as f:
+            entries = json.load(f)
+    return sorted(datetime.fromisoformat(entry['next_send_at']) for entry in entries)
+
+
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_new_drip_entries_are_spread_under_the_hourly_cap(make_automation, backend):
+    automation = make_automation(STATE_BACKEND=backend, DRIP_HOURLY_CAP=2)
+    due = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+    t1_sent_at = due - timedelta(days=1)
+
+    def entries(first, count):
+        return [{
+            'phone': f'+91987650{first + i:04d}', 'lead_id': str(first + i), 'drip_campaign': '',
+            't1_sent_at': t1_sent_at.isoformat(), 'last_step_sent': 1, 'next_step': 2,
+            'next_send_at': due.isoformat(),
+        } for i in range(count)]
+
+    automation.add_to_drip_queue(entries(0, 3))
+    automation.add_to_drip_queue(entries(3, 2))  # A later run books around the sends already queued
+
+    assert stored_send_times(automation) == [due + timedelta(minutes=30 * i) for i in range(5)]
+
+
+@pytest.mark.parametrize('backend', ['files', 'sqlite'])
+def test_rejected_drip_entries_do_not_book_a_slot(make_automation, backend):
+    automation = make_automation(STATE_BACKEND=backend, DRIP_HOURLY_CAP=1)
+    due = (datetime.now() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def entry(phone, next_step=2):
+        return {
+            'phone': phone, 'lead_id': phone[-4:], 'drip_campaign': '',
+            't1_sent_at': (due - timedelta(days=1)).isoformat(), 'last_step_sent': 1,
+            'next_step': next_step, 'next_send_at': due.isoformat(),
+        }
+
+    automation.add_to_drip_queue([entry('+919876500001')])
+    automation.add_to_drip_queue([
+        entry('+919876500001'),  # Already queued
+        entry('+919876500002', next_step=99),  # Past the campaign's last step
+        entry('+919876500003'),
+    ])
+
+    assert stored_send_times(automation) == [due, due + timedelta(hours=1)]
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from lead_history import LeadHistory
+
+COLUMNS = ['id', 'created_time', 'modified_time', 'fetched_at']
+
+
+def utc(value):
+    return pd.Timestamp(value, tz='UTC')
+
+
+def test_naive_timestamps_are_local_time_in_the_configured_zone(tmp_path):
+    history = LeadHistory(str(tmp_path / 'history'), COLUMNS, timezone='Asia/Kolkata')
+    frame = history.to_frame([{
+        'id': '1',
+        'created_time': '2026-03-01T09:00:00+05:30',
+        'modified_time': '2026-03-01T03:30:00Z',
+        'fetched_at': '2026-03-01T09:00:00',
+    }, {'id': '2', 'created_time': 'not a time', 'fetched_at': None}])
+
+    assert frame.loc[0, 'created_time'] == utc('2026-03-01T03:30:00')
+    assert frame.loc[0, 'modified_time'] == utc('2026-03-01T03:30:00')
+    assert frame.loc[0, 'fetched_at'] == utc('2026-03-01T03:30:00')
+    assert pd.isna(frame.loc[1, 'created_time']) and pd.isna(frame.loc[1, 'fetched_at'])
+
+
+def test_naive_timestamps_default_to_the_machine_zone(tmp_path, monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    import time
+    time.tzset()
+    try:
+        history = LeadHistory(str(tmp_path / 'history'), COLUMNS)
+        frame = history.to_frame([{'id': '1', 'fetched_at': '2026-07-01T08:00:00'}])
+        assert frame.loc[0, 'fetched_at'] == utc('2026-07-01T12:00:00')
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_created_since_reads_localized_rows(tmp_path):
+    history = LeadHistory(str(tmp_path / 'history'), COLUMNS, timezone='Asia/Kolkata')
+    history.append([
+        {'id': '1', 'created_time': '2026-03-01T09:00:00+05:30', 'fetched_at': '2026-03-01T09:05:00'},
+        {'id': '2', 'created_time': '2026-03-01T11:00:00+05:30', 'fetched_at': '2026-03-01T11:05:00'},
+    ])
+    leads = history.read_created_since(utc('2026-03-01T05:00:00'))
+    assert list(leads['id']) == ['2']
+
+
+def test_compacted_statuses_override_the_append_only_history(make_automation):
+    automation = make_automation(LEADS_PARQUET=True)
+    now = datetime.now(timezone.utc)
+    automation.append_processed_leads([
+        {'id': lead_id, 'first_name': name, 'phone': phone, 'created_time': (now - timedelta(hours=1)).isoformat(),
+         'fetched_at': datetime.now().isoformat(), 'message_sent': 'No'}
+        for lead_id, name, phone in [('1', 'A', '911111111111'), ('2', 'B', '912222222222')]
+    ])
+    automation.update_message_status_in_csv([{'id': '1', 'message_sent': 'Yes'}])
+    assert automation.compact_message_status() == 1
+
+    leads = {lead['id']: lead['message_sent'] for lead in automation.get_new_leads_from_last_6_hours()}
+    assert leads == {'1': 'Yes', '2': 'No'}
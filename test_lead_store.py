@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from lead_automation import LEADS_DB_FILE
+from lead_store import LeadStore
+
+
+def drip_entry(phone, **fields):
+    entry = {'phone': phone, 'lead_id': phone[-4:], 'drip_campaign': 'Erickson_WhatsApp_Drip'}
+    entry.update(fields)
+    return entry
+
+
+def test_due_query_skips_rows_without_schedule(tmp_path):
+    store = LeadStore(str(tmp_path / 'leads.db'))
+    past = (datetime.now() - timedelta(minutes=5)).isoformat()
+    store.add_drip_entries([
+        drip_entry('+911', next_step=2, next_send_at=past),
+        drip_entry('+912', next_step=2),
+    ])
+
+    due = store.get_due_drip_entries(datetime.now().isoformat())
+
+    assert [entry['phone'] for entry in due] == ['+911']
+    assert [entry['phone'] for entry in store.get_unscheduled_drip_entries()] == ['+912']
+    store.close()
+
+
+def test_open_store_schedules_or_removes_unscheduled_rows(make_automation):
+    t1_sent_at = datetime(2026, 1, 1, 10, 0)
+    store = LeadStore(LEADS_DB_FILE)
+    store.set_meta('imported_at', t1_sent_at.isoformat())  # Nothing left to import from files
+    store.add_drip_entries([
+        drip_entry('+911', next_step=2, t1_sent_at=t1_sent_at.isoformat()),
+        drip_entry('+912', next_step=2, t1_sent_at='not a time'),
+        drip_entry('+913', next_step=9, t1_sent_at=t1_sent_at.isoformat()),
+    ])
+    store.close()
+
+    automation = make_automation(STATE_BACKEND='sqlite')
+
+    entries = automation.store.load_drip_entries()
+    assert [entry['phone'] for entry in entries] == ['+911']
+    assert entries[0]['next_send_at'] == (t1_sent_at + timedelta(days=1)).isoformat()
+    assert automation.store.get_unscheduled_drip_entries() == []
@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from lead_automation import (
+    LEADS_CSV_FILE, MESSAGE_STATUS_COMPACTING_FILE, MESSAGE_STATUS_LOG_FILE, RUN_LOCK_FILE
+)
+from state_files import file_lock
+
+
+def write_csv(rows):
+    with open(LEADS_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['id', 'first_name', 'message_sent'])
+        writer.writerows(rows)
+
+
+def read_statuses():
+    with open(LEADS_CSV_FILE, newline='', encoding='utf-8') as f:
+        return {row['id']: row['message_sent'] for row in csv.DictReader(f)}
+
+
+def append_events(path, *events):
+    with open(path, 'a', encoding='utf-8') as f:
+        for lead_id, status in events:
+            f.write(json.dumps({'lead_id': lead_id, 'status': status}) + '\n')
+
+
+def test_compaction_keeps_events_appended_while_it_runs(make_automation, monkeypatch):
+    automation = make_automation()
+    write_csv([['1', 'A', 'No'], ['2', 'B', 'No']])
+    append_events(MESSAGE_STATUS_LOG_FILE, ('1', 'Yes'))
+
+    load = automation.load_message_status_overrides
+
+    def load_then_append(*args, **kwargs):
+        overrides = load(*args, **kwargs)
+        append_events(MESSAGE_STATUS_LOG_FILE, ('2', 'Yes'))  # Another process logging mid-compaction
+        return overrides
+
+    monkeypatch.setattr(automation, 'load_message_status_overrides', load_then_append)
+
+    assert automation.compact_message_status() == 1
+    assert read_statuses() == {'1': 'Yes', '2': 'No'}
+    assert not os.path.exists(MESSAGE_STATUS_COMPACTING_FILE)
+    assert load() == {'2': 'Yes'}
+
+
+def test_compaction_is_skipped_while_the_run_lock_is_held(make_automation):
+    automation = make_automation()
+    write_csv([['1', 'A', 'No']])
+    append_events(MESSAGE_STATUS_LOG_FILE, ('1', 'Yes'))
+
+    with file_lock(RUN_LOCK_FILE) as locked:
+        assert locked
+        assert automation.compact_message_status() == 0
+
+    assert read_statuses() == {'1': 'No'}
+    assert automation.load_message_status_overrides() == {'1': 'Yes'}
+
+
+def test_interrupted_compaction_is_finished_before_the_live_log(make_automation):
+    automation = make_automation()
+    write_csv([['1', 'A', 'No'], ['2', 'B', 'No']])
+    append_events(MESSAGE_STATUS_COMPACTING_FILE, ('1', 'Yes'), ('2', 'Yes'))
+    append_events(MESSAGE_STATUS_LOG_FILE, ('2', 'No'))
+
+    # Live log events are newer than the interrupted compaction's
+    assert automation.load_message_status_overrides() == {'1': 'Yes', '2': 'No'}
+
+    automation.compact_message_status()
+
+    assert read_statuses() == {'1': 'Yes', '2': 'Yes'}
+    assert not os.path.exists(MESSAGE_STATUS_COMPACTING_FILE)
+    assert automation.load_message_status_overrides() == {'2': 'No'}
+
+
+def test_recent_leads_parse_only_the_columns_they_return(make_automation):
+    automation = make_automation()
+    now = datetime.now(timezone.utc)
+    with open(LEADS_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['id', 'first_name', 'phone', 'referral_code', 'created_time'])  # Older CSV: no message_sent
+        writer.writerow(['1', 'A', '911111111111', 'R1', (now - timedelta(days=1)).isoformat()])
+        writer.writerow(['2', 'B', '912222222222', 'R2', (now - timedelta(hours=1)).isoformat()])
+    append_events(MESSAGE_STATUS_LOG_FILE, ('2', 'Yes'))
+
+    [lead] = automation.get_new_leads_from_last_6_hours()
+
+    assert lead['id'] == '2'
+    assert lead['message_sent'] == 'Yes'
+    assert 'referral_code' not in lead
@@ -0,0 +1,40 @@
+from metrics import Histogram, Metrics
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == 3.0
+    assert histogram.to_dict()['max'] == 3.0
+
+
+def test_runs_merge_into_process_totals():
+    total = Metrics()
+    for sends in (2, 3):
+        run = Metrics()
+        run.inc('aisensy_sent', sends)
+        run.add_time('send_welcome_messages', 1.5)
+        run.observe('aisensy_request_seconds', 0.2)
+        total.merge(run)
+
+    report = total.to_dict()
+    assert report['counters'] == {'aisensy_sent': 5}
+    assert report['stages']['send_welcome_messages'] == {'seconds': 3.0, 'calls': 2}
+    assert report['histograms']['aisensy_request_seconds']['count'] == 2
+
+
+def test_prometheus_text_exposes_counters_stages_and_histograms():
+    metrics = Metrics()
+    metrics.inc('drip-sent', 4)
+    metrics.add_time('fetch_zoho_leads', 0.25)
+    metrics.observe('zoho_request_seconds', 0.02)
+
+    text = metrics.prometheus_text()
+
+    assert 'lead_automation_drip_sent_total 4' in text
+    assert 'lead_automation_stage_calls_total{stage="fetch_zoho_leads"} 1' in text
+    assert 'lead_automation_zoho_request_seconds_bucket{le="+Inf"} 1' in text
+    assert 'lead_automation_zoho_request_seconds_count 1' in text
@@ -0,0 +1,39 @@
+import math
+
+import pandas as pd
+
+LEADS = [
+    {'id': '1', 'First_Name': 'A', 'Lead_Source': 'Form Submission'},
+    {'id': '2', 'First_Name': 'B', 'Lead_Source': 'Form Submission', 'Phone': '98765 43210'},
+    {'id': '3', 'First_Name': 'C', 'Lead_Source': 'Form Submission', 'Mobile': '+91-91234-56789', 'Phone': '1'},
+]
+
+
+def test_missing_phones_are_none_not_errors(make_automation):
+    automation = make_automation()
+    assert automation.normalize_phone_number(None) is None
+    assert automation.normalize_phone_number('') is None
+    assert automation.normalize_phone_number(math.nan) is None
+    assert automation.normalize_phone_number('98765 43210') == '+919876543210'
+
+
+def test_batch_frame_handles_records_without_phone_fields(make_automation):
+    automation = make_automation()
+    frame = automation.build_processed_leads_frame(LEADS, '2026-01-01T00:00:00', 'No')
+
+    assert list(frame['id']) == ['1', '2', '3']
+    assert frame['phone'].iloc[0] is None
+    assert list(frame['phone'].iloc[1:]) == ['+919876543210', '+919123456789']
+
+
+def test_batch_frame_matches_single_lead_rows(make_automation):
+    automation = make_automation()
+    frame = automation.build_processed_leads_frame(LEADS, '2026-01-01T00:00:00', 'No')
+    for lead, row in zip(LEADS, frame.to_dict('records')):
+        assert row == automation.build_processed_lead(lead, '2026-01-01T00:00:00', 'No')
+
+
+def test_phone_series_keeps_its_index(make_automation):
+    automation = make_automation()
+    phones = pd.Series([math.nan, '9876543210'], index=[5, 7], dtype=object)
+    assert automation.normalize_phone_numbers(phones).to_dict() == {5: None, 7: '+919876543210'}
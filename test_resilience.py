@@ -0,0 +1,104 @@
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, ResilientClient, backoff_delay, parse_retry_after
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class ScriptedSession:
+    """Returns (or raises) the scripted outcomes in order."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome) if isinstance(outcome, int) else outcome
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(resilience.time, 'sleep', lambda seconds: None)
+
+
+def client(session, **kwargs):
+    return ResilientClient(session, CircuitBreaker('test', failure_threshold=3, reset_timeout=60), **kwargs)
+
+
+def test_backoff_is_capped_and_retry_after_is_parsed():
+    assert all(0 <= backoff_delay(10, 0.5, 30) <= 30 for _ in range(100))
+    assert parse_retry_after('12') == 12
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('soon') is None
+
+
+def test_idempotent_requests_retry_5xx_and_connection_errors():
+    session = ScriptedSession(requests.exceptions.ConnectionError(), 502, 200)
+    events = []
+    response = client(session, on_event=events.append).get('https://api.test')
+    assert response.status_code == 200
+    assert session.calls == 3
+    assert events == ['retry', 'retry']
+
+
+def test_sends_are_not_retried_once_the_server_may_have_acted():
+    session = ScriptedSession(requests.exceptions.ReadTimeout())
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client(session).post('https://api.test', idempotent=False)
+    assert session.calls == 1
+
+    session = ScriptedSession(500)
+    assert client(session).post('https://api.test', idempotent=False).status_code == 500
+
+    session = ScriptedSession(requests.exceptions.ConnectTimeout(), 429, 200)
+    assert client(session).post('https://api.test', idempotent=False).status_code == 200
+
+    refused = requests.exceptions.ConnectionError(NewConnectionError(None, 'connection refused'))
+    session = ScriptedSession(refused, 200)
+    assert client(session).post('https://api.test', idempotent=False).status_code == 200
+
+    session = ScriptedSession(requests.exceptions.ConnectionError(ConnectionResetError('reset by peer')))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client(session).post('https://api.test', idempotent=False)
+    assert session.calls == 1
+
+
+def test_long_retry_after_is_left_to_the_caller():
+    throttles = []
+    session = ScriptedSession(FakeResponse(429, {'Retry-After': '600'}))
+    response = client(session, retry_after_max=60, on_throttle=throttles.append).get('https://api.test')
+    assert response.status_code == 429
+    assert throttles == [600]
+
+
+def test_circuit_opens_after_repeated_failures_and_half_opens_after_the_timeout(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'time', lambda: now[0])
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    api = ResilientClient(ScriptedSession(500, 500, 200), breaker, max_retries=0)
+
+    api.get('https://api.test')
+    api.get('https://api.test')
+    with pytest.raises(CircuitOpenError) as raised:
+        api.get('https://api.test')
+    assert raised.value.retry_at == 1060
+
+    now[0] = 1061
+    assert breaker.allow()  # The single half-open trial
+    assert not breaker.allow()
+    breaker.record_success()
+    assert api.get('https://api.test').status_code == 200
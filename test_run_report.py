@@ -0,0 +1,32 @@
+import json
+
+from lead_automation import RUN_REPORT_FILE
+
+
+def read_report():
+    with open(RUN_REPORT_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_drip_wakeups_do_not_replace_the_full_run_report(make_automation):
+    automation = make_automation()
+
+    with automation.track_run('automation'):
+        automation.metrics.inc('template1_sent', 5)
+    with automation.track_run('drip'):
+        automation.metrics.inc('drip_sent', 2)
+    with automation.track_run('drip'):
+        automation.metrics.inc('drip_sent', 3)
+
+    report = read_report()
+    assert report['run'] == 'automation'
+    assert report['counters'] == {'template1_sent': 5}
+    assert report['runs']['drip']['counters'] == {'drip_sent': 3}
+
+    with automation.track_run('automation'):
+        automation.metrics.inc('template1_sent', 1)
+
+    report = read_report()
+    assert report['counters'] == {'template1_sent': 1}
+    assert report['runs']['drip']['counters'] == {'drip_sent': 3}
+    assert automation.metrics_total.to_dict()['counters']['drip_sent'] == 5
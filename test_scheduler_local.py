@@ -0,0 +1,49 @@
+import scheduler_local
+from metrics import Metrics
+
+
+class FlakyAutomation:
+    def __init__(self, failures):
+        self.failures = failures
+        self.polls = 0
+        self.metrics_total = Metrics()
+
+    def run_automation(self):
+        self.polls += 1
+        if self.polls <= self.failures:
+            raise RuntimeError(f"poll {self.polls} failed")
+
+    def start_token_refresher(self):
+        pass
+
+    def run_drip_queue(self):
+        pass
+
+    def next_drip_due_ts(self):
+        return None
+
+
+class RecordingStop:
+    def __init__(self, cycles):
+        self.cycles = cycles
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.cycles
+
+    def wait(self, delay):
+        self.waits.append(delay)
+
+
+def test_failed_cycles_are_counted_and_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler_local, 'ERROR_BACKOFF_SECONDS', 10)
+    monkeypatch.setattr(scheduler_local, 'ERROR_BACKOFF_MAX_SECONDS', 25)
+    automation = FlakyAutomation(failures=3)
+    stop = RecordingStop(cycles=4)
+
+    scheduler_local.run_daemon(automation, poll_interval=600, stop_event=stop)
+
+    assert automation.polls == 4
+    assert stop.waits[:3] == [10, 20, 25]
+    assert stop.waits[3] > 500  # Back to the normal poll interval
+    assert automation.metrics_total.to_dict()['counters']['daemon_cycle_errors'] == 3
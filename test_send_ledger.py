@@ -0,0 +1,126 @@
+from datetime import datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from send_ledger import (
+    ALREADY_SENT, BACKING_OFF, CLAIMED, FAILED, IN_FLIGHT, SENT, UNCONFIRMED, UNKNOWN, SendLedger
+)
+
+KEY = ('lead-1', 1, 'T1')
+
+
+def test_sent_step_is_never_claimed_again(tmp_path):
+    ledger = SendLedger(str(tmp_path / 'ledger.db'))
+    assert ledger.claim(*KEY, phone='911234567890') == CLAIMED
+    assert ledger.claim(*KEY) == IN_FLIGHT
+    ledger.record(*KEY, SENT)
+    assert ledger.claim(*KEY) == ALREADY_SENT
+    assert ledger.get_status(*KEY) == SENT
+    assert ledger.get_attempts(*KEY) == 1
+    ledger.close()
+
+
+def test_failed_send_backs_off_until_its_retry_time(tmp_path):
+    ledger = SendLedger(str(tmp_path / 'ledger.db'))
+    ledger.claim(*KEY)
+    ledger.record(*KEY, FAILED, next_retry_at='9999-01-01T00:00:00')
+    assert ledger.claim(*KEY) == BACKING_OFF
+    ledger.record(*KEY, FAILED, next_retry_at='2000-01-01T00:00:00')
+    assert ledger.claim(*KEY) == CLAIMED
+    ledger.close()
+
+
+def test_deferred_claims_do_not_count_as_attempts(tmp_path):
+    ledger = SendLedger(str(tmp_path / 'ledger.db'))
+    for _ in range(3):
+        assert ledger.claim(*KEY) == CLAIMED
+        ledger.record(*KEY, FAILED, next_retry_at='2000-01-01T00:00:00', attempted=False)
+    assert ledger.get_attempts(*KEY) == 0
+
+    ledger.claim(*KEY)
+    ledger.record(*KEY, FAILED, next_retry_at='2000-01-01T00:00:00')
+    assert ledger.get_attempts(*KEY) == 1
+    ledger.close()
+
+
+def test_send_deferred_by_an_open_circuit_is_not_an_attempt(make_automation, monkeypatch):
+    automation = make_automation()
+    circuit_open = {'status_code': 0, 'error': 'AiSensy circuit open', 'deferred': True, 'retry_at': 0}
+    monkeypatch.setattr(automation, 'post_aisensy_payload', lambda payload: dict(circuit_open))
+
+    payload = {'destination': '911234567890'}
+    [response] = automation.send_aisensy_messages([payload], ledger_keys=[KEY])
+
+    assert response['deferred']
+    assert automation.send_ledger.get_status(*KEY) == FAILED
+    assert automation.send_ledger.get_attempts(*KEY) == 0
+
+    monkeypatch.setattr(automation, 'post_aisensy_payload', lambda payload: {'status': 'success'})
+    automation.send_aisensy_messages([payload], ledger_keys=[KEY])
+    assert automation.send_ledger.get_status(*KEY) == SENT
+    assert automation.send_ledger.get_attempts(*KEY) == 1
+
+
+def test_send_with_an_unknown_outcome_is_never_resent(make_automation, monkeypatch):
+    automation = make_automation()
+    posts = []
+
+    def post(url, **kwargs):
+        posts.append(kwargs['json'])
+        raise requests.exceptions.ReadTimeout('read timed out')
+
+    monkeypatch.setattr(automation.aisensy_client, 'post', post)
+    payload = {'destination': '911234567890'}
+    [response] = automation.send_aisensy_messages([payload], ledger_keys=[KEY])
+
+    assert response['unknown']
+    assert automation.send_ledger.get_status(*KEY) == UNKNOWN
+    assert automation.send_ledger.claim(*KEY) == UNCONFIRMED
+
+    [response] = automation.send_aisensy_messages([payload], ledger_keys=[KEY])
+    assert response['unknown']
+    assert len(posts) == 1
+
+
+def test_send_that_never_connected_is_retried_with_backoff(make_automation, monkeypatch):
+    automation = make_automation(SEND_RETRY_BASE_MINUTES=1, SEND_RETRY_MAX_MINUTES=1000)
+
+    def post(url, **kwargs):
+        raise requests.exceptions.ConnectionError(NewConnectionError(None, 'connection refused'))
+
+    monkeypatch.setattr(automation.aisensy_client, 'post', post)
+    monkeypatch.setattr('lead_automation.backoff_delay', lambda attempt, base, cap: base * 2 ** attempt)
+
+    [response] = automation.send_aisensy_messages([{'destination': '911234567890'}], ledger_keys=[KEY])
+
+    assert not response.get('unknown')
+    assert automation.send_ledger.get_status(*KEY) == FAILED
+    assert automation.send_ledger.get_attempts(*KEY) == 1
+    # The first failure backs off by base * 2**1, not base * 2**0
+    assert 110 < response['retry_at'] - datetime.now().timestamp() <= 120
+
+
+def test_template1_is_given_up_after_max_attempts_and_releases_the_watermark(make_automation, monkeypatch):
+    automation = make_automation(TARGET_LEAD_SOURCES=['Website'], TEMPLATE1_MAX_ATTEMPTS=3,
+                                 SEND_RETRY_BASE_MINUTES=0)
+    monkeypatch.setattr(automation, 'post_aisensy_payload', lambda payload: {'status_code': 500})
+    lead = {'id': '7', 'First_Name': 'Asha', 'Mobile': '9876543210', 'Lead_Source': 'Website',
+            'Modified_Time': '2026-01-01T10:00:00+05:30'}
+    fetched = '2026-01-01T12:00:00+05:30'
+
+    for _ in range(2):
+        automation.fetch_watermark = fetched
+        failed_leads = automation.send_welcome_messages_to_new_leads([dict(lead)])
+        assert automation.get_next_watermark(failed_leads) < lead['Modified_Time']
+
+    # The third failure gives up; a fourth run finds the lead saved and leaves it alone
+    for _ in range(2):
+        automation.fetch_watermark = fetched
+        failed_leads = automation.send_welcome_messages_to_new_leads([dict(lead)])
+        assert failed_leads == []
+        assert automation.get_next_watermark(failed_leads) == fetched
+
+    with open('erickson_leads.csv', encoding='utf-8') as f:
+        assert f.read().splitlines()[-1].endswith(',Failed')
+    assert automation.send_ledger.get_attempts('7', 1, automation.drip_engine.default.name) == 3
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from state_files import StateFileError, atomic_open, atomic_write_json, file_lock, read_json
+
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    path = tmp_path / 'state.json'
+    atomic_write_json(str(path), {'version': 1})
+
+    with pytest.raises(RuntimeError):
+        with atomic_open(str(path)) as f:
+            f.write('{"version": 2, "trunc')
+            raise RuntimeError("crash mid-write")
+
+    assert json.loads(path.read_text()) == {'version': 1}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['state.json']
+
+
+def test_interleaved_writers_use_separate_temp_files(tmp_path):
+    path = str(tmp_path / 'state.json')
+    with atomic_open(path) as first:
+        first.write('{"writer": 1}')
+        with atomic_open(path) as second:
+            second.write('{"writer": 2}')
+
+    assert json.loads((tmp_path / 'state.json').read_text()) == {'writer': 1}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['state.json']
+
+
+def test_corrupt_file_falls_back_to_its_backup(tmp_path):
+    path = str(tmp_path / 'state.json')
+    atomic_write_json(path, {'version': 1})
+    atomic_write_json(path, {'version': 2}, backup=True)
+    assert read_json(path) == {'version': 2}
+
+    with open(path, 'w') as f:
+        f.write('{"version": ')
+    assert read_json(path) == {'version': 1}
+
+
+def test_corrupt_file_without_backup_is_an_error_not_empty(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('[{"phone": ')
+    assert read_json(str(tmp_path / 'missing.json'), default=[]) == []
+    with pytest.raises(StateFileError):
+        read_json(str(path), default=[])
+
+
+def test_second_non_blocking_lock_is_refused(tmp_path):
+    path = str(tmp_path / 'run.lock')
+    with file_lock(path) as held:
+        assert held
+        with file_lock(path, blocking=False) as second:
+            assert not second
+    with file_lock(path, blocking=False) as again:
+        assert again
@@ -0,0 +1,80 @@
+import json
+import os
+
+import lead_automation
+import tenant_runner
+from tenant_runner import load_tenants, missing_tenant_env, run_tenants, tenant_environ
+
+COMPLETE_ENV = {
+    'ZOHO_CLIENT_ID': 'id', 'ZOHO_CLIENT_SECRET': 'secret', 'ZOHO_REFRESH_TOKEN': 'refresh',
+    'ZOHO_API_DOMAIN': 'https://www.zohoapis.in', 'AISENSY_API_KEY': 'key',
+    'TARGET_LEAD_SOURCES': 'Website', 'WHATSAPP_DRIP_CAMPAIGN': 'Brand_Drip',
+    **{f'AISENSY_CAMPAIGN_T{step}': f'Brand_T{step}' for step in range(1, 6)},
+    **{f'AISENSY_MEDIA_T{step}': f'https://example.com/t{step}.png' for step in range(1, 6)},
+}
+
+
+def write_config(tmp_path, tenants):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps(tenants))
+    return load_tenants(str(path))
+
+
+def test_worker_environment_is_only_the_tenant_env(tmp_path):
+    [tenant] = write_config(tmp_path, [{'name': 'brand', 'env': {'AISENSY_CAMPAIGN_T1': 'Brand_T1'}}])
+    parent = {'PATH': '/usr/bin', 'AISENSY_CAMPAIGN_T3': 'Erickson_T3', 'ZOHO_CLIENT_SECRET': 'other-brand'}
+
+    environ = tenant_environ(tenant, parent)
+
+    assert environ == {'PATH': '/usr/bin', 'AISENSY_CAMPAIGN_T1': 'Brand_T1', 'LOAD_DOTENV': 'false'}
+
+
+def test_missing_settings_are_reported_per_tenant(tmp_path):
+    partial = dict(COMPLETE_ENV, AISENSY_API_KEY='')
+    del partial['AISENSY_MEDIA_T4']
+    complete, incomplete = write_config(tmp_path, [
+        {'name': 'complete', 'env': COMPLETE_ENV},
+        {'name': 'incomplete', 'env': partial},
+    ])
+
+    assert missing_tenant_env(complete) == []
+    assert missing_tenant_env(incomplete) == ['AISENSY_API_KEY', 'AISENSY_MEDIA_T4']
+
+
+def test_own_drip_campaigns_file_replaces_the_template_settings(tmp_path):
+    env = {key: value for key, value in COMPLETE_ENV.items() if key in tenant_runner.TENANT_REQUIRED_ENV}
+    [tenant] = write_config(tmp_path, [{'name': 'brand', 'env': env}])
+    assert 'AISENSY_CAMPAIGN_T3' in missing_tenant_env(tenant)
+
+    os.makedirs(tenant['state_dir'])
+    open(os.path.join(tenant['state_dir'], 'drip_campaigns.json'), 'w').close()
+    assert missing_tenant_env(tenant) == []
+
+
+def test_incomplete_tenants_fail_without_starting(tmp_path):
+    tenants = write_config(tmp_path, [{'name': 'empty', 'env': {}}])
+    [result] = run_tenants(tenants)
+    assert not result['ok']
+    assert 'ZOHO_CLIENT_ID' in result['error']
+    assert not os.path.exists(tenants[0]['state_dir'])
+
+
+def test_example_tenants_set_every_template(tmp_path):
+    example = os.path.join(os.path.dirname(tenant_runner.__file__), 'tenants.example.json')
+    for tenant in load_tenants(example):
+        missing = [key for key in missing_tenant_env(tenant) if key not in tenant_runner.TENANT_REQUIRED_ENV]
+        assert missing == [], tenant['name']
+
+
+def test_dotenv_loading_can_be_switched_off(tmp_path, monkeypatch):
+    (tmp_path / '.env').write_text('TENANT_TEST_SETTING=from-dotenv\n')
+    monkeypatch.setattr(lead_automation, '__file__', str(tmp_path / 'lead_automation.py'))
+    monkeypatch.delenv('TENANT_TEST_SETTING', raising=False)
+
+    monkeypatch.setenv('LOAD_DOTENV', 'false')
+    lead_automation.load_env_file()
+    assert 'TENANT_TEST_SETTING' not in os.environ
+
+    monkeypatch.setenv('LOAD_DOTENV', 'true')
+    lead_automation.load_env_file()
+    assert os.environ['TENANT_TEST_SETTING'] == 'from-dotenv'
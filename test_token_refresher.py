@@ -0,0 +1,43 @@
+import threading
+
+import lead_automation
+
+
+class ImmediateTimer(threading.Timer):
+    def __init__(self, interval, function):
+        super().__init__(0, function)
+
+
+def test_close_waits_for_a_refresh_and_stops_the_refresher(make_automation, monkeypatch):
+    automation = make_automation()
+    monkeypatch.setattr(lead_automation.threading, 'Timer', ImmediateTimer)
+    refreshing = threading.Event()
+    release = threading.Event()
+    refreshes = []
+
+    def get_valid_token_data(force_refresh=False):
+        refreshes.append(force_refresh)
+        refreshing.set()
+        release.wait(5)
+
+    monkeypatch.setattr(automation, 'get_valid_token_data', get_valid_token_data)
+    automation.start_token_refresher()
+    assert refreshing.wait(5)
+
+    closer = threading.Thread(target=automation.close)
+    closer.start()
+    closer.join(0.2)
+    assert closer.is_alive()  # Joining the refresh in progress
+
+    release.set()
+    closer.join(5)
+    assert not closer.is_alive()
+    assert refreshes == [True]
+    assert automation.token_refresh_timer is None
+
+
+def test_refresher_is_not_started_after_close(make_automation):
+    automation = make_automation()
+    automation.close()
+    automation.start_token_refresher()
+    assert automation.token_refresh_timer is None
@@ -0,0 +1,87 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+import webhook_receiver
+from webhook_receiver import WebhookHandler, WebhookWorker
+
+
+class RecordingWorker:
+    def __init__(self):
+        self.payloads = []
+
+    def submit(self, payload):
+        self.payloads.append(payload)
+
+
+@pytest.fixture
+def receiver():
+    worker = RecordingWorker()
+    handler = type('Handler', (WebhookHandler,), {'worker': worker, 'token': 's3cret'})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}{WebhookHandler.path_prefix}", worker
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('params, body', [
+    (None, {'ids': ['1']}),
+    ({'token': 'wrong'}, {'ids': ['1']}),
+    (None, {'ids': ['1'], 'token': 's3cre'}),
+    (None, {'ids': ['1'], 'token': ['s3cret']}),
+])
+def test_payloads_without_the_token_are_rejected(receiver, params, body):
+    url, worker = receiver
+    response = requests.post(url, json=body, params=params, timeout=5)
+    assert response.status_code == 401
+    assert worker.payloads == []
+
+
+def test_payloads_with_the_token_are_accepted(receiver):
+    url, worker = receiver
+    assert requests.post(url, json={'ids': ['1'], 'token': 's3cret'}, timeout=5).status_code == 202
+    assert requests.post(url, json={'id': '2'}, params={'token': 's3cret'}, timeout=5).status_code == 202
+    assert len(worker.payloads) == 2
+
+
+def test_only_lead_ids_are_taken_from_payloads(make_automation):
+    automation = make_automation()
+    extract = automation.extract_webhook_lead_ids
+    assert extract({'module': 'Leads', 'operation': 'insert', 'ids': ['11', '12']}) == ['11', '12']
+    assert extract({'ids': '11,12'}) == ['11', '12']
+    assert extract({'id': '13', 'Phone': '9999999999', 'Lead_Source': 'Form Submission'}) == ['13']
+    assert extract({'data': [{'id': '14', 'Phone': '1'}, {'Phone': '2'}, 'x']}) == ['14']
+    assert extract([{'id': '15'}, {'ids': ['16']}]) == ['15', '16']
+    assert extract({'module': 'Contacts', 'ids': ['17']}) == []
+    assert extract({'operation': 'delete', 'ids': ['18']}) == []
+    assert extract({'ids': ['19', 'not-an-id', None, {'id': '20'}]}) == ['19']
+
+
+def test_batch_sends_the_leads_fetched_from_zoho_not_the_payload(make_automation, monkeypatch):
+    automation = make_automation()
+    zoho_lead = {'id': '21', 'Phone': '9876543210', 'Lead_Source': 'Form Submission'}
+    fetched, processed = [], []
+    monkeypatch.setattr(automation, 'get_valid_token_data',
+                        lambda: {'access_token': 'token', 'api_domain': 'https://zoho.test'})
+    monkeypatch.setattr(automation, 'fetch_zoho_leads_by_ids',
+                        lambda token, domain, ids: fetched.append(ids) or [zoho_lead])
+    monkeypatch.setattr(automation, 'process_incoming_leads', processed.append)
+
+    forged = {'id': '21', 'Phone': '9111111111', 'Lead_Source': 'Form Submission'}
+    WebhookWorker(automation).process_batch([forged, {'ids': ['22']}])
+
+    assert fetched == [['21', '22']]
+    assert processed == [[zoho_lead]]
+
+
+def test_receiver_will_not_listen_publicly_without_a_token(monkeypatch):
+    monkeypatch.setattr(WebhookHandler, 'token', None)
+    with pytest.raises(SystemExit):
+        webhook_receiver.serve(host='0.0.0.0', port=0)
+    assert webhook_receiver.is_loopback('127.0.0.1')
+    assert webhook_receiver.is_loopback('localhost')
+    assert not webhook_receiver.is_loopback('0.0.0.0')
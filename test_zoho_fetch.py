@@ -0,0 +1,120 @@
+import re
+
+import pytest
+import requests
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+class FakeZoho:
+    """Serves COQL per source and the Leads module list; records the tokens used."""
+
+    def __init__(self, leads, valid_token='token', failing_sources=(), list_fails=False):
+        self.leads = leads
+        self.valid_token = valid_token
+        self.failing_sources = set(failing_sources)
+        self.list_fails = list_fails
+        self.coql_calls = []
+        self.list_calls = 0
+
+    def authorized(self, headers):
+        return headers['Authorization'] == f'Zoho-oauthtoken {self.valid_token}'
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        source = re.search(r"Lead_Source = '([^']*)'", json['select_query']).group(1)
+        self.coql_calls.append((source, headers['Authorization']))
+        if not self.authorized(headers):
+            return FakeResponse(401, {'code': 'INVALID_TOKEN'})
+        if source in self.failing_sources:
+            return FakeResponse(401, {'code': 'OAUTH_SCOPE_MISMATCH'})
+        return FakeResponse(200, {'data': [lead for lead in self.leads if lead['Lead_Source'] == source],
+                                  'info': {'more_records': False}})
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        self.list_calls += 1
+        if self.list_fails:
+            return FakeResponse(500)
+        return FakeResponse(200, {'data': self.leads, 'info': {'more_records': False}})
+
+
+LEADS = [
+    {'id': '1', 'Lead_Source': 'A', 'Modified_Time': '2026-01-01T10:00:00+05:30'},
+    {'id': '2', 'Lead_Source': 'B', 'Modified_Time': '2026-01-01T11:00:00+05:30'},
+    {'id': '3', 'Lead_Source': 'Other', 'Modified_Time': '2026-01-01T12:00:00+05:30'},
+]
+
+
+@pytest.fixture
+def automation(make_automation):
+    return make_automation(TARGET_LEAD_SOURCES=['A', 'B'], ZOHO_FETCH_MODE='coql', ZOHO_FETCH_WORKERS=2)
+
+
+def test_coql_refreshes_a_rejected_token_once_and_retries(automation, monkeypatch):
+    zoho = FakeZoho(LEADS, valid_token='fresh')
+    refreshes = []
+
+    def get_valid_token_data(force_refresh=False):
+        refreshes.append(force_refresh)
+        return {'access_token': 'fresh' if force_refresh or len(refreshes) > 2 else 'stale'}
+
+    monkeypatch.setattr(automation, 'zoho_client', zoho)
+    monkeypatch.setattr(automation, 'get_valid_token_data', get_valid_token_data)
+
+    leads = automation.fetch_zoho_leads('stale', 'https://zoho.test')
+
+    assert [lead['id'] for lead in leads] == ['1', '2']
+    assert zoho.list_calls == 0
+    assert refreshes.count(True) == 1  # The second 401 reuses the first refresh
+    assert sorted(auth for _, auth in zoho.coql_calls) == [
+        'Zoho-oauthtoken fresh', 'Zoho-oauthtoken fresh', 'Zoho-oauthtoken stale', 'Zoho-oauthtoken stale'
+    ]
+
+
+def test_only_the_failed_source_falls_back_to_the_list_fetch(automation, monkeypatch):
+    zoho = FakeZoho(LEADS, failing_sources={'B'})
+    monkeypatch.setattr(automation, 'zoho_client', zoho)
+    refreshes = []
+    monkeypatch.setattr(automation, 'refresh_rejected_token', refreshes.append)
+
+    leads = automation.fetch_zoho_leads('token', 'https://zoho.test')
+
+    assert [lead['id'] for lead in leads] == ['1', '2']
+    assert zoho.list_calls == 1
+    assert refreshes == []  # A scope mismatch is not fixed by a new token
+    # Lead 3 is in the module pages but filtered out, so it does not move the watermark
+    assert automation.fetch_watermark == '2026-01-01T11:00:00+05:30'
+
+    # The scope is remembered: later runs in this process skip COQL
+    coql_calls = len(zoho.coql_calls)
+    assert [lead['id'] for lead in automation.fetch_zoho_leads('token', 'https://zoho.test')] == ['1', '2']
+    assert len(zoho.coql_calls) == coql_calls
+    assert zoho.list_calls == 2
+
+
+def test_failed_fallback_keeps_the_other_sources_but_not_the_watermark(automation, monkeypatch):
+    zoho = FakeZoho(LEADS, failing_sources={'B'}, list_fails=True)
+    monkeypatch.setattr(automation, 'zoho_client', zoho)
+
+    leads = automation.fetch_zoho_leads('token', 'https://zoho.test', modified_since='2025-12-31T00:00:00+05:30')
+
+    assert [lead['id'] for lead in leads] == ['1']
+    assert automation.fetch_watermark is None
+
+
+def test_coql_queries_escape_the_lead_source(automation):
+    query = automation.build_coql_query("O'Brien", '2026-01-01T00:00:00+05:30', offset=200)
+    assert "Lead_Source = 'O\\'Brien'" in query
+    assert "Modified_Time > '2026-01-01T00:00:00+05:30'" in query
+    assert query.endswith('offset 200')
@@ -0,0 +1,238 @@
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from lead_automation import LeadAutomation
+
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')  # Any other interface requires WEBHOOK_TOKEN
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/zoho/leads')
+WEBHOOK_TOKEN = os.getenv('WEBHOOK_TOKEN')  # Shared secret: Zoho notification "token" or ?token=
+WEBHOOK_RECONCILE_MINUTES = float(os.getenv('WEBHOOK_RECONCILE_MINUTES', '60'))  # Polling sweep interval
+WEBHOOK_BATCH_WAIT = float(os.getenv('WEBHOOK_BATCH_WAIT', '2'))  # Seconds to collect a burst into one batch
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+
+class WebhookWorker:
+    """Processes queued webhook payloads and the periodic polling sweep on one thread.
+
+    Everything that touches the state files runs here, so webhook batches and
+    the reconciliation sweep never overlap.
+    """
+
+    def __init__(self, automation, reconcile_minutes=WEBHOOK_RECONCILE_MINUTES, batch_wait=WEBHOOK_BATCH_WAIT):
+        self.automation = automation
+        self.reconcile_interval = reconcile_minutes * 60
+        self.batch_wait = batch_wait
+        self.payloads = queue.Queue()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='webhook-worker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.payloads.put(None)
+        self.thread.join()
+
+    def submit(self, payload):
+        self.payloads.put(payload)
+
+    def next_batch(self, timeout):
+        """Waits up to timeout for a payload, then drains anything that follows it."""
+        try:
+            first = self.payloads.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.payloads.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [payload for payload in batch if payload is not None]
+
+    def process_batch(self, payloads):
+        """Fetches the leads named in a batch of payloads from Zoho and pushes them through Template 1.
+
+        Payloads only say which leads changed; the lead fields (phone, Lead
+        Source, ...) always come from Zoho, so a forged payload cannot make
+        the receiver message an arbitrary number.
+        """
+        lead_ids = []
+        for payload in payloads:
+            lead_ids.extend(self.automation.extract_webhook_lead_ids(payload))
+        if not lead_ids:
+            return
+
+        token_data = self.automation.get_valid_token_data()
+        if not token_data:
+            return
+        leads = self.automation.fetch_zoho_leads_by_ids(
+            token_data.get('access_token'), token_data.get('api_domain'), lead_ids
+        )
+        if leads:
+            self.automation.process_incoming_leads(leads)
+
+    def run(self):
+        # Sweep once on startup so anything missed while the receiver was down is caught up
+        next_sweep = time.monotonic()
+        while not self.stopping.is_set():
+            if time.monotonic() >= next_sweep:
+                print("🔁 Reconciliation sweep (polling Zoho)...")
+                try:
+                    self.automation.run_automation()
+                except Exception as e:
+                    print(f"❌ Reconciliation sweep failed: {e}")
+                next_sweep = time.monotonic() + self.reconcile_interval
+
+            payloads = self.next_batch(next_sweep - time.monotonic())
+            if not payloads:
+                continue
+            try:
+                self.process_batch(payloads)
+            except Exception as e:
+                print(f"❌ Webhook batch failed: {e}")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accepts Zoho Leads webhooks/notifications and hands them to the worker."""
+
+    worker = None
+    path_prefix = WEBHOOK_PATH
+    token = WEBHOOK_TOKEN
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_payload(self):
+        """Parses a JSON or form-encoded body. Returns None if it cannot be parsed."""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > WEBHOOK_MAX_BODY:
+            return None
+        raw = self.rfile.read(length).decode('utf-8', errors='replace')
+        if 'application/x-www-form-urlencoded' in (self.headers.get('Content-Type') or ''):
+            return {key: values[-1] for key, values in parse_qs(raw).items()}
+        try:
+            return json.loads(raw or 'null')
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        # Health check
+        if urlparse(self.path).path == self.path_prefix:
+            return self.send_json(200, {'status': 'ok'})
+        self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != self.path_prefix:
+            return self.send_json(404, {'error': 'not found'})
+
+        payload = self.read_payload()
+        if payload is None:
+            return self.send_json(400, {'error': 'invalid payload'})
+
+        if self.token:
+            supplied = parse_qs(url.query).get('token', [None])[-1]
+            if supplied is None and isinstance(payload, dict):
+                supplied = payload.get('token')
+            if not isinstance(supplied, str) or \
+                    not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+                return self.send_json(401, {'error': 'invalid token'})
+
+        # Acknowledge straight away; Zoho retries slow or failed callbacks
+        self.worker.submit(payload)
+        self.send_json(202, {'status': 'accepted'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def is_loopback(host):
+    """True for a host that only accepts local connections."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Runs the webhook receiver until interrupted.
+
+    Refuses to listen beyond localhost without a WEBHOOK_TOKEN.
+    """
+    if not WebhookHandler.token and not is_loopback(host):
+        raise SystemExit(f"❌ WEBHOOK_TOKEN must be set to listen on {host}")
+    automation = LeadAutomation()
+    worker = WebhookWorker(automation)
+    WebhookHandler.worker = worker
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+
+    worker.start()
+    print(f"📡 Listening for Zoho lead webhooks on http://{host}:{port}{WEBHOOK_PATH}")
+    print(f"🔁 Polling sweep every {WEBHOOK_RECONCILE_MINUTES:g} minutes")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping webhook receiver...")
+    finally:
+        server.server_close()
+        worker.stop()
+        automation.close()
+
+
+def send_fake_notification(url, lead_ids=None, lead=None):
+    """Posts a Zoho-style payload to a running receiver (for local testing)."""
+    if lead is not None:
+        payload = lead
+    else:
+        payload = {
+            'module': 'Leads',
+            'operation': 'insert',
+            'ids': list(lead_ids or []),
+            'channel_id': 'local-test',
+            'token': WEBHOOK_TOKEN,
+        }
+    params = {'token': WEBHOOK_TOKEN} if WEBHOOK_TOKEN and lead is not None else None
+    response = requests.post(url, json=payload, params=params, timeout=10)
+    print(f"📨 {response.status_code} {response.text}")
+    return response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zoho lead webhook receiver")
+    parser.add_argument('--send-ids', help="post a fake Zoho notification for these comma-separated lead IDs and exit")
+    parser.add_argument('--send-lead', help="post a JSON file of lead fields (only its id is used) as a workflow webhook and exit")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}",
+                        help="receiver URL used by --send-ids/--send-lead")
+    args = parser.parse_args()
+
+    if args.send_ids:
+        send_fake_notification(args.url, lead_ids=args.send_ids.split(','))
+    elif args.send_lead:
+        with open(args.send_lead, 'r', encoding='utf-8') as f:
+            send_fake_notification(args.url, lead=json.load(f))
+    else:
+        serve()